@@ -0,0 +1,73 @@
+"""Compares the line throughput of the bulk parser (`parse_columns`) with the per-line parser (`parse_tsv_line`).
+
+Usage:
+    python benchmarks/bench_bulk_parser.py [--path PATH] [--hipe-format-version v2] [--repeat 5] [--min-speedup 3]
+
+Files are read beforehand, so that only parsing is timed. Exits with status 1 if the speedup is below `--min-speedup`.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from hipe_commons.helpers.tsv import iter_tsv_chunks, parse_tsv_line, parse_columns, COL_LABELS, COL_LABELS_V2
+
+DEFAULT_PATH = "tests/data/v2-HIPE-newsbench-v0.9.0-hipe2020-test-fr.tsv"
+
+
+def parse_per_line(chunks, hipe_format_version):
+    headers = COL_LABELS if hipe_format_version == "v1" else COL_LABELS_V2
+    for lines in chunks:
+        [
+            parse_tsv_line(line, line_number, hipe_format_version=hipe_format_version)
+            for line_number, line in enumerate(lines)
+            if line != "" and line.split('\t') != headers
+        ]
+
+
+def parse_bulk(chunks, hipe_format_version):
+    for lines in chunks:
+        parse_columns(lines, hipe_format_version=hipe_format_version)
+
+
+def best_time(function, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--hipe-format-version", default="v2")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=3.0)
+    args = parser.parse_args()
+
+    with open(args.path) as f:
+        chunks = list(iter_tsv_chunks(f))
+    n_lines = sum(len(lines) for lines in chunks)
+
+    per_line = best_time(parse_per_line, args.repeat, chunks, args.hipe_format_version)
+    bulk = best_time(parse_bulk, args.repeat, chunks, args.hipe_format_version)
+    result = {
+        "benchmark": "bulk_parser",
+        "path": args.path,
+        "lines": n_lines,
+        "per_line_lines_per_s": round(n_lines / per_line),
+        "bulk_lines_per_s": round(n_lines / bulk),
+        "speedup": round(per_line / bulk, 2),
+    }
+    print(json.dumps(result))
+
+    if result["speedup"] < args.min_speedup:
+        print(f"Speedup below {args.min_speedup}x", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Runs the benchmark suite and reports throughput and peak memory as JSON.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 1MB,10MB] [--benchmarks parse_tsv,tsv_to_dict] [--output FILE]
+                                        [--compare BASELINE_FILE] [--max-regression 0.2]
+
+Benchmarks run on the tsv files bundled in `tests/data` and on synthetic v1 and v2 files of the given sizes
+(see `synthetic.py`), which are generated once in `--data-dir` and then reused. Each benchmark runs in a fresh process,
+so that measurements are independent:
+    - `tokens_per_s`: the number of annotation lines of the file divided by the best time over `--repeat` runs.
+    - `peak_rss_mb`: the peak resident memory of the process during the runs, above its resident memory before them
+      (i.e. after the imports and the untimed preparation of the benchmark). Outside of Linux, it is the peak resident
+      memory of the whole process.
+    - `peak_traced_mb`: the peak memory allocated by python during one run, measured in a separate run with
+      `tracemalloc` (disable with `--no-tracemalloc` on very large files, as it slows runs down).
+
+With `--compare`, results are compared to a previous output of this script, e.g. the one of the last release (the
+suite only uses the public API of the library, and runs against older releases as well). The
+script exits with status 1 if a throughput or a peak memory is worse than the baseline by more than `--max-regression`.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate_tsv, parse_size  # noqa: E402
+
+# only functions of the public API of the benchmarked release, so that the suite runs against older releases too
+from hipe_commons.helpers.tsv import (COL_LABELS, parse_tsv, tsv_to_dict, tsv_to_dataframe,  # noqa: E402
+                                      tsv_to_segmented_lists, write_tsv)
+from hipe_commons.stats import count_entities, compute_entities_stats, describe_dataset  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_FILES = [
+    (os.path.join(ROOT, "tests", "data", "v1-HIPE-2022-v2.0-ajmc-dev-de.tsv"), "v1"),
+    (os.path.join(ROOT, "tests", "data", "v2-HIPE-newsbench-v0.9.0-hipe2020-test-fr.tsv"), "v2"),
+]
+
+
+# ======================================================================================================================
+#                                                       BENCHMARKS
+# ======================================================================================================================
+# Each benchmark takes the path and the HIPE format version of a file and returns the function to time, after having
+# done any untimed preparation.
+def bench_parse_tsv(path: str, hipe_format_version: str) -> Callable:
+    return lambda: parse_tsv(hipe_format_version=hipe_format_version, file_path=path)
+
+
+def bench_tsv_to_dict(path: str, hipe_format_version: str) -> Callable:
+    return lambda: tsv_to_dict(path=path, keep_comments=True, hipe_format_version=hipe_format_version)
+
+
+def bench_tsv_to_dataframe(path: str, hipe_format_version: str) -> Callable:
+    return lambda: tsv_to_dataframe(path=path, hipe_format_version=hipe_format_version)
+
+
+def bench_tsv_to_segmented_lists(path: str, hipe_format_version: str) -> Callable:
+    return lambda: tsv_to_segmented_lists(["NE-COARSE-LIT", "NEL-LIT"], path=path,
+                                          hipe_format_version=hipe_format_version)
+
+
+def bench_write_tsv(path: str, hipe_format_version: str) -> Callable:
+    documents = [doc._tsv_lines for doc in parse_tsv(hipe_format_version=hipe_format_version, file_path=path)]
+    output_path = os.path.join(tempfile.mkdtemp(), "output.tsv")
+    return lambda: write_tsv(documents, output_path, hipe_format_version=hipe_format_version)
+
+
+def bench_count_entities(path: str, hipe_format_version: str) -> Callable:
+    # entities are decoded lazily, their decoding is part of the benchmark
+    return lambda: count_entities(parse_tsv(hipe_format_version=hipe_format_version, file_path=path))
+
+
+def bench_compute_entities_stats(path: str, hipe_format_version: str) -> Callable:
+    return lambda: compute_entities_stats(parse_tsv(hipe_format_version=hipe_format_version, file_path=path))
+
+
+def bench_describe_dataset(path: str, hipe_format_version: str) -> Callable:
+    return lambda: describe_dataset(documents=parse_tsv(hipe_format_version=hipe_format_version, file_path=path))
+
+
+BENCHMARKS: Dict[str, Callable[[str, str], Callable]] = {
+    "parse_tsv": bench_parse_tsv,
+    "tsv_to_dict": bench_tsv_to_dict,
+    "tsv_to_dataframe": bench_tsv_to_dataframe,
+    "tsv_to_segmented_lists": bench_tsv_to_segmented_lists,
+    "write_tsv": bench_write_tsv,
+    "count_entities": bench_count_entities,
+    "compute_entities_stats": bench_compute_entities_stats,
+    "describe_dataset": bench_describe_dataset,
+}
+
+
+# ======================================================================================================================
+#                                                       RUNNER
+# ======================================================================================================================
+def count_tokens(path: str) -> int:
+    """Counts the annotation lines of a file with a plain scan, independently of the installed library: non-empty
+    lines, but commented lines and the v1 header."""
+    header = "\t".join(COL_LABELS)
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for line in f
+                   if line.strip("\r\n") and not (line[0] == "#" and "=" in line) and line.rstrip("\r\n") != header)
+
+
+def rss_mb() -> Tuple[Optional[float], float]:
+    """Returns the current and the peak resident memory of the process, in MB, the current one being `None` where
+    it is unavailable (i.e. outside of Linux)."""
+    try:
+        with open("/proc/self/status") as f:
+            status = dict(line.split(":", 1) for line in f)
+        return int(status["VmRSS"].split()[0]) / 1024, int(status["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        return None, peak_rss / 1024 ** 2
+
+
+def reset_peak_rss() -> None:
+    """Resets the peak resident memory of the process to its current value, where possible (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def run_worker(name: str, path: str, hipe_format_version: str, repeat: int, trace: bool) -> Dict:
+    """Runs one benchmark in the current process, see `run_benchmark`."""
+    function = BENCHMARKS[name](path, hipe_format_version)
+
+    # the memory of the imports and of the preparation of the benchmark is left out
+    reset_peak_rss()
+    setup_rss, _ = rss_mb()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    _, peak_rss = rss_mb()
+    result = {"seconds": min(times), "peak_rss_mb": round(peak_rss - (setup_rss or 0), 1)}
+
+    if trace:
+        tracemalloc.start()
+        function()
+        result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        tracemalloc.stop()
+
+    return result
+
+
+def run_benchmark(name: str, path: str, hipe_format_version: str, repeat: int, trace: bool) -> Dict:
+    """Runs one benchmark in a fresh process, and returns its measurements."""
+    command = [sys.executable, os.path.abspath(__file__), "--worker", name, path, hipe_format_version,
+               "--repeat", str(repeat)] + ([] if trace else ["--no-tracemalloc"])
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def prepare_files(sizes: List[int], data_dir: str, seed: int) -> List[Tuple[str, str]]:
+    """Lists the files to run the benchmarks on, generating the synthetic ones if they don't exist yet."""
+    files = list(BUNDLED_FILES)
+    os.makedirs(data_dir, exist_ok=True)
+    for size in sizes:
+        for hipe_format_version in ("v1", "v2"):
+            path = os.path.join(data_dir, f"synthetic-{hipe_format_version}-{size}-seed{seed}.tsv")
+            if not os.path.exists(path):
+                print(f"Generating {path}", file=sys.stderr)
+                generate_tsv(path + ".tmp", size, hipe_format_version=hipe_format_version, seed=seed)
+                os.replace(path + ".tmp", path)
+            files.append((path, hipe_format_version))
+    return files
+
+
+def compare(results: List[Dict], baseline: List[Dict], max_regression: float) -> List[str]:
+    """Compares results to a baseline, matching benchmarks by name and file, and returns the regressions."""
+    baseline = {(r["benchmark"], r["file"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline.get((result["benchmark"], result["file"]))
+        if reference is None:
+            continue
+        # ratios greater than 1 are regressions, i.e. lower throughputs or higher memory peaks
+        ratios = {"tokens_per_s": reference["tokens_per_s"] / result["tokens_per_s"]}
+        for metric in ("peak_rss_mb", "peak_traced_mb"):
+            if result.get(metric) and reference.get(metric):
+                ratios[metric] = result[metric] / reference[metric]
+
+        for metric, ratio in ratios.items():
+            line = f"{result['benchmark']} on {result['file']}: {metric} {result.get(metric)} " \
+                   f"(baseline {reference.get(metric)})"
+            print(line, file=sys.stderr)
+            if ratio > 1 + max_regression:
+                regressions.append(line)
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1MB,10MB", help="Comma-separated sizes of the synthetic files.")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS), help="Comma-separated benchmark names.")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "hipe_commons_benchmarks"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-tracemalloc", action="store_true")
+    parser.add_argument("--output", help="Writes the results to this file, in addition to the standard output.")
+    parser.add_argument("--compare", help="A previous output of this script to compare the results to.")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--worker", nargs=3, metavar=("BENCHMARK", "PATH", "VERSION"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(*args.worker, repeat=args.repeat, trace=not args.no_tracemalloc)))
+        return
+
+    names = args.benchmarks.split(",")
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size]
+
+    results = []
+    for path, hipe_format_version in prepare_files(sizes, args.data_dir, args.seed):
+        n_tokens = count_tokens(path)
+        for name in names:
+            print(f"Running {name} on {os.path.basename(path)}", file=sys.stderr)
+            measurements = run_benchmark(name, path, hipe_format_version, args.repeat, not args.no_tracemalloc)
+            results.append({
+                "benchmark": name,
+                "file": os.path.basename(path),
+                "hipe_format_version": hipe_format_version,
+                "size_bytes": os.path.getsize(path),
+                "tokens": n_tokens,
+                "tokens_per_s": round(n_tokens / measurements.pop("seconds")),
+                **measurements,
+            })
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)["results"], args.max_regression)
+        if regressions:
+            print("Regressions:\n" + "\n".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Seeded generator of synthetic, HIPE-compliant tsv files of any size.
+
+Usage:
+    python benchmarks/synthetic.py OUTPUT_PATH [--size 100MB] [--hipe-format-version v1] [--seed 0]
+
+Documents are made of sentences of random pseudo-words, with valid IOB annotations on all NE columns, NEL links
+(Wikidata ids or `NIL`) and the usual MISC (v1) or RENDER/SEG/OCR-INFO (v2) flags, so that every function of the
+library can run on them. The same seed, size and version always give the same file.
+"""
+
+import argparse
+import random
+import re
+from typing import List
+
+from hipe_commons.helpers.tsv import (COL_LABELS, IOB_FIRST_LINE, NO_SPACE_AFTER_FLAG, END_OF_LINE_FLAG,
+                                      END_OF_SENTENCE_FLAG, NIL_FLAG)
+
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+COARSE_TYPES = ["pers", "loc", "org", "prod", "time"]
+FINE_TYPES = {
+    "pers": ["pers.ind", "pers.coll"],
+    "loc": ["loc.adm.town", "loc.adm.nat", "loc.phys.geo"],
+    "org": ["org.ent", "org.adm"],
+    "prod": ["prod.media", "prod.doctr"],
+    "time": ["time.date.abs"],
+}
+PUNCTUATION = [",", ";", ":"]
+
+
+def parse_size(size: str) -> int:
+    """Parses a size such as `"500KB"`, `"1MB"` or `"2GB"` into a number of bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B)?\s*", size.upper())
+    if not match:
+        raise ValueError(f"Invalid size: {size!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2) or "B"])
+
+
+class SyntheticCorpus(object):
+    """Generates the documents of a synthetic corpus.
+
+    :param hipe_format_version: `"v1"` (default) or `"v2"`.
+    :param seed: The seed of the random generator.
+    :param vocabulary_size: The number of distinct pseudo-words.
+    :param entity_rate: The probability for a token to start a named entity.
+    """
+
+    def __init__(self, hipe_format_version: str = "v1", seed: int = 0, vocabulary_size: int = 20000,
+                 entity_rate: float = 0.05):
+        if hipe_format_version not in ("v1", "v2"):
+            raise ValueError(f"Unknown HIPE format version: {hipe_format_version}")
+        self.hipe_format_version = hipe_format_version
+        self.random = random.Random(seed)
+        self.entity_rate = entity_rate
+        letters = "abcdefghijklmnopqrstuvwxyzéèàç"
+        self.words = [
+            "".join(self.random.choices(letters, k=self.random.randint(1, 12))) for _ in range(vocabulary_size)
+        ]
+        self.n_documents = 0
+
+    def header(self) -> str:
+        return "\t".join(COL_LABELS) if self.hipe_format_version == "v1" else IOB_FIRST_LINE
+
+    def _entity(self, length: int):
+        """Draws the tag columns and the link of an entity spanning `length` tokens."""
+        coarse = self.random.choice(COARSE_TYPES)
+        fine = self.random.choice(FINE_TYPES[coarse])
+        meto = self.random.random() < 0.1
+        link = NIL_FLAG if self.random.random() < 0.3 else f"Q{self.random.randint(1, 10 ** 7)}"
+        # e.g. a town in the name of an organisation
+        nested = coarse != "loc" and length > 1 and self.random.random() < 0.2
+
+        rows = []
+        for i in range(length):
+            iob = "B" if i == 0 else "I"
+            rows.append([
+                f"{iob}-{coarse}",
+                f"{iob}-{coarse}" if meto else "O",
+                f"{iob}-{fine}",
+                f"{iob}-{fine}" if meto else "O",
+                "O",
+                "B-loc" if nested and i == length - 1 else "O",
+                link,
+                link if meto else "_",
+            ])
+        return rows
+
+    def _sentence(self) -> List[List[str]]:
+        """Draws a sentence, as rows of (token, 8 NE/NEL columns, render flags, segmentation flags, ocr info)."""
+        rows = []
+        length = self.random.randint(5, 30)
+        while len(rows) < length:
+            if self.random.random() < self.entity_rate:
+                entity = self._entity(self.random.randint(1, 3))
+                for columns in entity:
+                    rows.append([self.random.choice(self.words).capitalize()] + columns +
+                                [[], [], f"LED{self.random.random():.2f}"])
+            else:
+                rows.append([self.random.choice(self.words)] + ["O"] * 6 + ["_", "_"] + [[], [], "_"])
+            if self.random.random() < 0.05:
+                rows[-1][9].append(NO_SPACE_AFTER_FLAG)
+                rows.append([self.random.choice(PUNCTUATION)] + ["O"] * 6 + ["_", "_"] + [[], [], "_"])
+            if self.random.random() < 0.1:
+                rows[-1][9].append(END_OF_LINE_FLAG)
+
+        rows[-1][9].append(NO_SPACE_AFTER_FLAG)
+        rows.append(["."] + ["O"] * 6 + ["_", "_"] + [[], [END_OF_SENTENCE_FLAG], "_"])
+        return rows
+
+    def _line(self, row: List) -> str:
+        token, *columns, render, seg, ocr_info = row
+        if self.hipe_format_version == "v1":
+            misc = render + seg + ([ocr_info] if ocr_info != "_" else [])
+            return "\t".join([token] + columns + ["|".join(misc) or "_"])
+        return "\t".join([token] + columns + ["|".join(render) or "_", "|".join(seg) or "_", ocr_info, "_"])
+
+    def document(self) -> str:
+        """Generates the next document, commented metadata included, without trailing line break."""
+        self.n_documents += 1
+        prefix = "hipe2022" if self.hipe_format_version == "v1" else "hipe-newsbench"
+        year = self.random.randint(1750, 1950)
+        lines = [
+            f"# {prefix}:document_id = synthetic-{self.n_documents:08d}",
+            f"# {prefix}:date = {year}-01-01",
+            f"# {prefix}:language = fr",
+            f"# {prefix}:dataset = synthetic",
+        ]
+        for _ in range(self.random.randint(1, 20)):
+            lines.append("# segment_iiif_link = _")
+            lines.extend(map(self._line, self._sentence()))
+        return "\n".join(lines)
+
+
+def generate_tsv(path: str, size: int, hipe_format_version: str = "v1", seed: int = 0) -> int:
+    """Writes a synthetic tsv of (at least) `size` bytes to `path`, document by document.
+
+    :return: The number of written documents.
+    """
+    corpus = SyntheticCorpus(hipe_format_version=hipe_format_version, seed=seed)
+    with open(path, "w", encoding="utf-8") as f:
+        written = f.write(corpus.header() + "\n")
+        while written < size:
+            document = corpus.document() + "\n\n"
+            f.write(document)
+            written += len(document.encode("utf-8"))
+    return corpus.n_documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_path")
+    parser.add_argument("--size", default="100MB")
+    parser.add_argument("--hipe-format-version", default="v1")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    n_documents = generate_tsv(args.output_path, parse_size(args.size), args.hipe_format_version, args.seed)
+    print(f"Wrote {n_documents} documents to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Bulk alignment of word-level labels to the subwords of a tokenizer, with numpy.
+
+Tokenized examples are handled as flat arrays, all the examples being concatenated, along with an `offsets` array:
+`offsets[i]:offsets[i + 1]` is the span of the i-th example. Labels are aligned on the whole arrays at once, instead
+of subword by subword.
+
+Example:
+    ```
+    data = tsv_to_segmented_lists(['NE-COARSE-LIT'], path=path)
+    arrays, offsets = tokenize_and_align(data['texts'], data['NE-COARSE-LIT'], tokenizer, labels_to_ids)
+    ```
+"""
+
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+LABELS_KEY = "labels"
+NULL_LABEL = -100
+# the name of the offsets array when stored along with the other arrays, e.g. in a `ParseCache`
+OFFSETS_KEY = "__offsets__"
+# set in the worker processes of `tokenize_and_align`
+_worker_tokenizer = None
+
+
+def continuation_label_ids(labels_to_ids: Mapping[str, int]) -> np.ndarray:
+    """Maps the id of each label to the id of the label of its continuation subwords, i.e. `B-x` to `I-x`.
+
+    Other labels (`I-x`, `O`, or labels without IOB prefix, such as NEL ids) are their own continuation, as is `B-x`
+    if `I-x` is not in `labels_to_ids`.
+    """
+    continuation = np.arange(max(labels_to_ids.values(), default=-1) + 1, dtype=np.int64)
+    for label, id_ in labels_to_ids.items():
+        if label.startswith("B-"):
+            continuation[id_] = labels_to_ids.get("I" + label[1:], id_)
+    return continuation
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Hashes everything determining the output of a tokenizer: its class, its name, and its full serialization
+    (vocabulary, normalization, pre-tokenization, post-processing...) for fast tokenizers, or its vocabulary and
+    special tokens otherwise."""
+    if hasattr(tokenizer, "backend_tokenizer"):
+        state = json.loads(tokenizer.backend_tokenizer.to_str())
+        # set by the last call of the tokenizer, from its arguments
+        state.pop("truncation", None)
+        state.pop("padding", None)
+        state = json.dumps(state, sort_keys=True)
+    else:
+        state = json.dumps([tokenizer.get_vocab(), tokenizer.all_special_tokens], sort_keys=True)
+    digest = hashlib.sha256(f"{type(tokenizer).__name__}\n{tokenizer.name_or_path}\n{state}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def word_ids_array(encodings) -> Tuple[np.ndarray, np.ndarray]:
+    """Gathers the word ids of all the examples of a fast tokenizer's `BatchEncoding` into a flat array.
+
+    :return: A tuple `(word_ids, offsets)`, special and padding tokens having a word id of -1.
+    """
+    word_ids = [encoding.word_ids for encoding in encodings.encodings]
+    lengths = np.fromiter(map(len, word_ids), dtype=np.int64, count=len(word_ids))
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    # `None` becomes nan
+    flat = np.array(list(chain.from_iterable(word_ids)), dtype=np.float64)
+    return np.nan_to_num(flat, nan=-1).astype(np.int64), offsets
+
+
+def align_labels(word_ids: np.ndarray, offsets: np.ndarray, word_label_ids: np.ndarray, word_offsets: np.ndarray,
+                 continuation: Optional[np.ndarray] = None, label_all_tokens: bool = False,
+                 null_label: int = NULL_LABEL, example_ids: Optional[np.ndarray] = None) -> np.ndarray:
+    """Aligns word-level label ids to subwords, for all the examples at once.
+
+    The first subword of each word is given the label of the word. If `label_all_tokens` is `True`, the other
+    subwords of the word are given its continuation label (see `continuation_label_ids`), otherwise they are marked
+    with `null_label`, as are special and padding tokens.
+
+    :param word_ids: The flat word ids of the subwords, -1 for special and padding tokens (see `word_ids_array`).
+    :param offsets: The spans of the tokenized examples in `word_ids`.
+    :param word_label_ids: The flat label ids of the words of all the examples.
+    :param word_offsets: The spans of the examples in `word_label_ids`.
+    :param continuation: See `continuation_label_ids`, required with `label_all_tokens`.
+    :param label_all_tokens: Whether to label all the subwords of a word, or only the first one.
+    :param null_label: The label of ignored subwords.
+    :param example_ids: The example of each tokenized example, if they differ (e.g. with overflowing tokens, see
+        `overflow_to_sample_mapping`).
+    :return: The flat label ids of the subwords, aligned with `word_ids`.
+    """
+    lengths = np.diff(offsets)
+    if example_ids is None:
+        example_ids = np.arange(len(lengths))
+    example_of_subword = np.repeat(np.asarray(example_ids, dtype=np.int64), lengths)
+
+    is_word = word_ids >= 0
+    # the first subword of a word follows a subword of another word, or starts its example
+    is_first = is_word.copy()
+    is_first[1:] &= word_ids[1:] != word_ids[:-1]
+    is_first[offsets[:-1][lengths > 0]] = is_word[offsets[:-1][lengths > 0]]
+
+    # position of the word of each subword in `word_label_ids`
+    positions = word_offsets[example_of_subword] + word_ids
+
+    labels = np.full(len(word_ids), null_label, dtype=np.int64)
+    if label_all_tokens:
+        if continuation is None:
+            raise ValueError("`continuation` is required with `label_all_tokens`")
+        labels[is_word] = continuation[word_label_ids[positions[is_word]]]
+    labels[is_first] = word_label_ids[positions[is_first]]
+    return labels
+
+
+def _flatten(values: Sequence[Sequence[int]]) -> np.ndarray:
+    return np.fromiter(chain.from_iterable(values), dtype=np.int64, count=sum(map(len, values)))
+
+
+def _tokenize_chunk(texts: List[List[str]], labels: List[List[str]], labels_to_ids: Mapping[str, int],
+                    label_all_tokens: bool, null_label: int, tokenizer=None,
+                    **tokenizer_kwargs) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """Tokenizes and aligns one chunk of examples, see `tokenize_and_align`."""
+    tokenizer = tokenizer or _worker_tokenizer
+    encodings = tokenizer(texts, is_split_into_words=True, **tokenizer_kwargs)
+    example_ids = encodings.pop("overflow_to_sample_mapping", None)
+
+    word_ids, offsets = word_ids_array(encodings)
+    word_label_ids = np.fromiter(map(labels_to_ids.__getitem__, chain.from_iterable(labels)), dtype=np.int64)
+    word_offsets = np.concatenate([[0], np.cumsum(list(map(len, labels)))]).astype(np.int64)
+
+    arrays = {key: _flatten(values) for key, values in encodings.items()}
+    arrays[LABELS_KEY] = align_labels(
+        word_ids, offsets, word_label_ids, word_offsets, continuation_label_ids(labels_to_ids),
+        label_all_tokens=label_all_tokens, null_label=null_label,
+        example_ids=None if example_ids is None else np.asarray(example_ids),
+    )
+    return arrays, offsets
+
+
+def _init_worker(tokenizer) -> None:
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def tokenize_and_align(texts: List[List[str]], labels: List[List[str]], tokenizer, labels_to_ids: Mapping[str, int],
+                       label_all_tokens: bool = False, null_label: int = NULL_LABEL, chunk_size: int = 10000,
+                       num_proc: Optional[int] = None,
+                       **tokenizer_kwargs) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """Tokenizes pre-split examples with a fast tokenizer, and aligns their labels (see `align_labels`).
+
+    Examples are tokenized by chunks of `chunk_size`, so that only the python lists of one chunk are held in memory
+    at a time, and chunks can be tokenized in parallel with `num_proc` processes.
+
+    :param texts: The words of each example, e.g. `tsv_to_segmented_lists(...)['texts']`.
+    :param labels: The labels of the words of each example.
+    :param tokenizer: A fast transformer tokenizer (`transformers.PreTrainedTokenizerFast`).
+    :param labels_to_ids: A Dict[str,int] mapping labels to their respective ids.
+    :param label_all_tokens: See `align_labels`.
+    :param null_label: See `align_labels`.
+    :param chunk_size: The number of examples tokenized at once.
+    :param num_proc: The number of worker processes, defaults to tokenizing in the current process.
+    :param tokenizer_kwargs: Passed to the tokenizer, e.g. `truncation=True`.
+    :return: A tuple `(arrays, offsets)`, `arrays` mapping each field of the tokenizer's output (`input_ids`,
+        `attention_mask`, ...) and `labels` to a flat array, `offsets` giving the span of each tokenized example.
+    """
+    chunks = [(texts[start:start + chunk_size], labels[start:start + chunk_size])
+              for start in range(0, len(texts), chunk_size)]
+    args = (labels_to_ids, label_all_tokens, null_label)
+
+    if num_proc and num_proc > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=num_proc, initializer=_init_worker, initargs=(tokenizer,)) as executor:
+            futures = [executor.submit(_tokenize_chunk, *chunk, *args, **tokenizer_kwargs) for chunk in chunks]
+            results = [future.result() for future in futures]
+    else:
+        results = [_tokenize_chunk(*chunk, *args, tokenizer=tokenizer, **tokenizer_kwargs) for chunk in chunks]
+
+    if not results:
+        return {LABELS_KEY: np.zeros(0, dtype=np.int64)}, np.zeros(1, dtype=np.int64)
+
+    arrays = {key: np.concatenate([chunk_arrays[key] for chunk_arrays, _ in results]) for key in results[0][0]}
+    offsets, end = [np.zeros(1, dtype=np.int64)], 0
+    for _, chunk_offsets in results:
+        offsets.append(chunk_offsets[1:] + end)
+        end += chunk_offsets[-1]
+    return arrays, np.concatenate(offsets)
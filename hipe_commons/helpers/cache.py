@@ -0,0 +1,252 @@
+"""Opt-in, on-disk cache of parsed HIPE tsv files."""
+
+import hashlib
+import json
+import os
+import pickle
+import struct
+import tempfile
+import zipfile
+from typing import Any, Callable, Optional, Union, Dict, List, Tuple
+
+import numpy as np
+
+# Bump when the format of cached values changes, so that stale entries are never loaded.
+CACHE_FORMAT_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hipe_commons")
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+ENTRY_SUFFIX = ".pkl"
+# entries of numpy arrays, see `ParseCache.put_arrays`
+ARRAYS_SUFFIX = ".npz"
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str, chunk_size: int = 1024 ** 2) -> str:
+    """Computes the sha256 of a file's content, reading it by chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache(object):
+    """A directory of parsing results, keyed by source file and parsing parameters.
+
+    Entries are identified by the absolute path of the source file together with either its size and modification
+    time (`key_by="stat"`, the default) or its content hash (`key_by="content"`, slower but robust to copies and
+    `touch`), and by any parameters influencing the result (e.g. `hipe_format_version` or the masking flags).
+
+    Entries are either pickled values (`get`/`put`) or dicts of numpy arrays (`get_arrays`/`put_arrays`), which can
+    be loaded memory-mapped. When the total size of the entries exceeds `max_size`, the least recently used ones are
+    evicted.
+
+    :param cache_dir: The directory holding the entries. Defaults to the `HIPE_COMMONS_CACHE_DIR` environment variable,
+        or to `~/.cache/hipe_commons`.
+    :param max_size: The maximum total size of the entries in bytes, or `None` for no limit.
+    :param key_by: How source files are identified, `"stat"` or `"content"`.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size: Optional[int] = DEFAULT_MAX_SIZE,
+                 key_by: str = "stat"):
+        if key_by not in ("stat", "content"):
+            raise ValueError(f"`key_by` must be 'stat' or 'content', not {key_by!r}")
+
+        self.cache_dir = cache_dir or os.environ.get("HIPE_COMMONS_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_size = max_size
+        self.key_by = key_by
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _path_prefix(path: str) -> str:
+        return _sha256(os.path.abspath(path).encode("utf-8"))[:32]
+
+    def key(self, path: str, **params) -> str:
+        """Computes the key of the entry caching the result of parsing `path` with `params`.
+
+        `params` must be JSON-serializable.
+        """
+        if self.key_by == "content":
+            source = {"sha256": file_digest(path)}
+        else:
+            stat = os.stat(path)
+            source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        params = json.dumps({"format": CACHE_FORMAT_VERSION, "source": source, "params": params}, sort_keys=True)
+
+        # the path prefix allows to invalidate all the entries of a file at once
+        return f"{self._path_prefix(path)}-{_sha256(params.encode('utf-8'))[:32]}"
+
+    def _entry_path(self, key: str, suffix: str = ENTRY_SUFFIX) -> str:
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Loads the value of an entry, or returns `None` if there is no (readable) entry for `key`."""
+        def load(entry_path):
+            with open(entry_path, "rb") as f:
+                return pickle.load(f)
+
+        return self._read(self._entry_path(key), load)
+
+    def put(self, key: str, value: Any) -> None:
+        """Stores `value` under `key`, then evicts the least recently used entries if the cache is too large."""
+        self._write(self._entry_path(key), lambda f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get_arrays(self, key: str, mmap: bool = True) -> Optional[Dict[str, np.ndarray]]:
+        """Loads the arrays of an entry stored with `put_arrays`, or returns `None` if there is no (readable) entry.
+
+        :param mmap: Whether to memory-map the arrays rather than reading them. Memory-mapped arrays are
+            copy-on-write: they can be modified in memory, without affecting the entry.
+        """
+        return self._read(self._entry_path(key, ARRAYS_SUFFIX), _load_mmap_npz if mmap else _load_npz)
+
+    def put_arrays(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        """Same as `put`, for a dict of numpy arrays, stored uncompressed so as to be memory-mapped by `get_arrays`."""
+        self._write(self._entry_path(key, ARRAYS_SUFFIX), lambda f: np.savez(f, **arrays))
+
+    def _read(self, entry_path: str, load: Callable[[str], Any]) -> Optional[Any]:
+        try:
+            value = load(entry_path)
+        except FileNotFoundError:
+            return None
+        except Exception:  # truncated or otherwise corrupted entry
+            self._remove(entry_path)
+            return None
+
+        # mark the entry as recently used
+        os.utime(entry_path)
+        return value
+
+    def _write(self, entry_path: str, dump: Callable) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                dump(f)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def _entries(self):
+        with os.scandir(self.cache_dir) as it:
+            return [entry for entry in it if entry.name.endswith((ENTRY_SUFFIX, ARRAYS_SUFFIX))]
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def size(self) -> int:
+        """The total size of the entries, in bytes."""
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in `max_size`."""
+        if self.max_size is None:
+            return
+
+        entries = sorted(((entry.stat(), entry.path) for entry in self._entries()), key=lambda e: e[0].st_mtime_ns)
+        size = sum(stat.st_size for stat, _ in entries)
+        for stat, path in entries:
+            if size <= self.max_size:
+                break
+            self._remove(path)
+            size -= stat.st_size
+
+    def invalidate(self, path: Optional[str] = None) -> int:
+        """Removes all the entries of the source file `path`, or all entries if `path` is `None`.
+
+        :return: The number of removed entries.
+        """
+        prefix = self._path_prefix(path) + "-" if path else ""
+        removed = 0
+        for entry in self._entries():
+            if entry.name.startswith(prefix):
+                self._remove(entry.path)
+                removed += 1
+        return removed
+
+    def clear(self) -> int:
+        """Removes all entries. Same as `invalidate()`."""
+        return self.invalidate()
+
+
+def _load_npz(path: str) -> Dict[str, np.ndarray]:
+    with np.load(path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def _load_mmap_npz(path: str) -> Dict[str, np.ndarray]:
+    """Memory-maps the arrays of an uncompressed `.npz` file, as `np.load(mmap_mode=...)` only does for `.npy` files.
+
+    The members of such a file are `.npy` files stored as is, so that each array is a contiguous range of the file.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zip_file, open(path, "rb") as f:
+        for info in zip_file.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                return _load_npz(path)
+            # the data of a member follows its local header, of variable length
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else \
+                np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            name = info.filename[:-len(".npy")]
+            if dtype.hasobject:
+                return _load_npz(path)
+            elif np.prod(shape) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="c", offset=f.tell(), shape=shape,
+                                         order="F" if fortran_order else "C")
+    return arrays
+
+
+def encode_columns(columns: Dict[str, List]) -> Dict[str, Tuple[Optional[List], np.ndarray]]:
+    """Dictionary-encodes the columns of a `tsv_to_dict`-like dict, for compact storage.
+
+    Each column becomes a `(values, codes)` tuple, `values` being `None` for integer columns (e.g. `'n'`), which are
+    stored as is.
+    """
+    encoded = {}
+    for name, column in columns.items():
+        if all(type(value) is int for value in column):
+            encoded[name] = (None, np.array(column, dtype=np.int64))
+        else:
+            index = {}
+            codes = [index.setdefault(value, len(index)) for value in column]
+            encoded[name] = (list(index), np.array(codes, dtype=np.min_scalar_type(max(len(index) - 1, 0))))
+    return encoded
+
+
+def decode_columns(encoded: Dict[str, Tuple[Optional[List], np.ndarray]]) -> Dict[str, List]:
+    """Inverse of `encode_columns`."""
+    columns = {}
+    for name, (values, codes) in encoded.items():
+        if values is None:
+            columns[name] = codes.tolist()
+        else:
+            vocabulary = np.empty(len(values), dtype=object)
+            vocabulary[:] = values
+            columns[name] = vocabulary[codes].tolist()
+    return columns
+
+
+def get_cache(cache: Union[bool, ParseCache, None]) -> Optional[ParseCache]:
+    """Resolves the `cache` argument of parsing functions: `True` uses a default `ParseCache`, `False`/`None` none."""
+    if cache is True:
+        return ParseCache()
+    return cache or None
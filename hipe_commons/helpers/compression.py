@@ -0,0 +1,185 @@
+"""Transparent (de)compression of tsv files, for `gzip`, `bz2` and `xz` codecs.
+
+Compressed inputs are recognized by their magic bytes, whatever their extension, and decompressed on the fly while
+being read: nothing is ever inflated to disk, nor into memory at once. Outputs are compressed according to the
+extension of their path (`.gz`, `.bz2` or `.xz`).
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import zlib
+from typing import BinaryIO, Callable, Dict, Optional, TextIO
+
+GZIP = "gzip"
+BZ2 = "bz2"
+XZ = "xz"
+
+EXTENSIONS = {".gz": GZIP, ".bz2": BZ2, ".xz": XZ}
+# bz2 streams start with `BZh` and the block size, followed by the magic of a block, or of the end of the stream
+_BZ2_BLOCK_MAGICS = (b"\x31\x41\x59\x26\x53\x59", b"\x17\x72\x45\x38\x50\x90")
+MAGIC_SIZE = 10
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# the default level of the `gzip` command, much faster than the maximum (9) used by `gzip.open`
+GZIP_LEVEL = 6
+
+_DECOMPRESSORS: Dict[str, Callable] = {
+    GZIP: lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    BZ2: bz2.BZ2Decompressor,
+    XZ: lzma.LZMADecompressor,
+}
+
+
+def codec_from_magic(head: bytes) -> Optional[str]:
+    """Detects the codec of compressed data from its first bytes (at least `MAGIC_SIZE`, if available).
+
+    :return: `"gzip"`, `"bz2"`, `"xz"`, or `None` for uncompressed data.
+    """
+    if head.startswith(b"\x1f\x8b"):
+        return GZIP
+    elif head.startswith(b"\xfd7zXZ\x00"):
+        return XZ
+    elif head[:3] == b"BZh" and head[3:4].isdigit() and head[3:4] != b"0" and head[4:10] in _BZ2_BLOCK_MAGICS:
+        return BZ2
+    return None
+
+
+def codec_from_extension(path: str) -> Optional[str]:
+    """Infers the codec of a file from its extension, e.g. `"gzip"` for `data.tsv.gz`, `None` for `data.tsv`."""
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def detect_codec(path: str) -> Optional[str]:
+    """Detects the codec of a file from its magic bytes, see `codec_from_magic`."""
+    with open(path, "rb") as f:
+        return codec_from_magic(f.read(MAGIC_SIZE))
+
+
+def _read_head(stream: BinaryIO, size: int = MAGIC_SIZE) -> bytes:
+    # a single `read` may return less than `size` bytes, e.g. from a socket
+    head = b""
+    while len(head) < size:
+        data = stream.read(size - len(head))
+        if not data:
+            break
+        head += data
+    return head
+
+
+class _DecompressedStream(io.RawIOBase):
+    """A raw stream decompressing a binary stream chunk by chunk, `head` being its first bytes, already read.
+
+    Concatenated compressed streams (as written by `pigz` or `pbzip2`) are decompressed one after the other. The
+    source stream is closed along with this one.
+    """
+
+    def __init__(self, source: BinaryIO, head: bytes, codec: Optional[str], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._source = source
+        self._pending = head
+        self._new_decompressor = _DECOMPRESSORS[codec] if codec else None
+        self._decompressor = self._new_decompressor() if codec else None
+        self._buffer = memoryview(b"")
+        self._chunk_size = chunk_size
+
+    def readable(self) -> bool:
+        return True
+
+    def _decompress(self, data: bytes) -> bytes:
+        output = []
+        while data:
+            if self._decompressor.eof:
+                # `data` is the beginning of the next compressed stream
+                self._decompressor = self._new_decompressor()
+            output.append(self._decompressor.decompress(data))
+            data = self._decompressor.unused_data if self._decompressor.eof else b""
+        return b"".join(output)
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            data = self._pending or self._source.read(self._chunk_size)
+            self._pending = b""
+            if not data:
+                if self._decompressor is not None and not self._decompressor.eof:
+                    raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+                return 0
+            self._buffer = memoryview(self._decompress(data) if self._decompressor is not None else data)
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._source.close()
+        super().close()
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    """A `GzipFile` closing its `fileobj`, as when opened from a file name."""
+
+    def close(self) -> None:
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+def decompress_stream(stream: BinaryIO, buffer_size: int = io.DEFAULT_BUFFER_SIZE) -> BinaryIO:
+    """Wraps a binary stream (e.g. an http response) into a stream of its decompressed content.
+
+    The codec is detected from the first bytes of the stream, uncompressed streams being read as is. The source
+    stream is closed along with the returned one.
+    """
+    head = _read_head(stream)
+    return io.BufferedReader(_DecompressedStream(stream, head, codec_from_magic(head)), buffer_size)
+
+
+def open_input(path: str) -> BinaryIO:
+    """Opens a file as a binary stream of its decompressed content, see `decompress_stream`."""
+    f = open(path, "rb")
+    head = _read_head(f)
+    codec = codec_from_magic(head)
+    if codec is None:
+        f.seek(0)
+        return f
+    return io.BufferedReader(_DecompressedStream(f, head, codec))
+
+
+def open_output(path: str, compression: Optional[str] = "infer", buffer_size: int = io.DEFAULT_BUFFER_SIZE,
+                **kwargs) -> TextIO:
+    """Opens a text file for writing, compressed according to `compression`.
+
+    :param path: The path of the file.
+    :param compression: `"gzip"`, `"bz2"`, `"xz"`, `None` for no compression, or `"infer"` (default) to infer it
+        from the extension of `path` (see `codec_from_extension`).
+    :param buffer_size: The size of the write buffer, in bytes.
+    :param kwargs: Passed to `io.TextIOWrapper` or `open`, e.g. `encoding`.
+    """
+    if compression == "infer":
+        compression = codec_from_extension(path)
+
+    if compression is None:
+        return open(path, "w", buffering=buffer_size, **kwargs)
+    elif compression == GZIP:
+        # no file name nor modification time in the header, so that equal contents give equal files
+        f = open(path, "wb")
+        try:
+            compressed = _ClosingGzipFile(filename="", fileobj=f, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+        except BaseException:
+            f.close()
+            raise
+    elif compression == BZ2:
+        compressed = bz2.BZ2File(path, "wb")
+    elif compression == XZ:
+        compressed = lzma.LZMAFile(path, "wb")
+    else:
+        raise ValueError(f"`compression` must be one of {[GZIP, BZ2, XZ, None, 'infer']}, not {compression!r}")
+
+    return io.TextIOWrapper(io.BufferedWriter(compressed, buffer_size), **kwargs)
+
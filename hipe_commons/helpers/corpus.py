@@ -0,0 +1,446 @@
+"""Column-wise storage of HIPE tsv data."""
+
+import array
+import dataclasses
+import operator
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from itertools import starmap, accumulate, islice
+from typing import List, Dict, Iterable, Iterator, Optional, Union, NamedTuple, TextIO
+
+import numpy as np
+
+from .tsv import (TSVComment, TSVAnnotation, TSVAnnotation_v2, TSVLine, TSVLine_v2, HipeDocument, HipeEntities,
+                  iter_tsv,
+                  TSVWriter,
+                  find_datasets_files, read_tsv_chunks, parse_columns)
+from .vocabulary import Vocabulary
+
+# Annotation attributes stored as dictionary-encoded columns, i.e. all but `n` and `token`
+ANNOTATION_COLUMNS = list(TSVAnnotation._fields[2:])
+ANNOTATION_COLUMNS_V2 = [f.name for f in dataclasses.fields(TSVAnnotation_v2)][2:]
+
+
+def _to_numpy(values: array.array, max_value: Optional[int] = None) -> np.ndarray:
+    """Converts an array of non-negative integers to a numpy array of the smallest sufficient integer type."""
+    if max_value is None:
+        max_value = max(values, default=0)
+    return np.frombuffer(values, dtype=values.typecode).astype(np.min_scalar_type(max(max_value, 0)))
+
+
+class HipeCorpus(object):
+    """A collection of HIPE documents, stored as contiguous arrays rather than as one object per tsv line.
+
+    Annotation lines are stored column by column, in file order:
+        - `line_numbers`: the `n` of each annotation line.
+        - `token_buffer` and `token_offsets`: all tokens, utf-8 encoded and each followed by a line break, the token of
+          line `i` being `token_buffer[token_offsets[i]:token_offsets[i + 1] - 1]`.
+        - `codes[column]`: for any other column (e.g. `'ne_coarse_lit'`), the ids of its values in `vocabulary`.
+
+    Commented lines are stored in the same way in `comment_line_numbers` and `codes['comment_field']`/
+    `codes['comment_value']`. Documents are delimited by `doc_offsets` (on annotation lines) and
+    `doc_comment_offsets` (on commented lines), document `i` spanning from `doc_offsets[i]` to `doc_offsets[i + 1]`.
+
+    All columns share a single `Vocabulary`, so that ids can be compared across columns (e.g. `'B-pers'` has the same
+    id in `ne_coarse_lit` and `ne_coarse_meto`), and across corpora sharing their vocabulary (see
+    `share_vocabulary`). Decoded lines share one instance per distinct value.
+
+    All arrays use the smallest integer type able to hold their values. `HipeDocument`, `TSVAnnotation` and
+    `TSVComment` objects are only created on demand, e.g. when indexing or iterating over the corpus.
+    """
+
+    def __init__(self, hipe_format_version: str = "v1", paths: Optional[List[str]] = None,
+                 doc_paths: Optional[np.ndarray] = None,
+                 doc_offsets: Optional[np.ndarray] = None, doc_comment_offsets: Optional[np.ndarray] = None,
+                 line_numbers: Optional[np.ndarray] = None, comment_line_numbers: Optional[np.ndarray] = None,
+                 token_buffer: bytes = b"", token_offsets: Optional[np.ndarray] = None,
+                 codes: Optional[Dict[str, np.ndarray]] = None, vocabulary: Optional[Vocabulary] = None):
+        if hipe_format_version == "v1":
+            self._annotation_type, self.columns = TSVAnnotation, ANNOTATION_COLUMNS
+        elif hipe_format_version == "v2":
+            self._annotation_type, self.columns = TSVAnnotation_v2, ANNOTATION_COLUMNS_V2
+        else:
+            raise ValueError(f"Unknown HIPE format version: {hipe_format_version}")
+
+        self.hipe_format_version = hipe_format_version
+        self.paths = paths if paths is not None else []
+        self.doc_paths = doc_paths if doc_paths is not None else np.zeros(0, dtype=np.int32)
+        self.doc_offsets = doc_offsets if doc_offsets is not None else np.zeros(1, dtype=np.int64)
+        self.doc_comment_offsets = doc_comment_offsets if doc_comment_offsets is not None else np.zeros(1, np.int64)
+        self.line_numbers = line_numbers if line_numbers is not None else np.zeros(0, dtype=np.int32)
+        self.comment_line_numbers = comment_line_numbers if comment_line_numbers is not None else np.zeros(0, np.int32)
+        self.token_buffer = token_buffer
+        self.token_offsets = token_offsets if token_offsets is not None else np.zeros(1, dtype=np.int64)
+        self.codes = codes if codes is not None else {
+            column: np.zeros(0, dtype=np.uint8) for column in self.columns + ['comment_field', 'comment_value']
+        }
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self._vocabulary_array_cache = None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    #                                                   CONSTRUCTORS
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def from_documents(cls, documents: Iterable[HipeDocument], hipe_format_version: str = "v1",
+                       vocabulary: Optional[Vocabulary] = None) -> "HipeCorpus":
+        """Builds a `HipeCorpus` from `HipeDocument` objects, which are consumed one at a time.
+
+        :param documents: Any iterable of `HipeDocument`, e.g. the output of `iter_tsv`.
+        :param hipe_format_version: The HIPE format version of the documents, `"v1"` (default) or `"v2"`.
+        :param vocabulary: A `Vocabulary` to share with other corpora, defaults to a new one.
+        """
+        builder = _CorpusBuilder(cls(hipe_format_version=hipe_format_version, vocabulary=vocabulary))
+        get_values = operator.attrgetter('n', 'token', *builder.corpus.columns)
+
+        for document in documents:
+            annotations, comments = [], []
+            for line in document._tsv_lines:
+                (comments if isinstance(line, TSVComment) else annotations).append(line)
+            columns = [list(column) for column in zip(*map(get_values, annotations))] or \
+                      [[] for _ in range(len(builder.corpus.columns) + 2)]
+            builder.add_document(document.path, columns, comments)
+
+        return builder.build()
+
+    @classmethod
+    def from_tsv(cls, mask_nerc: bool = False, mask_nel: bool = False, hipe_format_version: str = "v1",
+                 vocabulary: Optional[Vocabulary] = None, **kwargs) -> "HipeCorpus":
+        """Parses a HIPE-compliant tsv into a `HipeCorpus`, streaming it document by document.
+
+        Unless masking is required, lines are parsed straight into columns (see `parse_columns`), without creating
+        any intermediary object. See `iter_tsv` for the other accepted arguments.
+
+        :param vocabulary: A `Vocabulary` to share with other corpora, defaults to a new one.
+        """
+        if mask_nerc or mask_nel:
+            documents = iter_tsv(mask_nerc=mask_nerc, mask_nel=mask_nel, hipe_format_version=hipe_format_version,
+                                 decode_entities=False, **kwargs)
+            return cls.from_documents(documents, hipe_format_version=hipe_format_version, vocabulary=vocabulary)
+
+        builder = _CorpusBuilder(cls(hipe_format_version=hipe_format_version, vocabulary=vocabulary))
+        for path, lines in read_tsv_chunks(**kwargs):
+            columns, comments = parse_columns(lines, hipe_format_version=hipe_format_version)
+            builder.add_document(path, list(columns.values()), comments)
+        return builder.build()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    #                                                   COLUMNS
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def n_tokens(self) -> int:
+        return len(self.line_numbers)
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes used by the arrays of the corpus (vocabulary excluded)."""
+        arrays = [self.doc_paths, self.doc_offsets, self.doc_comment_offsets, self.line_numbers,
+                  self.comment_line_numbers, self.token_offsets] + list(self.codes.values())
+        return len(self.token_buffer) + sum(a.nbytes for a in arrays)
+
+    @staticmethod
+    def _column_name(column: str) -> str:
+        """Accepts both tsv column labels (e.g. `'NE-COARSE-LIT'`) and attribute names (e.g. `'ne_coarse_lit'`)."""
+        return column.lower().replace('-', '_')
+
+    def tokens(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        """Decodes the tokens of annotation lines `start` to `stop`."""
+        stop = self.n_tokens if stop is None else stop
+        if stop <= start:
+            return []
+        # tokens are separated by a line break, which can't be part of a token
+        return self.token_buffer[self.token_offsets[start]:self.token_offsets[stop] - 1].decode('utf-8').split("\n")
+
+    @property
+    def _vocabulary_array(self) -> np.ndarray:
+        """The vocabulary as an `object` array, so that codes can be decoded with numpy indexing."""
+        # a shared vocabulary may grow, but the ids used by the corpus never change
+        if self._vocabulary_array_cache is None or len(self._vocabulary_array_cache) != len(self.vocabulary):
+            self._vocabulary_array_cache = np.empty(len(self.vocabulary), dtype=object)
+            self._vocabulary_array_cache[:] = self.vocabulary.values
+        return self._vocabulary_array_cache
+
+    def share_vocabulary(self, vocabulary: Vocabulary) -> None:
+        """Re-encodes the columns of the corpus with the ids of `vocabulary`, which then replaces its own.
+
+        Values missing from `vocabulary` are added to it. Sharing one vocabulary between corpora (e.g. the files of
+        a release, see `parse_datasets`) allows comparing their codes directly.
+        """
+        if vocabulary is self.vocabulary:
+            return
+        ids = np.array(vocabulary.encode(self.vocabulary.values), dtype=np.int64)
+        dtype = np.min_scalar_type(max(len(vocabulary) - 1, 0))
+        self.codes = {column: ids[codes].astype(dtype) for column, codes in self.codes.items()}
+        self.vocabulary = vocabulary
+        self._vocabulary_array_cache = None
+
+    def column(self, column: str) -> np.ndarray:
+        """Returns the values of a column over the whole corpus, as an `object` array.
+
+        ..note:: To compare or count values, working on `codes[column]` with `vocabulary.id(value)` is much cheaper.
+        """
+        column = self._column_name(column)
+        if column == 'token':
+            return np.array(self.tokens(), dtype=object)
+        elif column == 'n':
+            return self.line_numbers.copy()
+        return self._vocabulary_array[self.codes[column]]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    #                                                   VIEWS
+    # ------------------------------------------------------------------------------------------------------------------
+    def lines(self, start: int = 0, stop: Optional[int] = None) -> List[Union[TSVAnnotation, TSVAnnotation_v2]]:
+        """Creates the annotation objects of annotation lines `start` to `stop`."""
+        stop = self.n_tokens if stop is None else stop
+        vocabulary = self._vocabulary_array
+        columns = [vocabulary[self.codes[column][start:stop]].tolist() for column in self.columns]
+        return list(starmap(self._annotation_type,
+                            zip(self.line_numbers[start:stop].tolist(), self.tokens(start, stop), *columns)))
+
+    def line(self, i: int) -> Union[TSVAnnotation, TSVAnnotation_v2]:
+        """Creates the annotation object of the `i`-th annotation line of the corpus."""
+        if i < 0:
+            i += self.n_tokens
+        if not 0 <= i < self.n_tokens:
+            raise IndexError("line index out of range")
+        return self.lines(i, i + 1)[0]
+
+    def comments(self, start: int = 0, stop: Optional[int] = None) -> List[TSVComment]:
+        """Creates the `TSVComment` objects of commented lines `start` to `stop`."""
+        stop = len(self.comment_line_numbers) if stop is None else stop
+        vocabulary = self._vocabulary_array
+        return list(starmap(TSVComment, zip(
+            self.comment_line_numbers[start:stop].tolist(),
+            vocabulary[self.codes['comment_field'][start:stop]].tolist(),
+            vocabulary[self.codes['comment_value'][start:stop]].tolist()
+        )))
+
+    def document_lines(self, i: int) -> List[Union[TSVLine, TSVLine_v2]]:
+        """Creates the lines of the `i`-th document, commented lines included, in file order."""
+        start, stop = int(self.doc_offsets[i]), int(self.doc_offsets[i + 1])
+        comment_start, comment_stop = int(self.doc_comment_offsets[i]), int(self.doc_comment_offsets[i + 1])
+        annotations = self.lines(start, stop)
+        if comment_start == comment_stop:
+            return annotations
+
+        # each commented line goes before the first annotation line having a greater line number
+        comments = self.comments(comment_start, comment_stop)
+        positions = np.searchsorted(self.line_numbers[start:stop],
+                                    self.comment_line_numbers[comment_start:comment_stop]).tolist()
+        lines, previous_position = [], 0
+        for comment, position in zip(comments, positions):
+            lines.extend(annotations[previous_position:position])
+            lines.append(comment)
+            previous_position = position
+        lines.extend(annotations[previous_position:])
+        return lines
+
+    def document(self, i: int, decode_entities: bool = True) -> HipeDocument:
+        """Creates a `HipeDocument` for the `i`-th document of the corpus, whose lines are only created on first
+        access (see `_CorpusDocument`)."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("document index out of range")
+        return _CorpusDocument(self, i, decode_entities=decode_entities)
+
+    def __len__(self) -> int:
+        return len(self.doc_offsets) - 1
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_vocabulary_array_cache'] = None
+        return state
+
+    def __getitem__(self, i: int) -> HipeDocument:
+        return self.document(i)
+
+    def __iter__(self) -> Iterator[HipeDocument]:
+        for i in range(len(self)):
+            yield self.document(i)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    #                                                   SERIALIZATION
+    # ------------------------------------------------------------------------------------------------------------------
+    def documents_tsv(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        """Serializes documents `start` to `stop` as in the tsv, same as `HipeDocument.to_tsv`.
+
+        Lines are formatted straight from the columns, all at once, without creating any line object. Missing
+        (`None`) values are written as `_`.
+        """
+        stop = len(self) if stop is None else stop
+        if stop <= start:
+            return []
+        line_start, line_stop = int(self.doc_offsets[start]), int(self.doc_offsets[stop])
+        comment_start, comment_stop = int(self.doc_comment_offsets[start]), int(self.doc_comment_offsets[stop])
+
+        vocabulary = self._vocabulary_array
+        values = vocabulary.copy()
+        values[[value is None for value in vocabulary]] = "_"
+        columns = [values[self.codes[column][line_start:line_stop]].tolist() for column in self.columns]
+        lines = list(map("\t".join, zip(self.tokens(line_start, line_stop), *columns)))
+
+        n_lines = np.diff(self.doc_offsets[start:stop + 1]).astype(np.int64)
+        n_comments = np.diff(self.doc_comment_offsets[start:stop + 1]).astype(np.int64)
+        if comment_stop > comment_start:
+            lines += [f"# {field} = {value}" for field, value in zip(
+                vocabulary[self.codes['comment_field'][comment_start:comment_stop]].tolist(),
+                vocabulary[self.codes['comment_value'][comment_start:comment_stop]].tolist(),
+            )]
+            # commented lines go back between annotation lines, by document and line number
+            documents = np.concatenate([np.repeat(np.arange(start, stop), n_lines),
+                                        np.repeat(np.arange(start, stop), n_comments)])
+            line_numbers = np.concatenate([self.line_numbers[line_start:line_stop].astype(np.int64),
+                                           self.comment_line_numbers[comment_start:comment_stop].astype(np.int64)])
+            lines = [lines[i] for i in np.lexsort((line_numbers, documents)).tolist()]
+
+        bounds = np.concatenate([[0], np.cumsum(n_lines + n_comments)]).tolist()
+        return ["\n".join(lines[bounds[i]:bounds[i + 1]]) for i in range(stop - start)]
+
+    def dump(self, output: Union[str, TextIO], batch_size: int = 1000, **kwargs) -> None:
+        """Writes the corpus to a tsv file, formatting its documents by batches (see `documents_tsv`).
+
+        :param output: The path of the file to write, or an open text stream, see `TSVWriter`.
+        :param batch_size: The number of documents formatted at once.
+        :param kwargs: Passed to `TSVWriter`, e.g. `compression`.
+        """
+        with TSVWriter(output, hipe_format_version=self.hipe_format_version, **kwargs) as writer:
+            for start in range(0, len(self), batch_size):
+                for text in self.documents_tsv(start, min(start + batch_size, len(self))):
+                    writer.write_text(text)
+
+
+class _CorpusDocument(HipeDocument):
+    """A `HipeDocument` backed by a `HipeCorpus`: its lines, and thus its entities, are created from the corpus the
+    first time they are read, after which it behaves as any other document (e.g. its lines can be replaced)."""
+
+    def __init__(self, corpus: HipeCorpus, i: int, decode_entities: bool = True):
+        self.path = corpus.paths[corpus.doc_paths[i]]
+        self._corpus = corpus
+        self._i = i
+        self._decode_entities = decode_entities
+        self._raw_lines = None
+        self._parsed_lines = ()
+
+    @cached_property
+    def _tsv_lines(self) -> List[Union[TSVLine, TSVLine_v2]]:
+        return self._corpus.document_lines(self._i)
+
+    @cached_property
+    def entities(self) -> Union[HipeEntities, Dict]:
+        return HipeEntities(self._tsv_lines) if self._decode_entities else {}
+
+
+class _CorpusBuilder(object):
+    """Accumulates documents, given column by column, into the arrays of a `HipeCorpus`."""
+
+    def __init__(self, corpus: HipeCorpus):
+        self.corpus = corpus
+        self.codes = {column: array.array('i') for column in corpus.codes}
+        self.paths, self.doc_paths = Vocabulary(), array.array('i')
+        self.doc_offsets, self.doc_comment_offsets = array.array('q', [0]), array.array('q', [0])
+        self.line_numbers, self.comment_line_numbers = array.array('i'), array.array('i')
+        self.token_chunks, self.token_offsets = [], array.array('q', [0])
+
+    def add_document(self, path: Optional[str], columns: List[List], comments: List[TSVComment]):
+        """Adds a document, given as the columns of its annotation lines (`n`, `token`, then `corpus.columns`) and
+        the list of its commented lines."""
+        line_numbers, tokens, *values = columns
+        self.doc_paths.append(self.paths.add(path))
+
+        self.line_numbers.extend(line_numbers)
+        if tokens:
+            # tokens are separated by a line break, see `HipeCorpus.tokens`
+            self.token_chunks.append(("\n".join(tokens) + "\n").encode('utf-8'))
+            token_lengths = (len(token.encode('utf-8')) + 1 for token in tokens)
+            self.token_offsets.extend(islice(accumulate(token_lengths, initial=self.token_offsets[-1]), 1, None))
+        vocabulary = self.corpus.vocabulary
+        for column, column_values in zip(self.corpus.columns, values):
+            self.codes[column].extend(vocabulary.encode(column_values))
+
+        for comment in comments:
+            self.comment_line_numbers.append(comment.n)
+            self.codes['comment_field'].append(vocabulary.add(comment.field))
+            self.codes['comment_value'].append(vocabulary.add(comment.value))
+
+        self.doc_offsets.append(len(self.line_numbers))
+        self.doc_comment_offsets.append(len(self.comment_line_numbers))
+
+    def build(self) -> HipeCorpus:
+        corpus = self.corpus
+        corpus.paths = self.paths.values
+        corpus.doc_paths = _to_numpy(self.doc_paths, max_value=len(self.paths) - 1)
+        corpus.doc_offsets = _to_numpy(self.doc_offsets, max_value=self.doc_offsets[-1])
+        corpus.doc_comment_offsets = _to_numpy(self.doc_comment_offsets, max_value=self.doc_comment_offsets[-1])
+        corpus.line_numbers = _to_numpy(self.line_numbers)
+        corpus.comment_line_numbers = _to_numpy(self.comment_line_numbers)
+        corpus.token_buffer = b"".join(self.token_chunks)
+        corpus.token_offsets = _to_numpy(self.token_offsets, max_value=self.token_offsets[-1])
+        corpus.codes = {column: _to_numpy(codes, max_value=len(corpus.vocabulary) - 1)
+                        for column, codes in self.codes.items()}
+        return corpus
+
+
+class DatasetParseResult(NamedTuple):
+    """The outcome of parsing one file of a release with `parse_datasets`.
+
+    `corpus` is `None` if parsing failed, in which case `error` contains the traceback raised in the worker."""
+    path: str
+    language: str
+    corpus: Optional[HipeCorpus]
+    error: Optional[str]
+
+
+def _parse_dataset(path: str, hipe_format_version: str, mask_nerc: bool, mask_nel: bool) -> DatasetParseResult:
+    """Worker of `parse_datasets`; never raises, so that one faulty file does not abort the others."""
+    language = os.path.basename(os.path.dirname(path))
+    try:
+        corpus = HipeCorpus.from_tsv(mask_nerc=mask_nerc, mask_nel=mask_nel, hipe_format_version=hipe_format_version,
+                                     file_path=path)
+        return DatasetParseResult(path, language, corpus, None)
+    except Exception:
+        return DatasetParseResult(path, language, None, traceback.format_exc())
+
+
+def parse_datasets(base_dir: str, workers: Optional[int] = None, hipe_format_version: str = "v1",
+                   mask_nerc: bool = False, mask_nel: bool = False,
+                   vocabulary: Optional[Vocabulary] = None) -> Dict[str, Dict[str, DatasetParseResult]]:
+    """Parses all the TSV files of a release folder (see `find_datasets_files`) in parallel.
+
+    Each file is parsed to a `HipeCorpus` in a separate process. Corpora are made of a few numpy arrays, which are
+    transferred back to the main process much more efficiently than lists of `HipeDocument`.
+
+    :param base_dir: The release folder, with one sub-folder per language.
+    :param workers: The number of worker processes, defaults to the number of CPUs. With `workers=1`, files are
+        parsed sequentially in the current process.
+    :param hipe_format_version: The HIPE format version of the files, `"v1"` (default) or `"v2"`.
+    :param mask_nerc: See `parse_tsv`.
+    :param mask_nel: See `parse_tsv`.
+    :param vocabulary: If given, all the corpora are re-encoded with this `Vocabulary` once parsed (see
+        `HipeCorpus.share_vocabulary`), so that their codes are comparable.
+    :return: A dict mapping each language to a dict mapping the path of each of its files to a `DatasetParseResult`.
+        Files which could not be parsed have their `error` set instead of their `corpus`.
+    """
+    paths = sorted(find_datasets_files(base_dir))
+    args = (hipe_format_version, mask_nerc, mask_nel)
+
+    if workers == 1:
+        results = [_parse_dataset(path, *args) for path in paths]
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_parse_dataset, path, *args) for path in paths]
+            for path, future in zip(paths, futures):
+                try:
+                    results.append(future.result())
+                except Exception:  # e.g. a worker killed while parsing
+                    language = os.path.basename(os.path.dirname(path))
+                    results.append(DatasetParseResult(path, language, None, traceback.format_exc()))
+
+    datasets = {}
+    for result in results:
+        if vocabulary is not None and result.corpus is not None:
+            result.corpus.share_vocabulary(vocabulary)
+        datasets.setdefault(result.language, {})[result.path] = result
+    return datasets
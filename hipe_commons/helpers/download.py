@@ -0,0 +1,227 @@
+"""Local cache of the tsv files downloaded from urls, see `open_tsv`.
+
+Downloaded files are stored in a directory, keyed by url. A cached file is revalidated with a conditional request
+(`If-None-Match`/`If-Modified-Since`, from the `ETag`/`Last-Modified` headers of its download) each time it is used,
+so that it is only downloaded again if it changed on the server. In offline mode, cached files are used without any
+request.
+
+The cache is opt-in, as `helpers.cache.ParseCache`: by default, urls are streamed from the server each time, and
+nothing is written to disk. It is configured with environment variables:
+    - `HIPE_COMMONS_DOWNLOAD_CACHE=1`: enables the cache.
+    - `HIPE_COMMONS_CACHE_DIR`: the cache directory, downloads going to its `downloads` sub-directory (see
+      `helpers.cache.ParseCache`).
+    - `HIPE_COMMONS_OFFLINE=1`: the offline mode.
+or programmatically, with `set_download_cache` (e.g. `set_download_cache(DownloadCache())`).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import warnings
+from typing import Dict, Optional
+
+from .cache import DEFAULT_CACHE_DIR
+
+DATA_SUFFIX = ".data"
+METADATA_SUFFIX = ".json"
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_CHUNK_SIZE = 1024 ** 2
+# http status codes worth retrying, besides network errors
+_RETRIED_STATUSES = {408, 429, 500, 502, 503, 504}
+# only urls of these schemes are cached, e.g. not `file://` urls
+_CACHED_SCHEMES = ("http", "https")
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    return default if value is None else value.strip().lower() in _TRUE_VALUES
+
+
+class DownloadCache(object):
+    """A directory of downloaded files, keyed by url and revalidated with conditional requests.
+
+    Example:
+        ```
+        cache = DownloadCache()
+        path = cache.fetch(url)  # downloaded on the first call, revalidated on the next ones
+        ```
+
+    :param cache_dir: The directory holding the files. Defaults to the `downloads` sub-directory of the
+        `HIPE_COMMONS_CACHE_DIR` environment variable, or of `~/.cache/hipe_commons`.
+    :param offline: Whether to use cached files without any request, failing for urls which are not cached. Defaults
+        to the `HIPE_COMMONS_OFFLINE` environment variable.
+    :param timeout: The timeout of requests, in seconds.
+    :param retries: The number of retries of requests failing with a network error or a transient http error (e.g.
+        503), with an exponential backoff. If they all fail, the cached file is used, if any.
+    :param backoff: The delay before the first retry, in seconds, doubled at each retry.
+    :param chunk_size: The size of the chunks in which responses are streamed to disk, in bytes.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, offline: Optional[bool] = None,
+                 timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES, backoff: float = 0.5,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.cache_dir = cache_dir or os.path.join(os.environ.get("HIPE_COMMONS_CACHE_DIR", DEFAULT_CACHE_DIR),
+                                                   "downloads")
+        self.offline = _env_flag("HIPE_COMMONS_OFFLINE", False) if offline is None else offline
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def is_cached_url(url: str) -> bool:
+        """Whether `url` goes through the cache, i.e. is an http(s) url."""
+        return urllib.parse.urlsplit(url).scheme.lower() in _CACHED_SCHEMES
+
+    def path(self, url: str) -> str:
+        """The path of the cached file of `url`, which may not exist."""
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest()[:32] + DATA_SUFFIX)
+
+    def _metadata_path(self, url: str) -> str:
+        return self.path(url)[:-len(DATA_SUFFIX)] + METADATA_SUFFIX
+
+    def metadata(self, url: str) -> Optional[Dict[str, Optional[str]]]:
+        """The headers of the cached download of `url` (`etag`, `last_modified`), or `None` if it is not cached."""
+        try:
+            with open(self._metadata_path(url), encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        # the url is checked in case of a (very unlikely) collision of keys
+        if metadata.get("url") != url or not os.path.exists(self.path(url)):
+            return None
+        return metadata
+
+    def fetch(self, url: str) -> str:
+        """Returns the path of the cached file of `url`, downloading it if it is not cached or has changed.
+
+        :raises FileNotFoundError: In offline mode, if `url` is not cached.
+        :raises urllib.error.URLError: If the request fails (after retries) and `url` is not cached, or if the server
+            answers with a non-transient error (e.g. 404).
+        :raises OSError: If the response cannot be downloaded or stored, whether `url` is cached or not.
+        """
+        metadata = self.metadata(url)
+        if self.offline:
+            if metadata is None:
+                raise FileNotFoundError(f"{url} is not in the download cache ({self.cache_dir}), and offline mode "
+                                        f"is on")
+            return self.path(url)
+
+        headers = {}
+        if metadata is not None:
+            if metadata.get("etag"):
+                headers["If-None-Match"] = metadata["etag"]
+            if metadata.get("last_modified"):
+                headers["If-Modified-Since"] = metadata["last_modified"]
+
+        # only request errors fall back to the cached file: errors while downloading or storing the response (e.g. a
+        # dropped connection, or a full disk) are raised
+        try:
+            response = self._request(urllib.request.Request(url, headers=headers))
+        except urllib.error.HTTPError as e:
+            e.close()
+            if e.code == 304 and metadata is not None:  # not modified
+                return self.path(url)
+            if metadata is None or e.code not in _RETRIED_STATUSES:
+                raise
+            warnings.warn(f"Could not revalidate {url} ({e}), using the cached file")
+            return self.path(url)
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            if metadata is None:
+                raise
+            warnings.warn(f"Could not revalidate {url} ({e}), using the cached file")
+            return self.path(url)
+
+        with response:
+            self._store(url, response)
+        return self.path(url)
+
+    def _request(self, request: urllib.request.Request):
+        """Opens `request`, retrying network errors and transient http errors."""
+        for attempt in range(self.retries + 1):
+            try:
+                return urllib.request.urlopen(request, timeout=self.timeout)
+            except urllib.error.HTTPError as e:
+                if e.code not in _RETRIED_STATUSES or attempt == self.retries:
+                    raise
+                e.close()
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def _store(self, url: str, response) -> None:
+        """Streams a response to the cached file of `url`, then records its validators."""
+        for path, write in [
+            (self.path(url), lambda f: shutil.copyfileobj(response, f, self.chunk_size)),
+            (self._metadata_path(url), lambda f: f.write(json.dumps({
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }).encode("utf-8"))),
+        ]:
+            # written to a temporary file first, so that an interrupted download never leaves a truncated file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    write(f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def invalidate(self, url: Optional[str] = None) -> int:
+        """Removes the cached file of `url`, or all the cached files if `url` is `None`.
+
+        :return: The number of removed files.
+        """
+        if url is not None:
+            paths = [self.path(url), self._metadata_path(url)]
+        else:
+            paths = [entry.path for entry in os.scandir(self.cache_dir)
+                     if entry.name.endswith((DATA_SUFFIX, METADATA_SUFFIX))]
+
+        removed = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                removed += path.endswith(DATA_SUFFIX)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def clear(self) -> int:
+        """Removes all the cached files. Same as `invalidate()`."""
+        return self.invalidate()
+
+
+_download_cache = None
+_download_cache_set = False
+
+
+def get_download_cache() -> Optional[DownloadCache]:
+    """Returns the `DownloadCache` used by `open_tsv`, created from the environment variables on first use (see the
+    module docstring), or `None` if it is disabled (the default)."""
+    global _download_cache, _download_cache_set
+    if not _download_cache_set:
+        _download_cache = DownloadCache() if _env_flag("HIPE_COMMONS_DOWNLOAD_CACHE", False) else None
+        _download_cache_set = True
+    return _download_cache
+
+
+def set_download_cache(cache: Optional[DownloadCache]) -> None:
+    """Sets the `DownloadCache` used by `open_tsv`, e.g. `DownloadCache(offline=True)`, or `None` to disable it."""
+    global _download_cache, _download_cache_set
+    _download_cache, _download_cache_set = cache, True
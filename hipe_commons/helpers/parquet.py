@@ -0,0 +1,248 @@
+"""Parquet export and import of HIPE tsv data, for analytics engines (e.g. Spark or DuckDB) and fast loading.
+
+Requires `pyarrow`.
+"""
+
+import json
+from itertools import starmap
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .corpus import HipeCorpus
+from .tsv import (COL_LABELS, COL_LABELS_V2, TSVComment, TSVAnnotation, TSVAnnotation_v2, TSVLine, TSVLine_v2,
+                  HipeDocument, merge_comments)
+
+# Columns holding the position of each row, besides the annotation columns (`COL_LABELS`/`COL_LABELS_V2`)
+DOCUMENT_COLUMN = "document"
+LINE_NUMBER_COLUMN = "n"
+# The commented lines of each document, stored on its first row only
+COMMENTS_COLUMN = "comments"
+
+DEFAULT_ROW_GROUP_SIZE = 128 * 1024
+
+
+def _dictionary_array(codes: np.ndarray, values: np.ndarray, mask: Optional[np.ndarray] = None):
+    """Builds a pyarrow dictionary array of strings, restricting the dictionary to the values in use."""
+    import pyarrow as pa
+
+    used, indices = np.unique(codes, return_inverse=True)
+    indices = pa.array(indices.astype(np.int32), mask=mask)
+    return pa.DictionaryArray.from_arrays(indices, pa.array(values[used].tolist(), type=pa.string()))
+
+
+def _row_group_table(corpus: HipeCorpus, documents: range, labels: List[str], metadata_fields: List[str], schema,
+                     last_values: Dict[str, int]):
+    """Builds the table of a row group made of whole `documents`.
+
+    Documents without annotation lines are kept as a single row with null annotations, so that their comments
+    are preserved.
+
+    :param last_values: The vocabulary id of the last value of each metadata field in the previous row groups,
+        updated with the values of this one.
+    """
+    import pyarrow as pa
+
+    counts = np.diff(corpus.doc_offsets[documents.start:documents.stop + 1]).astype(np.int64)
+    row_counts = np.maximum(counts, 1)
+    n_rows = int(row_counts.sum())
+    first_rows = np.concatenate([[0], np.cumsum(row_counts)[:-1]]).astype(np.int64)
+
+    # index of the annotation line of each row, -1 for the rows of empty documents
+    lines = np.full(n_rows, -1, dtype=np.int64)
+    doc_starts = corpus.doc_offsets[documents.start:documents.stop].tolist()
+    for first_row, start, count in zip(first_rows.tolist(), doc_starts, counts.tolist()):
+        lines[first_row:first_row + count] = np.arange(start, start + count)
+    missing = lines < 0
+    lines[missing] = 0
+
+    def take(array: np.ndarray) -> np.ndarray:
+        # the rows of empty documents point to line 0, which may not exist
+        return array[lines] if len(array) else np.zeros(n_rows, dtype=array.dtype)
+
+    vocabulary = corpus._vocabulary_array
+    arrays = {
+        DOCUMENT_COLUMN: pa.array(np.repeat(np.arange(documents.start, documents.stop, dtype=np.int32), row_counts)),
+        LINE_NUMBER_COLUMN: pa.array(take(corpus.line_numbers).astype(np.int32), mask=missing),
+    }
+
+    start, stop = int(corpus.doc_offsets[documents.start]), int(corpus.doc_offsets[documents.stop])
+    tokens = np.empty(stop - start + 1, dtype=object)
+    tokens[:-1] = corpus.tokens(start, stop)
+    arrays[labels[0]] = pa.array(tokens[np.where(missing, stop - start, lines - start)].tolist(), type=pa.string())
+    for label, column in zip(labels[1:], corpus.columns):
+        codes = take(corpus.codes[column])
+        arrays[label] = _dictionary_array(codes, vocabulary, mask=missing)
+
+    # metadata: each row takes the last value of the field found before it, as in `tsv_to_dataframe`, the rows of
+    # empty documents taking the last value found in the document. Lines and comments are ordered by
+    # (document, line number), packed in a single integer.
+    comment_start = int(corpus.doc_comment_offsets[documents.start])
+    comment_stop = int(corpus.doc_comment_offsets[documents.stop])
+    comment_documents = np.repeat(np.arange(documents.start, documents.stop, dtype=np.int64),
+                                  np.diff(corpus.doc_comment_offsets[documents.start:documents.stop + 1]))
+    comment_keys = (comment_documents << 32) | corpus.comment_line_numbers[comment_start:comment_stop].astype(np.int64)
+    row_keys = (np.repeat(np.arange(documents.start, documents.stop, dtype=np.int64), row_counts) << 32) | \
+        np.where(missing, 2 ** 32 - 1, take(corpus.line_numbers).astype(np.int64))
+    comment_fields = vocabulary[corpus.codes['comment_field'][comment_start:comment_stop]]
+    comment_values = corpus.codes['comment_value'][comment_start:comment_stop].astype(np.int64)
+    for field in metadata_fields:
+        selected = np.flatnonzero(comment_fields == field)
+        # -1 before any value of the field
+        values = np.concatenate([[last_values.get(field, -1)], comment_values[selected]])
+        codes = values[np.searchsorted(comment_keys[selected], row_keys)]
+        if len(selected):
+            last_values[field] = int(values[-1])
+        arrays[field] = _dictionary_array(np.maximum(codes, 0), vocabulary, mask=codes < 0)
+
+    # commented lines, on the first row of each document
+    comment_offsets = corpus.doc_comment_offsets[documents.start:documents.stop + 1].astype(np.int64)
+    comment_counts = np.zeros(n_rows, dtype=np.int64)
+    comment_counts[first_rows] = np.diff(comment_offsets)
+    offsets = np.concatenate([[0], np.cumsum(comment_counts)]).astype(np.int32)
+    comments = corpus.comments(int(comment_offsets[0]), int(comment_offsets[-1]))
+    arrays[COMMENTS_COLUMN] = pa.ListArray.from_arrays(pa.array(offsets), pa.StructArray.from_arrays(
+        [pa.array([c.n for c in comments], type=pa.int32()),
+         pa.array([c.field for c in comments], type=pa.string()),
+         pa.array([c.value for c in comments], type=pa.string())],
+        names=["n", "field", "value"],
+    ))
+
+    return pa.Table.from_arrays([arrays[name] for name in schema.names], schema=schema)
+
+
+def write_parquet(documents: Union[HipeCorpus, Iterable[Union[HipeDocument, List[Union[TSVLine, TSVLine_v2]]]]],
+                  output_path: str, hipe_format_version: str = "v1", row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                  compression: str = "zstd") -> None:
+    """Writes HIPE documents to a parquet file.
+
+    The file has one row per annotation line, with:
+        - `document` and `n`: the position of the document in the input and the line number of the line in the
+          document.
+        - the annotation columns, named as in the tsv (`TOKEN`, `NE-COARSE-LIT`, ...). All but `TOKEN` are
+          dictionary-encoded.
+        - one dictionary-encoded column per commented field (e.g. `hipe2022:document_id`), each row holding the last
+          value of the field found before it, as in `tsv_to_dataframe(keep_comments=True)`.
+        - `comments`: the commented lines of each document (a list of `n`, `field`, `value` structs), on its first row.
+
+    Row groups always contain whole documents, of about `row_group_size` rows in total. The file can be read back
+    with `read_parquet` (as a dataframe) or `read_parquet_documents` (e.g. for `write_tsv`).
+
+    :param documents: A `HipeCorpus`, or `HipeDocument`s, or lists of lines as accepted by `write_tsv`.
+    :param output_path: The path of the parquet file.
+    :param hipe_format_version: The HIPE format version of the documents, `"v1"` (default) or `"v2"`.
+    :param row_group_size: The target number of rows per row group.
+    :param compression: The parquet compression codec.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if isinstance(documents, HipeCorpus):
+        corpus = documents
+        hipe_format_version = corpus.hipe_format_version
+    else:
+        corpus = HipeCorpus.from_documents((
+            document if isinstance(document, HipeDocument) else HipeDocument(None, document, decode_entities=False)
+            for document in documents
+        ), hipe_format_version=hipe_format_version)
+
+    labels = COL_LABELS if hipe_format_version == "v1" else COL_LABELS_V2
+    metadata_fields = list(dict.fromkeys(corpus._vocabulary_array[corpus.codes['comment_field']].tolist()))
+    # fields clashing with other columns can only be found in `comments`
+    metadata_fields = [f for f in metadata_fields if f not in labels + [DOCUMENT_COLUMN, LINE_NUMBER_COLUMN,
+                                                                       COMMENTS_COLUMN]]
+
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema(
+        [(DOCUMENT_COLUMN, pa.int32()), (LINE_NUMBER_COLUMN, pa.int32()), (labels[0], pa.string())] +
+        [(label, dictionary) for label in labels[1:]] +
+        [(field, dictionary) for field in metadata_fields] +
+        [(COMMENTS_COLUMN, pa.list_(pa.struct([("n", pa.int32()), ("field", pa.string()), ("value", pa.string())])))],
+        metadata={"hipe_format_version": hipe_format_version, "metadata_fields": json.dumps(metadata_fields)},
+    )
+
+    with pq.ParquetWriter(output_path, schema, compression=compression) as writer:
+        start, last_values = 0, {}
+        while start < len(corpus):
+            # the smallest number of documents reaching `row_group_size` rows, at least one
+            stop = int(np.searchsorted(corpus.doc_offsets, int(corpus.doc_offsets[start]) + row_group_size,
+                                       side="left"))
+            stop = min(max(stop, start + 1), len(corpus))
+            table = _row_group_table(corpus, range(start, stop), labels, metadata_fields, schema, last_values)
+            writer.write_table(table, row_group_size=max(table.num_rows, 1))
+            start = stop
+
+
+def read_parquet(path: str, columns: Optional[List[str]] = None, dtype_backend: Optional[str] = None) -> pd.DataFrame:
+    """Reads a parquet file written by `write_parquet` into a `pd.DataFrame`, with one row per annotation line.
+
+    Dictionary-encoded columns are loaded as categoricals.
+
+    :param path: The path of the parquet file.
+    :param columns: The columns to load, defaults to all of them but `comments`. Only these columns are read.
+    :param dtype_backend: `None` (default) or `"pyarrow"`, see `tsv_to_dataframe`.
+    """
+    import pyarrow.parquet as pq
+    import pyarrow.compute as pc
+
+    if columns is None:
+        columns = [name for name in pq.read_schema(path).names if name != COMMENTS_COLUMN]
+    # rows of documents without annotation lines have no line number
+    table = pq.read_table(path, columns=columns, filters=pc.field(LINE_NUMBER_COLUMN).is_valid())
+
+    if dtype_backend == "pyarrow":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    elif dtype_backend is None:
+        return table.to_pandas()
+    raise ValueError(f"`dtype_backend` must be None or 'pyarrow', not {dtype_backend!r}")
+
+
+def _column_values(table, name: str) -> List:
+    """Decodes a column to python objects, dictionary-encoded columns sharing one instance per distinct value."""
+    import pyarrow as pa
+
+    column = table.column(name)
+    if not pa.types.is_dictionary(column.type):
+        return column.to_pylist()
+
+    values = []
+    for chunk in column.chunks:
+        dictionary = np.empty(len(chunk.dictionary) + 1, dtype=object)
+        dictionary[:-1] = chunk.dictionary.to_pylist()  # the last value (`None`) is for nulls
+        indices = chunk.indices.fill_null(len(chunk.dictionary)).to_numpy()
+        values.extend(dictionary[indices].tolist())
+    return values
+
+
+def read_parquet_documents(path: str, decode_entities: bool = True) -> List[HipeDocument]:
+    """Reads a parquet file written by `write_parquet` back into `HipeDocument`s, commented lines included.
+
+    `write_tsv([doc._tsv_lines for doc in read_parquet_documents(path)], output_path)` gives back the tsv file.
+
+    :param path: The path of the parquet file.
+    :param decode_entities: See `HipeDocument`.
+    """
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(path)
+    hipe_format_version = schema.metadata[b"hipe_format_version"].decode()
+    labels = COL_LABELS if hipe_format_version == "v1" else COL_LABELS_V2
+    annotation_type = TSVAnnotation if hipe_format_version == "v1" else TSVAnnotation_v2
+
+    table = pq.read_table(path, columns=[DOCUMENT_COLUMN, LINE_NUMBER_COLUMN] + labels + [COMMENTS_COLUMN])
+    document_ids = table.column(DOCUMENT_COLUMN).to_numpy()
+    line_numbers = table.column(LINE_NUMBER_COLUMN).to_pylist()
+    rows = list(zip(line_numbers, *[_column_values(table, label) for label in labels]))
+    comments = table.column(COMMENTS_COLUMN).to_pylist()
+
+    documents = []
+    if not rows:
+        return documents
+    boundaries = np.flatnonzero(np.diff(document_ids)) + 1
+    for start, stop in zip([0] + boundaries.tolist(), boundaries.tolist() + [len(rows)]):
+        annotations = list(starmap(annotation_type, rows[start:stop])) if line_numbers[start] is not None else []
+        document_comments = [TSVComment(c["n"], c["field"], c["value"]) for c in comments[start]]
+        documents.append(HipeDocument(path=path, tsv_lines=merge_comments(annotations, document_comments),
+                                      decode_entities=decode_entities))
+    return documents
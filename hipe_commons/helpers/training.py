@@ -0,0 +1,169 @@
+"""Pytorch utilities to train models on HIPE data, see `tsv_to_torch_dataset`.
+
+Requires `torch`.
+
+Example:
+    ```
+    dataset = tsv_to_torch_dataset('NE-COARSE-LIT', labels_to_ids, tokenizer, path=path)
+    loader = torch.utils.data.DataLoader(
+        dataset,
+        batch_sampler=LengthBucketSampler(dataset.lengths, batch_size=32),
+        collate_fn=DynamicPaddingCollator(pad_token_id=tokenizer.pad_token_id),
+    )
+    ```
+"""
+
+from itertools import chain
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence
+
+import torch
+from torch.nn.utils.rnn import pad_sequence
+
+LABELS_KEY = "labels"
+LABEL_PAD_ID = -100
+
+
+class HipeTorchDataset(torch.utils.data.Dataset):
+    """A custom class to make HIPE-data amenable to pytorch and transformers.
+
+    Examples are stored once and for all as flat tensors, one per field (`input_ids`, `attention_mask`, ...,
+    `labels`), all the examples being concatenated. `offsets[i]:offsets[i + 1]` is the span of the i-th example,
+    so that getting an example only takes views of these tensors, without any copy. Examples are not padded: see
+    `DynamicPaddingCollator` to pad them batch by batch, and `LengthBucketSampler` to batch them by length.
+
+    :param encodings: The tokenized examples, as returned by a tokenizer (e.g. a `BatchEncoding`) or any mapping of
+        field names to lists of lists of ids.
+    :param labels: The labels of the examples (see `tsv_to_torch_dataset`), each of the length of its tokenized
+        example.
+    """
+
+    def __init__(self, encodings: Mapping[str, Sequence[Sequence[int]]], labels: Sequence[Sequence[int]]):
+        lengths = torch.tensor([len(example_labels) for example_labels in labels], dtype=torch.long)
+        self.offsets = torch.zeros(len(lengths) + 1, dtype=torch.long)
+        torch.cumsum(lengths, dim=0, out=self.offsets[1:])
+
+        self.tensors: Dict[str, torch.Tensor] = {}
+        for key, values in list(encodings.items()) + [(LABELS_KEY, labels)]:
+            if isinstance(values, torch.Tensor):
+                values = values.tolist()
+            if [len(v) for v in values] != lengths.tolist():
+                raise ValueError(f"`{key}` is not aligned with the labels")
+            self.tensors[key] = torch.tensor(list(chain.from_iterable(values)), dtype=torch.long)
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, "np.ndarray"], offsets: "np.ndarray") -> "HipeTorchDataset":
+        """Creates a dataset from flat arrays and their offsets, e.g. as returned by `tokenize_and_align`.
+
+        Arrays are shared with the dataset, without copy.
+        """
+        dataset = cls.__new__(cls)
+        dataset.tensors = {key: torch.as_tensor(array) for key, array in arrays.items()}
+        dataset.offsets = torch.as_tensor(offsets)
+        return dataset
+
+    @property
+    def lengths(self) -> torch.Tensor:
+        """The length of each example."""
+        return self.offsets[1:] - self.offsets[:-1]
+
+    @property
+    def labels(self) -> List[torch.Tensor]:
+        """The labels of each example."""
+        return list(torch.split(self.tensors[LABELS_KEY], self.lengths.tolist()))
+
+    def __getitem__(self, idx: int) -> Dict[str, torch.Tensor]:
+        start, stop = self.offsets[idx].item(), self.offsets[idx + 1].item()
+        return {key: tensor[start:stop] for key, tensor in self.tensors.items()}
+
+    def __getitems__(self, indices: List[int]) -> List[Dict[str, torch.Tensor]]:
+        # batched fetching by `DataLoader`, gathering all the offsets at once
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        spans = zip(self.offsets[indices].tolist(), self.offsets[indices + 1].tolist())
+        return [{key: tensor[start:stop] for key, tensor in self.tensors.items()} for start, stop in spans]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class LengthBucketSampler(torch.utils.data.Sampler):
+    """A batch sampler grouping examples of similar lengths, to be passed as `batch_sampler` to a `DataLoader`.
+
+    Examples are shuffled, then split into buckets of `bucket_size` batches. Each bucket is sorted by length and cut
+    into batches, whose order is shuffled again. Batches thus hold examples of similar lengths, which minimizes
+    padding (see `DynamicPaddingCollator`), while staying random from one epoch to the other.
+
+    :param lengths: The length of each example, e.g. `HipeTorchDataset.lengths`.
+    :param batch_size: The number of examples per batch.
+    :param shuffle: Set to `False` to sort the examples by bucket without shuffling them, e.g. for evaluation.
+    :param bucket_size: The number of batches per bucket. The larger, the less padding, but the less random.
+    :param drop_last: Whether to drop the last batch if it is smaller than `batch_size`.
+    :param seed: The seed of the shuffling, combined with the epoch (see `set_epoch`).
+    """
+
+    def __init__(self, lengths: Sequence[int], batch_size: int, shuffle: bool = True, bucket_size: int = 100,
+                 drop_last: bool = False, seed: int = 0):
+        self.lengths = torch.as_tensor(lengths, dtype=torch.long)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """Sets the epoch, so that each epoch gets different batches."""
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[List[int]]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        n = len(self.lengths)
+        indices = torch.randperm(n, generator=generator) if self.shuffle else torch.arange(n)
+
+        batches = []
+        step = self.bucket_size * self.batch_size
+        for start in range(0, n, step):
+            bucket = indices[start:start + step]
+            bucket = bucket[torch.argsort(self.lengths[bucket], descending=True, stable=True)]
+            batches.extend(bucket.split(self.batch_size))
+        # buckets being made of whole batches, only the last batch can be smaller
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+
+        order = torch.randperm(len(batches), generator=generator).tolist() if self.shuffle else range(len(batches))
+        for i in order:
+            yield batches[i].tolist()
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
+
+
+class DynamicPaddingCollator(object):
+    """A `collate_fn` padding the examples of a batch to the length of the longest one, rather than to a fixed length.
+
+    :param pad_token_id: The padding value of `input_ids`, i.e. `tokenizer.pad_token_id`.
+    :param label_pad_id: The padding value of `labels`, ignored by the loss.
+    :param pad_to_multiple_of: If given, batches are padded to a multiple of this length (e.g. 8, for tensor cores).
+    :param pad_values: The padding values of other fields, defaulting to 0 (e.g. for `attention_mask`).
+    """
+
+    def __init__(self, pad_token_id: int = 0, label_pad_id: int = LABEL_PAD_ID, pad_to_multiple_of: Optional[int] = None,
+                 pad_values: Optional[Dict[str, int]] = None):
+        self.pad_values = {"input_ids": pad_token_id, LABELS_KEY: label_pad_id, **(pad_values or {})}
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, examples: List[Dict[str, torch.Tensor]]) -> Dict[str, torch.Tensor]:
+        batch = {}
+        for key in examples[0]:
+            batch[key] = pad_sequence([example[key] for example in examples], batch_first=True,
+                                      padding_value=self.pad_values.get(key, 0))
+
+        if self.pad_to_multiple_of and batch:
+            length = next(iter(batch.values())).shape[1]
+            missing = -length % self.pad_to_multiple_of
+            if missing:
+                batch = {key: torch.nn.functional.pad(tensor, (0, missing), value=self.pad_values.get(key, 0))
+                         for key, tensor in batch.items()}
+        return batch
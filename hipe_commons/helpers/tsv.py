@@ -1,11 +1,24 @@
 import os
 import io
+import operator
+import bisect
+from itertools import starmap, islice, repeat
+from collections import Counter
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
 import urllib.request
-from typing import Set, List, Union, NamedTuple, Dict, Optional
+from typing import Set, List, Union, NamedTuple, Dict, Optional, Iterable, Iterator, TextIO, Tuple
+import numpy as np
 import pandas as pd
 from dataclasses import dataclass
 import dataclasses
 
+from .cache import ParseCache, get_cache, encode_columns, decode_columns
+from .compression import open_input, open_output, decompress_stream
+from .download import DEFAULT_TIMEOUT, get_download_cache
+from .vocabulary import Vocabulary
+
 # ======================================================================================================================
 #                                                       VARIABLES
 # ======================================================================================================================
@@ -48,6 +61,17 @@ NE_ANNOTATION_TYPES = [
     "nested"
 ]
 
+# Attributes holding the NE tag and the NE link of each entity type.
+# Entity components and nested entities don't come with EL info.
+NE_ANNOTATION_COLUMNS = {
+    "coarse_lit": ("ne_coarse_lit", "nel_lit"),
+    "coarse_meto": ("ne_coarse_meto", "nel_meto"),
+    "fine_lit": ("ne_fine_lit", "nel_lit"),
+    "fine_meto": ("ne_fine_meto", "nel_meto"),
+    "fine_comp": ("ne_fine_comp", None),
+    "nested": ("ne_nested", None),
+}
+
 PARTIAL_FLAG = "Partial"
 NO_SPACE_AFTER_FLAG = "NoSpaceAfter"
 END_OF_LINE_FLAG = "EndOfLine"
@@ -55,6 +79,24 @@ END_OF_SENTENCE_FLAG = "EndOfSentence"
 NIL_FLAG = "NIL"
 BLANK_LINE_FLAG = "BLANK_LINE"
 
+# The number of lines parsed at once by `tsv_to_dict`
+COLUMNS_CHUNK_SIZE = 65536
+
+# Columns holding `|`-separated flags, and the value of a flag column left without any flag by masking (v2 marking
+# empty columns with `_`)
+FLAG_FIELDS = ["misc"]
+FLAG_FIELDS_V2 = ["render", "seg", "ocr_info", "misc"]
+NO_FLAGS = ""
+NO_FLAGS_V2 = "_"
+
+# Columns replaced by the mask, and substrings of the flags removed from flag columns, when masking all the ground
+# truth (`mask_all_groundtruth`) or NEL only (`mask_nel_groundtruth`)
+MASK_ALL_FIELDS = ["ne_coarse_lit", "ne_coarse_meto", "ne_fine_lit", "ne_fine_meto", "ne_fine_comp", "ne_nested",
+                   "nel_lit", "nel_meto"]
+MASK_ALL_FLAGS = ("LED", "Reference")
+MASK_NEL_FIELDS = ["ne_nested", "nel_lit", "nel_meto"]
+MASK_NEL_FLAGS = ("LED",)
+
 IOB_FIRST_LINE = "# global.columns = TOKEN NE-COARSE-LIT NE-COARSE-METO NE-FINE-LIT NE-FINE-METO NE-FINE-COMP " \
                  "NE-NESTED NEL-LIT NEL-METO RENDER SEG OCR-INFO MISC"
 
@@ -161,29 +203,112 @@ class HipeEntity(object):
         return f"[{self.tag}] {self.text} ({self.wikidata_id})"
 
 
+class HipeEntities(MutableMapping):
+    """Mapping of entity types to the entities of a document, where each type is decoded the first time it is read.
+
+    Like a plain dict of entities, it only exposes the entity types for which the document contains entities.
+    Checking for (`e_type in entities`) or reading (`entities[e_type]`) a single type only decodes this type, while
+    iterating over the mapping decodes all remaining types at once (see `lines2entities`).
+    """
+
+    def __init__(self, tsv_lines: List[TSVLine | TSVLine_v2], entity_types: Iterable[str] = NE_ANNOTATION_TYPES):
+        self._tsv_lines = tsv_lines
+        self._entity_types = list(entity_types)
+        self._pending = set(self._entity_types)
+        self._entities = {}
+
+    def _decode(self, entity_types: Iterable[str]):
+        entity_types = [e_type for e_type in entity_types if e_type in self._pending]
+        if entity_types:
+            self._entities.update(lines2entities(self._tsv_lines, entity_types))
+            self._pending.difference_update(entity_types)
+
+    def __getitem__(self, e_type: str) -> List[HipeEntity]:
+        if e_type in self._pending:
+            self._decode([e_type])
+        entities = self._entities.get(e_type)
+        if not entities:
+            raise KeyError(e_type)
+        return entities
+
+    def __setitem__(self, e_type: str, entities: List[HipeEntity]):
+        if e_type not in self._entity_types:
+            self._entity_types.append(e_type)
+        self._pending.discard(e_type)
+        self._entities[e_type] = entities
+
+    def __delitem__(self, e_type: str):
+        self[e_type]  # raises a KeyError if there is nothing to delete
+        del self._entities[e_type]
+
+    def __iter__(self) -> Iterator[str]:
+        self._decode(self._entity_types)
+        return iter([e_type for e_type in self._entity_types if self._entities.get(e_type)])
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 class HipeDocument(object):
-    def __init__(self, path, tsv_lines):
+    """A document of a HIPE tsv file.
+
+    Entities (see `HipeEntities`), `n_tokens` and `metadata` are computed on first access only.
+
+    :param path: The path or url of the tsv file containing the document.
+    :param tsv_lines: The parsed lines of the document.
+    :param decode_entities: If `False`, entities are never decoded and `entities` is left empty, which is useful
+        when only the metadata or the tokens of the document are needed.
+    :param raw_lines: The lines of text `tsv_lines` were parsed from, line `n` being `raw_lines[n]` (see
+        `lines2document`), so that `to_tsv` can write untouched lines back as they were. Not kept by default.
+    """
+
+    def __init__(self, path, tsv_lines, decode_entities: bool = True, raw_lines: Optional[List[str]] = None):
         self.path = path
         self._tsv_lines = tsv_lines
-        self.entities = {}
+        self.entities = HipeEntities(tsv_lines) if decode_entities else {}
+        self._raw_lines = raw_lines
+        # the parsed lines, to tell untouched lines from replaced ones
+        self._parsed_lines = tuple(tsv_lines) if raw_lines is not None else ()
 
-        self.n_tokens = sum([
+    def to_tsv(self) -> str:
+        """Serializes the lines of the document, as in the tsv, i.e. joined by line breaks (without a trailing one).
+
+        If the document keeps its raw lines (see `raw_lines`, and `keep_raw_text` in `iter_tsv`), lines which are still
+        the ones it was parsed from are written back exactly as they were read, without formatting. Other lines are
+        formatted, missing (`None`) values being written as `_`.
+
+        ..note:: Lines are told apart by identity: `TSVAnnotation_v2` lines being mutable, lines modified in place
+            must be replaced (e.g. with `dataclasses.replace`) for the modification to be written.
+        """
+        lines, raw_lines = self._tsv_lines, self._raw_lines
+        if raw_lines is None:
+            return "\n".join(map(format_tsv_line, lines))
+
+        if len(lines) == len(self._parsed_lines) and all(map(operator.is_, lines, self._parsed_lines)):
+            return "\n".join([raw_lines[line.n] for line in lines])
+
+        raw_by_id = {id(line): raw_lines[line.n] for line in self._parsed_lines}
+        return "\n".join([raw_by_id[id(line)] if id(line) in raw_by_id else format_tsv_line(line) for line in lines])
+
+    @cached_property
+    def n_tokens(self) -> int:
+        return sum([
             1
             for line in self._tsv_lines
             if not isinstance(line, TSVComment)
         ])
 
-        self.metadata = {
+    @cached_property
+    def metadata(self) -> Dict[str, str]:
+        return {
             line.field: line.value
             for line in self._tsv_lines
             if isinstance(line, TSVComment)
         }
 
-        for e_type in NE_ANNOTATION_TYPES:
-            entities = self._lines2entities(e_type)
-            if entities:
-                self.entities[e_type] = entities
-
     def _lines2entities(self, entity_type: str, hipe_format_version="v1") -> List[HipeEntity]:
         """Parse a token-based entity representation into a `HipeEntity` object.
 
@@ -192,60 +317,7 @@ class HipeDocument(object):
         :return: A list of `HipeEntity` objects.
         :rtype: List[HipeEntity]
         """
-        entities = []
-        line_groups = []
-        current_entity_lines = []
-
-        # 1) identify group of lines, each group corresponding to one entity
-        for line in self._tsv_lines:
-            if isinstance(line, TSVComment):
-                continue
-
-            # depending on the entity type, the NE tag is found in a diff TSV column
-            if entity_type == "coarse_lit":
-                ne_tag = line.ne_coarse_lit
-            elif entity_type == "coarse_meto":
-                ne_tag = line.ne_coarse_meto
-            elif entity_type == "fine_lit":
-                ne_tag = line.ne_fine_lit
-            elif entity_type == "fine_meto":
-                ne_tag = line.ne_fine_meto
-            elif entity_type == "fine_comp":
-                ne_tag = line.ne_fine_comp
-            elif entity_type == "nested":
-                ne_tag = line.ne_nested
-            else:
-                ne_tag = None
-
-            if ne_tag:
-                # beginning of a new entity
-                if ne_tag.startswith('B-'):
-
-                    # case of two consecutive B-* tags
-                    if current_entity_lines:
-                        line_groups.append(current_entity_lines)
-                        current_entity_lines = []
-
-                    current_entity_lines.append(line)
-
-                # continuation of an entity
-                elif ne_tag.startswith('I-'):
-                    current_entity_lines.append(line)
-
-                # O tag
-                else:
-                    if current_entity_lines:
-                        line_groups.append(current_entity_lines)
-                        current_entity_lines = []
-
-        if current_entity_lines:
-            line_groups.append(current_entity_lines)
-
-        # 2) parse line groups into HipeEntity class instances                
-        for group in line_groups:
-            entities.append(lines2entity(group, entity_type, hipe_format_version=hipe_format_version))
-
-        return entities
+        return lines2entities(self._tsv_lines, [entity_type], hipe_format_version=hipe_format_version)[entity_type]
 
 
 # ======================================================================================================================
@@ -265,14 +337,12 @@ def lines2entity(tsv_lines: List[TSVLine | TSVLine_v2], entity_type: str, hipe_f
 
     # reconstruct the entity surface form from its tokens;
     # white space insertion is controlled via the `NoSpaceAfterFlag`
-    # contained in the `Misc` column of the TSV file
-    surface_form = ""
-    for line in tsv_lines:
-        surface_form += line.token
-        if hipe_format_version == "v1" and NO_SPACE_AFTER_FLAG not in line.misc:
-            surface_form += " "
-        if hipe_format_version == "v2" and NO_SPACE_AFTER_FLAG not in line.render:
-            surface_form += " "
+    # contained in the `Misc` column (`Render` column in v2) of the TSV file
+    flags_column = "misc" if hipe_format_version == "v1" else "render"
+    surface_form = "".join([
+        line.token if NO_SPACE_AFTER_FLAG in getattr(line, flags_column) else line.token + " "
+        for line in tsv_lines
+    ])
 
     # keep track of the TSV line numbers over which the entity spans.
     # this information can be useful mostly for diagnostics and debugging.
@@ -282,71 +352,94 @@ def lines2entity(tsv_lines: List[TSVLine | TSVLine_v2], entity_type: str, hipe_f
     ]
 
     # the NE tag and NE link information is contained in different columns
-    # depending on the selected entity_type 
-    if entity_type == "coarse_lit":
-        ne_tag = [
-            line.ne_coarse_lit.split('-')[1]
-            for line in tsv_lines
-        ]
+    # depending on the selected entity_type; both are read from the first line
+    tag_column, link_column = NE_ANNOTATION_COLUMNS[entity_type]
+    ne_tag = getattr(tsv_lines[0], tag_column).split('-')[1]
 
-        ne_link = [
-            line.nel_lit
-            for line in tsv_lines
-        ]
-    elif entity_type == "coarse_meto":
-        ne_tag = [
-            line.ne_coarse_meto.split('-')[1]
-            for line in tsv_lines
-        ]
+    # if the NE link is absent, replace it with `None`
+    ne_link = getattr(tsv_lines[0], link_column) if link_column else None
+    if ne_link == "_":
+        ne_link = None
 
-        ne_link = [
-            line.nel_meto
-            for line in tsv_lines
-        ]
-    elif entity_type == "fine_lit":
-        ne_tag = [
-            line.ne_fine_lit.split('-')[1]
-            for line in tsv_lines
-        ]
+    # now we can build and return the entity object
+    return HipeEntity(surface_form, entity_type, ne_tag, ne_link, line_numbers)
 
-        ne_link = [
-            line.nel_lit
-            for line in tsv_lines
-        ]
-    elif entity_type == "fine_meto":
-        ne_tag = [
-            line.ne_fine_meto.split('-')[1]
-            for line in tsv_lines
-        ]
 
-        ne_link = [
-            line.nel_meto
-            for line in tsv_lines
-        ]
-    elif entity_type == "fine_comp":
-        ne_tag = [
-            line.ne_fine_comp.split('-')[1]
-            for line in tsv_lines
-        ]
+def lines2entities(tsv_lines: List[TSVLine | TSVLine_v2], entity_types: Iterable[str] = NE_ANNOTATION_TYPES,
+                   hipe_format_version="v1") -> Dict[str, List[HipeEntity]]:
+    """Decodes the entities of several types at once, reading the BIO tags of a document in a single pass.
 
-        # entity components don't come with EL info
-        ne_link = None
-    elif entity_type == "nested":
-        ne_tag = [
-            line.ne_nested.split('-')[1]
-            for line in tsv_lines
-        ]
+    :param tsv_lines: The TSV lines of a document.
+    :param entity_types: The entity types to decode (any of the values in `NE_ANNOTATION_TYPES`).
+    :param hipe_format_version: The HIPE format version of the lines, `"v1"` (default) or `"v2"`.
+    :return: A dict mapping each entity type to its (possibly empty) list of `HipeEntity` objects.
+    """
+    entity_types = list(entity_types)
+    if not entity_types:
+        return {}
 
-        # entity components don't come with EL info
-        ne_link = None
+    get_tags = operator.attrgetter(*[NE_ANNOTATION_COLUMNS[e_type][0] for e_type in entity_types])
+    single_type = len(entity_types) == 1
+    # tags of the last line found outside of any entity (e.g. `("O", "_", "O")`)
+    outside_tags = None
 
-    # if the NE link is absent, replace it with `None`
-    if ne_link:
-        ne_link = ne_link[0] if ne_link[0] != "_" else None
+    # 1) identify group of lines, each group corresponding to one entity
+    line_groups = [[] for _ in entity_types]
+    current_entity_lines = [None for _ in entity_types]
+    n_open = 0  # number of entity types with an entity being read
+
+    for line in tsv_lines:
+        if isinstance(line, TSVComment):
+            continue
+
+        tags = get_tags(line)
+        if single_type:
+            tags = (tags,)
 
-    if ne_tag:
-        # now we can build and return the entity object
-        return HipeEntity(surface_form, entity_type, ne_tag[0], ne_link, line_numbers)
+        # most tokens are outside of any entity and carry the same tags, there is nothing to do for them
+        if not n_open and tags == outside_tags:
+            continue
+
+        for i, ne_tag in enumerate(tags):
+            if not ne_tag:
+                continue
+
+            # beginning of a new entity (possibly right after another one)
+            if ne_tag.startswith('B-'):
+                if current_entity_lines[i]:
+                    line_groups[i].append(current_entity_lines[i])
+                else:
+                    n_open += 1
+                current_entity_lines[i] = [line]
+
+            # continuation of an entity
+            elif ne_tag.startswith('I-'):
+                if current_entity_lines[i]:
+                    current_entity_lines[i].append(line)
+                else:
+                    n_open += 1
+                    current_entity_lines[i] = [line]
+
+            # O tag
+            elif current_entity_lines[i]:
+                line_groups[i].append(current_entity_lines[i])
+                current_entity_lines[i] = None
+                n_open -= 1
+
+        if not n_open:
+            outside_tags = tags
+
+    # 2) parse line groups into HipeEntity class instances
+    entities = {}
+    for i, e_type in enumerate(entity_types):
+        if current_entity_lines[i]:
+            line_groups[i].append(current_entity_lines[i])
+        entities[e_type] = [
+            lines2entity(group, e_type, hipe_format_version=hipe_format_version)
+            for group in line_groups[i]
+        ]
+
+    return entities
 
 
 def find_datasets_files(base_dir: str) -> List[str]:
@@ -378,7 +471,7 @@ def find_missing_iiif_links(input_tsv_file: str) -> Set[str]:
     """
 
     missing_links = set()
-    with open(input_tsv_file, "r") as f:
+    with open_tsv(path=input_tsv_file) as f:
 
         doc_sections = f.read().split("\n\n")
 
@@ -411,7 +504,7 @@ def is_tsv_complete(dataset_path: str, expected_doc_ids: List[str]) -> bool: #TO
     :return: Returns `True` if the file is complete, otherwise `False`.
     :rtype: bool
     """
-    with open(dataset_path, "r") as f:
+    with open_tsv(path=dataset_path) as f:
         tsv_doc_ids = [
             line.strip().split("=")[-1].strip()
             for line in f.readlines()
@@ -429,59 +522,173 @@ def is_tsv_complete(dataset_path: str, expected_doc_ids: List[str]) -> bool: #TO
 
 
 def get_tsv_data(path: Optional[str] = None, url: Optional[str] = None) -> str:
-    """Fetches tsv data from a path or an url."""
+    """Fetches tsv data from a path or an url, decompressing it if needed (see `open_tsv`)."""
+
+    assert path or url, """`path` or `url` must be provided"""
+
+    with open_tsv(path=path, url=url) as f:
+        return f.read()
+
+
+def open_tsv(path: Optional[str] = None, url: Optional[str] = None) -> TextIO:
+    """Opens a tsv file or an url as a text stream, to be read line by line.
+
+    Unlike `get_tsv_data`, the content is never loaded into memory at once. Line endings are handled exactly as in
+    `get_tsv_data`. The caller is responsible for closing the returned stream.
+
+    Compressed files (`gzip`, `bz2` or `xz`, detected from their first bytes, see `helpers.compression`) are
+    decompressed on the fly.
+
+    If the download cache is enabled (see `helpers.download`), http(s) urls are downloaded to it, and only downloaded
+    again if they changed on the server. Otherwise (the default), the response is streamed as it is received.
+    """
 
     assert path or url, """`path` or `url` must be provided"""
 
     if url:
-        response = urllib.request.urlopen(url)
-        return response.read().decode('utf-8')
+        download_cache = get_download_cache()
+        if download_cache is not None and download_cache.is_cached_url(url):
+            return io.TextIOWrapper(open_input(download_cache.fetch(url)), encoding='utf-8', newline='\n')
+        response = urllib.request.urlopen(url, timeout=DEFAULT_TIMEOUT)
+        return io.TextIOWrapper(decompress_stream(response), encoding='utf-8', newline='\n')
 
     elif path:
-        with open(path) as f:
-            return f.read()
+        return io.TextIOWrapper(open_input(path))
+
+
+def iter_tsv_chunks(lines: Iterable[str]) -> Iterator[List[str]]:
+    """Groups the lines of a tsv stream into documents, i.e. chunks of lines separated by a blank line.
+
+    Chunks are identical to the ones obtained by splitting the whole file content on `"\\n\\n"`, so that
+    line numbers (i.e. positions in the chunk) are preserved. Only one chunk is held in memory at a time.
+
+    :param lines: An iterable of lines, including their trailing `"\\n"` (e.g. an open text file).
+    :return: An iterator over lists of lines, without line endings.
+    """
+    chunk = []
+    for line in lines:
+        if line.endswith("\n"):
+            line = line[:-1]
+            # a blank line closes the current document, unless it directly follows another boundary
+            if line == "" and chunk:
+                yield chunk
+                chunk = []
+                continue
+        chunk.append(line)
 
+    yield chunk
 
-def parse_tsv(mask_nerc: bool = False, mask_nel: bool = False, hipe_format_version="v1", **kwargs) -> List[
-    HipeDocument]:
 
-    if "file_url" in kwargs and kwargs['file_url']:
+def lines2document(lines: List[str], path: Optional[str] = None, mask_nerc: bool = False, mask_nel: bool = False,
+                   hipe_format_version: str = "v1", decode_entities: bool = True,
+                   vocabulary: Optional[Vocabulary] = None, keep_raw_text: bool = False) -> HipeDocument:
+    """Parses the lines of a single document (see `iter_tsv_chunks`) into a `HipeDocument`.
+
+    Column headers and empty lines are skipped, but still count in the line numbering. With `keep_raw_text`, the
+    document keeps `lines` (unless masked), see `HipeDocument.to_tsv`.
+    """
+    columns, comments = parse_columns(lines, hipe_format_version=hipe_format_version, vocabulary=vocabulary)
+    annotation_type = TSVAnnotation if hipe_format_version == "v1" else TSVAnnotation_v2
+    annotations = list(starmap(annotation_type, zip(*columns.values())))
+
+    if mask_nerc and mask_nel:
+        annotations = list(map(mask_all_groundtruth, annotations))
+    elif mask_nel:
+        annotations = list(map(mask_nel_groundtruth, annotations))
+
+    return HipeDocument(path=path, tsv_lines=merge_comments(annotations, comments), decode_entities=decode_entities,
+                        raw_lines=lines if keep_raw_text and not (mask_nerc or mask_nel) else None)
+
+
+def read_tsv_chunks(**kwargs) -> Iterator[Tuple[Optional[str], List[str]]]:
+    """Reads a HIPE-compliant tsv document by document, see `iter_tsv` for the accepted arguments.
+
+    :return: An iterator over `(path, lines)` tuples, one per document (see `iter_tsv_chunks`).
+    """
+
+    if kwargs.get('file'):
+        f = kwargs['file']
+        file_path = getattr(f, 'name', None)
+        for chunk in iter_tsv_chunks(f):
+            yield file_path, chunk
+        return
+
+    if kwargs.get('file_url'):
         file_path = kwargs['file_url']
-        tsv_data = get_tsv_data(url=file_path)
+        f = open_tsv(url=file_path)
 
-    elif "file_path" in kwargs and kwargs['file_path']:
+    elif kwargs.get('file_path'):
         file_path = kwargs['file_path']
-        tsv_data = get_tsv_data(path=file_path)
+        f = open_tsv(path=file_path)
 
     else:
-        raise
+        raise ValueError("One of `file_path`, `file_url` or `file` must be provided")
+
+    with f:
+        for chunk in iter_tsv_chunks(f):
+            yield file_path, chunk
+
+
+def iter_tsv(mask_nerc: bool = False, mask_nel: bool = False, hipe_format_version: str = "v1",
+             decode_entities: bool = True, vocabulary: Optional[Vocabulary] = None, keep_raw_text: bool = False,
+             **kwargs) -> Iterator[HipeDocument]:
+    """Lazily parses a HIPE-compliant tsv, yielding each `HipeDocument` as soon as it has been read.
+
+    The file is read line by line, so that memory stays bounded by the size of the largest document.
+
+    `kwargs` must contain one of these three possible values:
+    - `file_path` (`str`)
+    - `file_url` (`str`)
+    - `file` (an open text stream, which is not closed by this function)
+
+    :param mask_nerc: Whether to mask NERC and NEL annotations (see `mask_all_groundtruth`).
+    :param mask_nel: Whether to mask NEL annotations (see `mask_nel_groundtruth`).
+    :param hipe_format_version: The HIPE format version of the file, `"v1"` (default) or `"v2"`.
+    :param decode_entities: Set to `False` to skip entity decoding altogether (see `HipeDocument`).
+    :param vocabulary: A `Vocabulary` through which all the values of annotation lines (tokens, tags, NEL ids and
+        flags) are interned, so that equal values share a single instance across documents (see `parse_columns`).
+    :param keep_raw_text: Whether documents keep the lines of text they were parsed from, so that `to_tsv` writes
+        untouched lines back exactly as they were read, at the cost of holding that text in memory.
+    :return: An iterator over `HipeDocument` objects.
+    """
 
-    if hipe_format_version == "v1":
-        documents = [
-            HipeDocument(
-                path=file_path,
-                tsv_lines=[
-                    parse_tsv_line(line, line_number, mask_nerc, mask_nel, hipe_format_version=hipe_format_version)
-                    for line_number, line in enumerate(document.split("\n"))
-                    if line.split('\t') != COL_LABELS and line != ""
-                ]
-            )
-            for document in tsv_data.split("\n\n")
-        ]
-        return documents
-    elif hipe_format_version == "v2":
-        documents = [
-            HipeDocument(
-                path=file_path,
-                tsv_lines=[
-                    parse_tsv_line(line, line_number, mask_nerc, mask_nel, hipe_format_version=hipe_format_version)
-                    for line_number, line in enumerate(document.split("\n"))
-                    if line.split('\t') != COL_LABELS_V2 and line != ""
-                ]
-            )
-            for document in tsv_data.split("\n\n")
-        ]
-        return documents
+    for file_path, chunk in read_tsv_chunks(**kwargs):
+        yield lines2document(chunk, file_path, mask_nerc, mask_nel, hipe_format_version=hipe_format_version,
+                             decode_entities=decode_entities, vocabulary=vocabulary, keep_raw_text=keep_raw_text)
+
+
+def parse_tsv(mask_nerc: bool = False, mask_nel: bool = False, hipe_format_version="v1", decode_entities: bool = True,
+              cache: Union[bool, ParseCache, None] = None, vocabulary: Optional[Vocabulary] = None,
+              **kwargs) -> List[HipeDocument]:
+    """Parses a HIPE-compliant tsv into a list of `HipeDocument`. See `iter_tsv` for the other accepted arguments.
+
+    :param cache: `True` (default cache) or a `ParseCache` to load the parsed file from an on-disk cache, and to store
+        it there on a cache miss. Only applies to `file_path`. Documents are then backed by the cached `HipeCorpus`,
+        each one creating its lines the first time they are read, and never keep their raw text (see `iter_tsv`).
+    :param vocabulary: See `iter_tsv`. With `cache`, only annotation values are interned, tokens being decoded from
+        the cached `HipeCorpus`.
+    """
+
+    cache = get_cache(cache)
+    if cache is not None and kwargs.get('file_path') and not (kwargs.get('file') or kwargs.get('file_url')):
+        from .corpus import HipeCorpus
+
+        file_path = kwargs['file_path']
+        key = cache.key(file_path, function="parse_tsv", hipe_format_version=hipe_format_version,
+                        mask_nerc=mask_nerc, mask_nel=mask_nel)
+        corpus = cache.get(key)
+        if corpus is None:
+            corpus = HipeCorpus.from_tsv(mask_nerc=mask_nerc, mask_nel=mask_nel,
+                                         hipe_format_version=hipe_format_version, file_path=file_path)
+            cache.put(key, corpus)
+        if vocabulary is not None:
+            corpus.share_vocabulary(vocabulary)
+
+        # documents only create their lines from the corpus when they are read
+        return [corpus.document(i, decode_entities=decode_entities) for i in range(len(corpus))]
+
+    return list(iter_tsv(mask_nerc=mask_nerc, mask_nel=mask_nel, hipe_format_version=hipe_format_version,
+                         decode_entities=decode_entities, vocabulary=vocabulary, **kwargs))
 
 
 def is_comment(line: str) -> bool:
@@ -495,14 +702,14 @@ def parse_comment(comment_line: str, line_number: int) -> TSVComment:
     :param int line_number: Description of parameter `line_number`.
     :return: Description of returned object.
     :rtype: TSVComment
+    :raises ValueError: If the line is not made of exactly one key and one value, separated by `=`.
 
     """
     try:
         key, value = [el.strip() for el in comment_line.replace("#", "").split("=")]
-    except:
-        import ipdb
-
-        ipdb.set_trace()
+    except ValueError:
+        raise ValueError(f"Malformed commented line (n={line_number}), expected `# key = value`: {comment_line!r}") \
+            from None
 
     return TSVComment(n=line_number, field=key, value=value)
 
@@ -563,100 +770,437 @@ def parse_tsv_line(line: str, line_number: int, mask_nerc: bool = False, mask_ne
             return ann
 
 
-def mask_all_groundtruth(annotation: TSVAnnotation, mask: str = "_") -> TSVAnnotation:
+def _annotation_fields(hipe_format_version: str) -> List[str]:
+    """The attributes of annotation lines, `n` excluded, in the order of the columns."""
+    if hipe_format_version == "v1":
+        return list(TSVAnnotation._fields[1:])
+    elif hipe_format_version == "v2":
+        return [f.name for f in dataclasses.fields(TSVAnnotation_v2)][1:]
+    raise ValueError(f"Unknown HIPE format version: {hipe_format_version}")
+
+
+def parse_columns(lines: List[str], hipe_format_version: str = "v1", vocabulary: Optional[Vocabulary] = None,
+                  skip_headers: bool = True,
+                  fields: Optional[List[str]] = None) -> Tuple[Dict[str, List], List[TSVComment]]:
+    """Bulk counterpart of `parse_tsv_line`, parsing all the lines of a document (or any buffer) at once.
+
+    Annotation lines are split all together and their values are directly gathered into columns. Rows with a missing
+    or extra value and commented lines are handled separately. The results are exactly the same as with
+    `parse_tsv_line`: missing values are `None` and extra values are ignored. As in `lines2document`, column headers
+    and empty lines are skipped, but still count in the line numbering.
+
+    :param lines: The lines to parse, without line endings.
+    :param hipe_format_version: The HIPE format version of the lines, `"v1"` (default) or `"v2"`.
+    :param vocabulary: If given, the values of all columns but `n` are interned through this `Vocabulary`.
+    :param skip_headers: Set to `False` to parse column headers as annotation lines, as `parse_tsv_line` does.
+    :param fields: The attributes to gather into columns (e.g. `['token', 'ne_coarse_lit']`), defaults to all of
+        them. `n` is always included.
+    :return: A tuple `(columns, comments)`, `columns` mapping each attribute of `TSVAnnotation` (`TSVAnnotation_v2`
+        in v2), `n` included, to its values, and `comments` being the list of `TSVComment`.
+    """
+    all_fields = _annotation_fields(hipe_format_version)
+    header = "\t".join(COL_LABELS if hipe_format_version == "v1" else COL_LABELS_V2)
+    n_values = len(all_fields)
+    if fields is None:
+        fields = all_fields
+    unknown = [field for field in fields if field not in all_fields]
+    if unknown:
+        raise KeyError(unknown[0])
+    # positions of the requested fields in the lines
+    indices = [all_fields.index(field) for field in fields]
+    if not skip_headers:
+        header = None
+
+    line_numbers = [
+        line_number
+        for line_number, line in enumerate(lines)
+        if line and line[0] != "#" and line != header
+    ]
+    comments = []
+    if len(line_numbers) != len(lines):
+        # rare branch: commented lines, and lines starting with `#` without being comments
+        for line_number, line in enumerate(lines):
+            if line and line[0] == "#" and line != header:
+                if is_comment(line):
+                    comments.append(parse_comment(line, line_number))
+                else:
+                    line_numbers.append(line_number)
+        line_numbers.sort()
+        annotation_lines = [lines[line_number] for line_number in line_numbers]
+    else:
+        annotation_lines = lines
+
+    if set(map(operator.methodcaller('count', '\t'), annotation_lines)) <= {n_values - 1}:
+        values = "\t".join(annotation_lines).split("\t") if annotation_lines else []
+        columns = [values[i::n_values] for i in indices]
+    else:
+        # rare branch: rows with missing or extra values
+        rows = [line.split("\t")[:n_values] for line in annotation_lines]
+        columns = [[row[i] if i < len(row) else None for row in rows] for i in indices]
+
+    if vocabulary is not None:
+        columns = list(map(vocabulary.intern_all, columns))
+
+    return dict(zip(['n'] + list(fields), [line_numbers] + columns)), comments
+
+
+def merge_comments(annotations: List[Union[TSVAnnotation, TSVAnnotation_v2]],
+                   comments: List[TSVComment]) -> List[Union[TSVLine, TSVLine_v2]]:
+    """Merges annotation and commented lines, both sorted by line number, back into a single list of lines."""
+    if not comments:
+        return annotations
+
+    line_numbers = [annotation.n for annotation in annotations]
+    lines, previous_position = [], 0
+    for comment in comments:
+        position = bisect.bisect_left(line_numbers, comment.n, lo=previous_position)
+        lines.extend(annotations[previous_position:position])
+        lines.append(comment)
+        previous_position = position
+    lines.extend(annotations[previous_position:])
+    return lines
+
+
+def _filter_flags(value: Optional[str], flags: Tuple[str, ...], no_flags: str = NO_FLAGS) -> Optional[str]:
+    """Removes the flags of a `|`-separated `value` which contain any of the substrings `flags`, returning `no_flags`
+    if none is left."""
+    if value is None:
+        return value
+    return "|".join([flag for flag in value.split("|") if not any(substring in flag for substring in flags)]) or \
+        no_flags
+
+
+def _mask_annotation(annotation: Union[TSVAnnotation, TSVAnnotation_v2], fields: List[str], flags: Tuple[str, ...],
+                     mask: str) -> Union[TSVAnnotation, TSVAnnotation_v2]:
+    """Replaces the values of `fields` with `mask` and filters the flags of an annotation, keeping its type."""
+    if isinstance(annotation, TSVAnnotation):
+        flag_fields, no_flags = FLAG_FIELDS, NO_FLAGS
+    else:
+        flag_fields, no_flags = FLAG_FIELDS_V2, NO_FLAGS_V2
+    changes = {field: mask for field in fields}
+    changes.update({field: _filter_flags(getattr(annotation, field), flags, no_flags) for field in flag_fields})
+    if isinstance(annotation, TSVAnnotation):
+        return annotation._replace(**changes)
+    return dataclasses.replace(annotation, **changes)
+
+
+def mask_all_groundtruth(annotation: Union[TSVAnnotation, TSVAnnotation_v2],
+                         mask: str = "_") -> Union[TSVAnnotation, TSVAnnotation_v2]:
     """Hides annotations from an input annotation.
 
     This is used when preparing the test data for the shared task competition.
-    Only neutral fields are kept (`token` and `misc`), while all the rest is
-    replaced with the `mask` character
-    """
-
-    misc = annotation.misc
-    misc_values = misc.split("|")
-    masked_misc = "|".join(
-        [
-            value 
-            for value in misc_values 
-            if (
-                "LED" not in value and
-                "Reference" not in value
-            ) 
-        ]
-    )
-
-    masked_annotation = TSVAnnotation(
-        n=annotation.n,
-        token=annotation.token,
-        ne_coarse_lit=mask,
-        ne_coarse_meto=mask,
-        ne_fine_lit=mask,
-        ne_fine_meto=mask,
-        ne_fine_comp=mask,
-        ne_nested=mask,
-        nel_lit=mask,
-        nel_meto=mask,
-        misc=masked_misc,
-    )
-    return masked_annotation
+    Only neutral fields are kept (`token` and flags), while all the rest is
+    replaced with the `mask` character. `LED` and `Reference` flags are removed from
+    `misc` (and from `render`, `seg` and `ocr_info` in v2, the annotation staying a `TSVAnnotation_v2`, and flag
+    columns left without any flag being `_`).
+    """
+    return _mask_annotation(annotation, MASK_ALL_FIELDS, MASK_ALL_FLAGS, mask)
 
 
-def mask_nel_groundtruth(annotation: TSVAnnotation, mask: str = "_") -> TSVAnnotation:
+def mask_nel_groundtruth(annotation: Union[TSVAnnotation, TSVAnnotation_v2],
+                         mask: str = "_") -> Union[TSVAnnotation, TSVAnnotation_v2]:
     """Hides only NEL annotations from an input annotation.
 
     This is used when preparing the test data for bundle 5 of the shared task competition.
-    Only NERC-related + neutral fields are kept (`token` and `misc`), while all the rest is
-    replaced with the `mask` character.
-    """
-    misc = annotation.misc
-    misc_values = misc.split("|")
-    masked_misc = "|".join([value for value in misc_values if "LED" not in value])
-
-    masked_annotation = TSVAnnotation(
-        n=annotation.n,
-        token=annotation.token,
-        ne_coarse_lit=annotation.ne_coarse_lit,
-        ne_coarse_meto=annotation.ne_coarse_meto,
-        ne_fine_lit=annotation.ne_fine_lit,
-        ne_fine_meto=annotation.ne_fine_meto,
-        ne_fine_comp=annotation.ne_fine_comp,
-        ne_nested=mask,
-        nel_lit=mask,
-        nel_meto=mask,
-        misc=masked_misc,
-    )
-    return masked_annotation
+    Only NERC-related + neutral fields are kept (`token` and flags), while all the rest is
+    replaced with the `mask` character. `LED` flags are removed as in `mask_all_groundtruth`.
+    """
+    return _mask_annotation(annotation, MASK_NEL_FIELDS, MASK_NEL_FLAGS, mask)
+
+
+def _masking(mask_nerc: bool, mask_nel: bool) -> Optional[Tuple[List[str], Tuple[str, ...]]]:
+    """The masked fields and flags, as in `parse_tsv_line`: NERC is only masked along with NEL."""
+    if mask_nerc and mask_nel:
+        return MASK_ALL_FIELDS, MASK_ALL_FLAGS
+    elif mask_nel:
+        return MASK_NEL_FIELDS, MASK_NEL_FLAGS
+    return None
+
+
+def mask_lines(lines: List[str], mask_nerc: bool = True, mask_nel: bool = True, hipe_format_version: str = "v1",
+               mask: str = "_") -> List[str]:
+    """Bulk counterpart of `mask_all_groundtruth` and `mask_nel_groundtruth`, masking raw tsv lines.
+
+    Annotation lines are split all together, as in `parse_columns`: masked columns are replaced at once, flag columns
+    are filtered, and the lines are joined back, without creating any `TSVAnnotation`. Comments, column headers and
+    empty lines are kept as is, as are the values of lines with missing or extra values, masked columns aside.
+
+    :param lines: The lines to mask, without line endings.
+    :param mask_nerc: Whether to mask NERC and NEL annotations (see `mask_all_groundtruth`).
+    :param mask_nel: Whether to mask NEL annotations (see `mask_nel_groundtruth`).
+    :param hipe_format_version: The HIPE format version of the lines, `"v1"` (default) or `"v2"`.
+    :param mask: The value of masked columns.
+    :return: The masked lines.
+    """
+    all_fields = _annotation_fields(hipe_format_version)
+    masking = _masking(mask_nerc, mask_nel)
+    if masking is None:
+        return list(lines)
+    fields, flags = masking
+    n_values = len(all_fields)
+    # positions of the values in the lines, `token` being the first one
+    masked = [all_fields.index(field) for field in fields]
+    flagged = [all_fields.index(field) for field in (FLAG_FIELDS if hipe_format_version == "v1" else FLAG_FIELDS_V2)]
+    no_flags = NO_FLAGS if hipe_format_version == "v1" else NO_FLAGS_V2
+    # column headers, the v2 `IOB_FIRST_LINE` being kept as a commented line
+    header = "\t".join(COL_LABELS if hipe_format_version == "v1" else COL_LABELS_V2)
+
+    positions = [
+        line_number
+        for line_number, line in enumerate(lines)
+        if line and line != header and not (line[0] == "#" and "=" in line)
+    ]
+    annotation_lines = [lines[line_number] for line_number in positions]
+
+    if set(map(operator.methodcaller('count', '\t'), annotation_lines)) <= {n_values - 1}:
+        values = "\t".join(annotation_lines).split("\t") if annotation_lines else []
+        columns = [values[i::n_values] for i in range(n_values)]
+        for i in masked:
+            columns[i] = repeat(mask)
+        for i in flagged:
+            # flag columns hold few distinct values, each filtered once
+            filtered = {value: _filter_flags(value, flags, no_flags) for value in set(columns[i])}
+            columns[i] = list(map(filtered.__getitem__, columns[i]))
+        masked_lines = list(map("\t".join, zip(*columns)))
+    else:
+        # rare branch: rows with missing or extra values
+        masked_lines = []
+        for line in annotation_lines:
+            row = line.split("\t")
+            for i in masked:
+                if i < len(row):
+                    row[i] = mask
+            for i in flagged:
+                if i < len(row):
+                    row[i] = _filter_flags(row[i], flags, no_flags)
+            masked_lines.append("\t".join(row))
+
+    lines = list(lines)
+    for line_number, line in zip(positions, masked_lines):
+        lines[line_number] = line
+    return lines
+
+
+def mask_tsv_file(input_path: str, output_path: str, mask_nerc: bool = True, mask_nel: bool = True,
+                  hipe_format_version: str = "v1", mask: str = "_", chunk_size: int = COLUMNS_CHUNK_SIZE) -> str:
+    """Masks a tsv file into another, e.g. to prepare a test set, see `mask_lines`.
+
+    The file is streamed by chunks of `chunk_size` lines, without building documents. Apart from the masked columns
+    and flags, the output is identical to the input. Both files can be compressed (see `open_tsv` and `TSVWriter`).
+
+    :return: `output_path`.
+    """
+    with open_tsv(path=input_path) as f, open_output(output_path, encoding="utf-8", buffer_size=1024 ** 2) as output:
+        while True:
+            chunk = list(islice(f, chunk_size))
+            if not chunk:
+                break
+            # the last line of the chunk ends with `"\n"`, except maybe at the end of the file, so that the trailing
+            # empty string of the split gives the line ending back when joining
+            lines = "".join(chunk).split("\n")
+            output.write("\n".join(mask_lines(lines, mask_nerc=mask_nerc, mask_nel=mask_nel,
+                                              hipe_format_version=hipe_format_version, mask=mask)))
+    return output_path
+
+
+def mask_tsv_files(files: Union[Mapping[str, str], Iterable[Tuple[str, str]]], num_proc: Optional[int] = None,
+                   **kwargs) -> List[str]:
+    """Masks several tsv files in parallel, see `mask_tsv_file`.
+
+    Example:
+        ```
+        files = {path: path.replace('.tsv', '_masked.tsv') for path in find_datasets_files(base_dir)}
+        mask_tsv_files(files, hipe_format_version="v2", mask_nerc=False, mask_nel=True)
+        ```
+
+    :param files: A mapping of input paths to output paths, or `(input_path, output_path)` tuples.
+    :param num_proc: The number of worker processes, defaults to the number of CPUs. With `num_proc=1`, files are
+        masked sequentially in the current process.
+    :param kwargs: Passed to `mask_tsv_file`, e.g. `mask_nerc`, `mask_nel` or `hipe_format_version`.
+    :return: The output paths.
+    """
+    files = list(files.items() if isinstance(files, Mapping) else files)
+    if num_proc == 1 or len(files) <= 1:
+        return [mask_tsv_file(input_path, output_path, **kwargs) for input_path, output_path in files]
+
+    with ProcessPoolExecutor(max_workers=num_proc) as executor:
+        futures = [executor.submit(mask_tsv_file, input_path, output_path, **kwargs)
+                   for input_path, output_path in files]
+        return [future.result() for future in futures]
 
 
-def write_tsv(documents: List[List[TSVLine]], output_path: str, hipe_format_version: str = "v1") -> None:
+def format_tsv_line(line: Union[TSVLine, TSVLine_v2]) -> str:
+    """Formats a line as in the tsv, i.e. same as `str(line)`, but writing missing (`None`) values as `_`.
+
+    `TSVAnnotation` values are joined at once, which is faster than the f-string of `__repr__`. The f-string of
+    `TSVAnnotation_v2.__repr__` is faster than any other formatting of a dataclass, its values only being joined when
+    it may contain missing values.
+    """
+    if type(line) is TSVAnnotation:
+        try:
+            return "\t".join(line[1:])
+        except TypeError:  # missing (`None`) values
+            return "\t".join(["_" if value is None else value for value in line[1:]])
+    text = str(line)
+    if type(line) is TSVAnnotation_v2 and "None" in text:
+        return "\t".join(["_" if value is None else value for value in _get_v2_values(line)])
+    return text
+
+
+_get_v2_values = operator.attrgetter(*[field.name for field in dataclasses.fields(TSVAnnotation_v2)][1:])
+
+
+class TSVWriter(object):
+    """Writes HIPE documents to a tsv file one by one, through a buffered handle, with the appropriate hipe headers.
+
+    Example:
+        ```
+        with TSVWriter("output.tsv", hipe_format_version="v2") as writer:
+            for doc in iter_tsv(hipe_format_version="v2", file_path="input.tsv"):
+                writer.write_document(predict(doc))
+        ```
+
+    The output is the same as with `write_tsv`, which accepts all the documents at once. The header line (the column
+    labels in v1, the `# global.columns` comment in v2) is not repeated if the first document already starts with it,
+    as do v2 documents parsed from a file.
+
+    :param output: The path of the file to write, or an open text stream (which is not closed by the writer).
+    :param hipe_format_version: which version of hipe format to serialise to. "v1" (default) or "v2"
+    :param buffer_size: The size of the write buffer, in bytes.
+    :param compression: The compression of the file, `"gzip"`, `"bz2"`, `"xz"` or `None`. Inferred by default from
+        the extension of `output` (e.g. `.tsv.gz`), see `helpers.compression.open_output`.
+    """
+
+    def __init__(self, output: Union[str, TextIO], hipe_format_version: str = "v1", buffer_size: int = 1024 ** 2,
+                 compression: Optional[str] = "infer"):
+        if isinstance(output, str):
+            self._file = open_output(output, compression, buffer_size=buffer_size, encoding="utf-8")
+            self._close_file = True
+        else:
+            self._file, self._close_file = output, False
+        self.n_documents = 0
+
+        # written along with the first document
+        self._preamble = "\t".join(COL_LABELS) if hipe_format_version == "v1" else f"{IOB_FIRST_LINE}"
+
+    def write_document(self, document: Union[HipeDocument, List[Union[TSVLine, TSVLine_v2]]]) -> None:
+        """Writes a document (see `HipeDocument.to_tsv`) or the lines of a document, separated from the previous one
+        by a blank line."""
+        if isinstance(document, HipeDocument):
+            self.write_text(document.to_tsv())
+        else:
+            self.write_text("\n".join(map(format_tsv_line, document)))
+
+    def write_text(self, text: str) -> None:
+        """Writes a document given as its tsv text, i.e. its lines joined by line breaks (without a trailing one)."""
+        if self._preamble is not None:
+            self._write_preamble(skip=text == self._preamble or text.startswith(self._preamble + "\n"))
+        else:
+            self._file.write("\n\n")
+        self._file.write(text)
+        self.n_documents += 1
+
+    def _write_preamble(self, skip: bool = False) -> None:
+        if not skip:
+            self._file.write(f"{self._preamble}\n")
+        self._preamble = None
+
+    def write_documents(self, documents: Iterable[Union[HipeDocument, List[Union[TSVLine, TSVLine_v2]]]]) -> None:
+        """Writes documents one by one, e.g. as produced by a generator."""
+        for document in documents:
+            self.write_document(document)
+
+    def close(self) -> None:
+        """Ends the file, and closes it if it was opened by the writer."""
+        if self._file is None:
+            return
+        if self._preamble is not None:
+            self._write_preamble()
+        self._file.write("\n")
+        if self._close_file:
+            self._file.close()
+        else:
+            self._file.flush()
+        self._file = None
+
+    def __enter__(self) -> "TSVWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def write_tsv(documents: Iterable[Union[HipeDocument, List[TSVLine]]], output_path: str,
+              hipe_format_version: str = "v1", compression: Optional[str] = "infer") -> None:
     """
     Write TSVlines to .tsv file, with appropriate hipe headers.
-    :param  List[List[TSVLine]] documents: HIPE formatted document lines
+
+    Documents are written one by one (see `TSVWriter`), so that they can be produced lazily, e.g. by a generator.
+    :param  Iterable[Union[HipeDocument, List[TSVLine]]] documents: `HipeDocument`s (see `HipeDocument.to_tsv`) or
+        HIPE formatted document lines
     :param str output_path: the file where the data will be written
     :param hipe_format_version: which version of hipe format to serialise to. "v1" (default) or "v2"
+    :param compression: see `TSVWriter`, e.g. a `.tsv.gz` path is written gzip-compressed.
     :rtype: object
     """
-    headers = COL_LABELS if hipe_format_version == "v1" else COL_LABELS_V2
-    raw_csv = "\n\n".join(
-        ("\n".join((str(line) for line in document)) for document in documents)
-    )
-    headers_line = "\t".join(headers)
-    preamble = headers_line if hipe_format_version == "v1" else f"{IOB_FIRST_LINE}"
-    csv_content = f"{preamble}\n{raw_csv}\n"
-
-    with io.open(output_path, "w", encoding="utf-8") as f:
-        f.write(csv_content)
+    with TSVWriter(output_path, hipe_format_version=hipe_format_version, compression=compression) as writer:
+        writer.write_documents(documents)
 
 
 def tsv_to_dict(path: Optional[str] = None, url: Optional[str] = None, keep_comments: bool = False,
-                hipe_format_version: str = "v1") -> Dict[
+                hipe_format_version: str = "v1", cache: Union[bool, ParseCache, None] = None,
+                columns: Optional[List[str]] = None, metadata_fields: Optional[List[str]] = None) -> Dict[
     str, List[str]]:
     """The simplest and most straightforward way to get tsv-data into a python structure. This function is used as the
     basis for other converters
     :param path:
     :param keep_comments:
     :param url:
-    :param hipe_format_version: """
-
+    :param hipe_format_version:
+    :param cache: `True` (default cache) or a `ParseCache` to load the result from an on-disk cache, and to store it
+        there on a cache miss. Only applies to `path`.
+    :param columns: The annotation columns to keep (e.g. `['TOKEN', 'NE-COARSE-LIT']`), defaults to all of them.
+        Values of other columns are not stored, nor converted. `'n'` is always kept.
+    :param metadata_fields: With `keep_comments`, the commented fields to keep (e.g. `['hipe2022:document_id']`),
+        defaults to the ones found before the first annotation line."""
+
+    cache = get_cache(cache)
+    if cache is not None and path and not url:
+        key = cache.key(path, function="tsv_to_dict", keep_comments=keep_comments,
+                        hipe_format_version=hipe_format_version, columns=columns, metadata_fields=metadata_fields)
+        encoded = cache.get(key)
+        if encoded is not None:
+            return decode_columns(encoded)
+
+        dict_ = tsv_to_dict(path=path, keep_comments=keep_comments, hipe_format_version=hipe_format_version,
+                            columns=columns, metadata_fields=metadata_fields)
+        if dict_ is not None:
+            cache.put(key, encode_columns(dict_))
+        return dict_
+
+    columns = _tsv_columns(path, url, keep_comments, hipe_format_version, columns, metadata_fields)
+    if columns is None:
+        return None
+    return {k: v.expand() if isinstance(v, CommentRuns) else v for k, v in columns.items()}
+
+
+class CommentRuns(NamedTuple):
+    """A column holding the values of a commented field, as runs of identical values: `values[i]` is repeated
+    `lengths[i]` times."""
+    values: List[str]
+    lengths: List[int]
+
+    def expand(self) -> List[str]:
+        column = []
+        for value, length in zip(self.values, self.lengths):
+            column.extend([value] * length)
+        return column
+
+
+def _tsv_columns(path: Optional[str], url: Optional[str], keep_comments: bool, hipe_format_version: str,
+                 columns: Optional[List[str]] = None,
+                 metadata_fields: Optional[List[str]] = None) -> Optional[Dict[str, Union[List, CommentRuns]]]:
+    """Same as `tsv_to_dict`, but with the columns of commented fields given as `CommentRuns`."""
     data = get_tsv_data(path, url).split('\n')
     
     # NOTE: the logic to get column headers is different in
@@ -667,49 +1211,91 @@ def tsv_to_dict(path: Optional[str] = None, url: Optional[str] = None, keep_comm
     elif hipe_format_version == "v2":
         header = data[0].split('=')[-1].split()
 
+    if columns is None:
+        columns = header
+    else:
+        unknown = [k for k in columns if k not in header]
+        if unknown:
+            raise KeyError(unknown[0])
+        columns = [k for k in header if k in columns]
+
     if not keep_comments:
-        dict_ = {k: [] for k in ['n'] + header}
+        dict_ = {k: [] for k in ['n'] + columns}
+        selected = [(header.index(k), dict_[k]) for k in columns]
+        max_split = max([j for j, _ in selected], default=-1) + 1
 
         for i, line in enumerate(data[1:]):  # As data[0] is the header
             if line and not line.startswith('#'):
-                line = line.split('\t')
+                # values after the last selected column are not split out
+                line = line.split('\t', max_split)
                 dict_['n'].append(i + 1)  # as we are starting with data[1:]
-                for j, k in enumerate(header):
-                    dict_[k].append(line[j])
+                for j, values in selected:
+                    values.append(line[j])
             else:
                 continue
 
     else:
-        comments, dict_ = {}, None
+        # As data[0] is the header, line numbers are shifted by one
+        fields = list(dict.fromkeys(k.lower().replace('-', '_') for k in columns))
+        fields = [f for f in fields if f in _annotation_fields(hipe_format_version)]
+        # lines are parsed by chunks, so that the values of unselected columns are only created chunk by chunk
+        columns_, comments = {k: [] for k in ['n'] + fields}, []
+        for start in range(1, len(data), COLUMNS_CHUNK_SIZE):
+            chunk_columns, chunk_comments = parse_columns(data[start:start + COLUMNS_CHUNK_SIZE], skip_headers=False,
+                                                          hipe_format_version=hipe_format_version, fields=fields)
+            columns_['n'].extend([n + start - 1 for n in chunk_columns.pop('n')])
+            for k, values in chunk_columns.items():
+                columns_[k].extend(values)
+            comments.extend(comment._replace(n=comment.n + start - 1) for comment in chunk_comments)
+        line_numbers = columns_['n']
+        if not line_numbers:
+            return None
+        columns_['n'] = [n + 1 for n in line_numbers]
+
+        # Columns are fixed by the first annotation line: annotation attributes, and the commented fields found
+        # before it. Each commented field then holds its last value.
+        if metadata_fields is None:
+            metadata_fields = [comment.field for comment in comments if comment.n < line_numbers[0]]
+        keys = ['n'] + columns + list(metadata_fields)
+        dict_ = {}
+        for k in dict.fromkeys(keys):
+            formated_k = k.lower().replace('-', '_')
+            if formated_k in columns_:
+                column = columns_[formated_k]
+                dict_[k] = list(column) if any(c is column for c in dict_.values()) else column
+            else:
+                dict_[k] = _comment_runs(k, comments, line_numbers)
 
-        for i, line in enumerate(data[1:]):  # As data[0] is the header
+    return dict_
 
-            if line:
-                parsed_line = parse_tsv_line(line, i + 1, hipe_format_version=hipe_format_version)
-
-                if isinstance(parsed_line, TSVComment):  # If comment, stock comment's field and value
-                    comments[parsed_line.field] = parsed_line.value
-
-                else:  # else, appends annotations and comments values to `dict_`
-                    dict_ = {k: [] for k in ['n'] + header + list(comments.keys())} if not dict_ else dict_
-                    #import ipdb; ipdb.set_trace()
-                    for k in dict_.keys():
-                        formated_k = k.lower().replace('-', '_')
-                        if hipe_format_version == "v1":
-                            dict_[k].append(
-                                getattr(parsed_line, formated_k)
-                                if formated_k in parsed_line._fields else comments[k])
-                        elif hipe_format_version == "v2":
-                            dict_[k].append(
-                                getattr(parsed_line, formated_k)
-                                if formated_k in [f.name for f in dataclasses.fields(parsed_line)] else comments[k])
 
-    return dict_
+def _comment_runs(field: str, comments: List[TSVComment], line_numbers: List[int]) -> CommentRuns:
+    """Spreads the values of a commented field over the annotation lines (given by their `line_numbers`), each
+    line taking the last value found before it."""
+    values, lengths, position = [], [], 0
+    for comment in comments:
+        if comment.field == field:
+            next_position = bisect.bisect_left(line_numbers, comment.n, lo=position)
+            if not values and next_position > 0:
+                raise KeyError(field)
+            if values:
+                lengths.append(next_position - position)
+            values.append(comment.value)
+            position = next_position
+    if not values:
+        raise KeyError(field)
+    lengths.append(len(line_numbers) - position)
+    return CommentRuns(values, lengths)
 
 
 def tsv_to_dataframe(path: Optional[str] = None, url: Optional[str] = None,
                      keep_comments: bool = False,
-                     hipe_format_version: str = "v1") -> pd.DataFrame:
+                     hipe_format_version: str = "v1",
+                     cache: Union[bool, ParseCache, None] = None,
+                     categorical: Union[bool, List[str]] = False,
+                     dtype_backend: Optional[str] = None,
+                     columns: Optional[List[str]] = None,
+                     metadata_fields: Optional[List[str]] = None) -> pd.DataFrame:
     """Converts a HIPE-compliant tsv to a `pd.DataFrame`, keeping comment fields as columns.
 
     Each row corresponds to an annotation row of the tsv (i.e. a token). Commented fields (e.g. `'document_id`) are
@@ -718,15 +1304,97 @@ def tsv_to_dataframe(path: Optional[str] = None, url: Optional[str] = None,
     ..note:: In the output-dataframe, column 'n' corresponds to the line number in the original tsv file, not in the
     dataframe.
 
+    Example:
+        ```
+        # tags and metadata as pyarrow dictionary columns, a fraction of the memory of `object` columns
+        df = tsv_to_dataframe(path, keep_comments=True, categorical=True, dtype_backend="pyarrow")
+        # only the columns in use
+        df = tsv_to_dataframe(path, keep_comments=True, columns=['TOKEN', 'NE-COARSE-LIT'],
+                              metadata_fields=['hipe2022:document_id'])
+        ```
+
     :param hipe_format_version:
     :param keep_comments:
     :param str path: Path to a HIPE-compliant tsv file
     :param str url: url to a HIPE-compliant tsv file
+    :param cache: See `tsv_to_dict`.
+    :param categorical: `True` to store all columns but `'n'` and `'TOKEN'` (i.e. tags, links, flags and commented
+        fields) as categoricals, or the list of the columns to store as categoricals. Categorical columns are built
+        directly from integer codes, without creating the full columns of strings.
+    :param dtype_backend: `None` (default) for numpy-backed columns, `"numpy_nullable"` for pandas' nullable `Int64`
+        and `string` dtypes, or `"pyarrow"` for pyarrow-backed columns (categoricals then being pyarrow dictionary
+        columns). `"pyarrow"` requires `pyarrow` to be installed.
+    :param columns: See `tsv_to_dict`.
+    :param metadata_fields: See `tsv_to_dict`.
     """
-    return pd.DataFrame(tsv_to_dict(path=path,
-                                    url=url,
-                                    keep_comments=keep_comments,
-                                    hipe_format_version=hipe_format_version))
+    if dtype_backend not in (None, "numpy_nullable", "pyarrow"):
+        raise ValueError(f"`dtype_backend` must be None, 'numpy_nullable' or 'pyarrow', not {dtype_backend!r}")
+    if not categorical and dtype_backend is None:
+        return pd.DataFrame(tsv_to_dict(path=path,
+                                        url=url,
+                                        keep_comments=keep_comments,
+                                        hipe_format_version=hipe_format_version,
+                                        cache=cache,
+                                        columns=columns,
+                                        metadata_fields=metadata_fields))
+
+    if get_cache(cache) is not None and path and not url:
+        dict_ = tsv_to_dict(path=path, keep_comments=keep_comments, hipe_format_version=hipe_format_version,
+                            cache=cache, columns=columns, metadata_fields=metadata_fields)
+    else:
+        dict_ = _tsv_columns(path, url, keep_comments, hipe_format_version, columns, metadata_fields)
+    if dict_ is None:
+        return pd.DataFrame()
+
+    if categorical is True:
+        categorical = [k for k in dict_ if k not in ('n', 'TOKEN')]
+    return pd.DataFrame({
+        k: _typed_column(v, is_int=k == 'n', categorical=k in (categorical or []), dtype_backend=dtype_backend)
+        for k, v in dict_.items()
+    })
+
+
+def _typed_column(column: Union[List, CommentRuns], is_int: bool, categorical: bool, dtype_backend: Optional[str]):
+    """Converts a column of `_tsv_columns` to an array of the required dtype."""
+    if is_int:
+        dtype = {None: np.int64, "numpy_nullable": "Int64", "pyarrow": "int64[pyarrow]"}[dtype_backend]
+        return pd.array(column, dtype=dtype) if dtype_backend else np.array(column, dtype=dtype)
+
+    if categorical:
+        vocabulary = Vocabulary()
+        if isinstance(column, CommentRuns):
+            codes = np.repeat(np.array(vocabulary.encode(column.values), dtype=np.int64), column.lengths)
+        else:
+            codes = np.array(vocabulary.encode(column), dtype=np.int64)
+        return _categorical_array(codes, vocabulary.values, dtype_backend)
+
+    if isinstance(column, CommentRuns):
+        column = column.expand()
+    if dtype_backend == "pyarrow":
+        return pd.array(column, dtype="string[pyarrow]")
+    elif dtype_backend == "numpy_nullable":
+        return pd.array(column, dtype="string")
+    return column
+
+
+def _categorical_array(codes: np.ndarray, categories: List[Optional[str]], dtype_backend: Optional[str]):
+    """Builds a categorical array from the codes of `categories`, missing values (`None`) becoming nulls."""
+    if None in categories:
+        missing = categories.index(None)
+        codes = np.where(codes == missing, -1, codes - (codes > missing))
+        categories = categories[:missing] + categories[missing + 1:]
+    codes = codes.astype(np.min_scalar_type(-max(len(categories), 1)))
+
+    if dtype_backend == "pyarrow":
+        import pyarrow as pa
+
+        indices = pa.array(codes, mask=codes < 0)
+        return pd.arrays.ArrowExtensionArray(
+            pa.DictionaryArray.from_arrays(indices, pa.array(categories, type=pa.string()))
+        )
+    elif dtype_backend == "numpy_nullable":
+        return pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(pd.Index(categories, dtype="string")))
+    return pd.Categorical.from_codes(codes, categories=categories)
 
 
 def tsv_to_segmented_lists(labels: List[str],
@@ -753,57 +1421,173 @@ def tsv_to_segmented_lists(labels: List[str],
 
     :returns: Dict, see above
     """
-    df = tsv_to_dataframe(path=path, url=url, keep_comments=True, hipe_format_version=hipe_format_version)
+    # NOTE a sentence break is added after each token flagged with `segmentation_flag`
+    flag_columns = ['MISC'] if hipe_format_version == "v1" else ['SEG', 'RENDER']
+    columns = _tsv_columns(path, url, True, hipe_format_version, columns=['TOKEN'] + labels + flag_columns) or {}
     d = {k: [] for k in ['texts', 'doc_ids'] + labels}
 
-    doc_id_col = [col for col in df.columns if 'document_id' in col][0]
+    doc_id_col = [col for col in columns if 'document_id' in col][0]
 
-    example_tokens = []
-    example_labels = {k: [] for k in labels}
-    example_doc_ids = []
+    breaks = np.zeros(len(columns['n']), dtype=bool)
+    for flag_column in flag_columns:
+        breaks |= _contains_mask(columns[flag_column], segmentation_flag)
 
-    for i in range(len(df)):
-        example_tokens.append(df['TOKEN'][i])
-        example_doc_ids.append(df[doc_id_col][i])
-        for label in labels:
-            example_labels[label].append(df[label][i])
+    # boundaries of the examples, the last one ending with the file if it doesn't end with the flag
+    boundaries = (np.flatnonzero(breaks) + 1).tolist()
+    if not boundaries or boundaries[-1] != len(breaks):
+        boundaries.append(len(breaks))
+    boundaries = list(zip([0] + boundaries[:-1], boundaries))
 
-        # NOTE check if a sentence break should be added after the current token
-        if (hipe_format_version == "v1" and segmentation_flag in df['MISC'][i]) \
-            or (hipe_format_version == "v2" and (segmentation_flag in df['SEG'][i] or segmentation_flag in df['RENDER'][i])):
-            d['texts'].append(example_tokens)
-            d['doc_ids'].append(example_doc_ids)
-            for label in labels:
-                d[label].append(example_labels[label])
+    for key, column in [('texts', columns['TOKEN']), ('doc_ids', columns[doc_id_col])] + \
+                       [(label, columns[label]) for label in labels]:
+        if isinstance(column, CommentRuns):
+            column = column.expand()
+        d[key] = [column[start:stop] for start, stop in boundaries]
 
-            example_tokens = []
-            example_labels = {k: [] for k in labels}
-            example_doc_ids = []
+    return d
 
-    if example_tokens:
-        d['texts'].append(example_tokens)
-        d['doc_ids'].append(example_doc_ids)
-        for label in labels:
-            d[label].append(example_labels[label])
 
-    return d
+def _contains_mask(column: Union[List[str], CommentRuns], substring: str) -> np.ndarray:
+    """Computes whether each value of a column contains `substring`, testing each distinct value only once."""
+    if isinstance(column, CommentRuns):
+        return np.repeat([substring in value for value in column.values], column.lengths).astype(bool)
+
+    vocabulary = Vocabulary()
+    codes = np.array(vocabulary.encode(column), dtype=np.int64)
+    return np.array([substring in value for value in vocabulary.values], dtype=bool)[codes]
+
+
+def iter_segments(labels: List[str], segmentation_flag: str = 'EndOf', hipe_format_version: str = "v1",
+                  **kwargs) -> Iterator[Dict[str, List[str]]]:
+    """Streaming counterpart of `tsv_to_segmented_lists`, yielding its examples one by one.
+
+    The file is read document by document (see `iter_tsv`, which accepts the same `kwargs`), so that memory stays
+    bounded by the size of the largest document. Examples are the same as the ones of `tsv_to_segmented_lists`,
+    e.g. `{'texts': [word1, word2...], 'doc_ids': [doc_id, doc_id...], 'NE-COARSE-LIT': [label1, label2...]}`.
+
+    :param labels: The desired column labels (e.g. `['NE-COARSE-LIT','NEL-LIT']`).
+    :param segmentation_flag: See `tsv_to_segmented_lists`.
+    :param hipe_format_version: The HIPE format version of the file, `"v1"` (default) or `"v2"`.
+    :return: An iterator over examples.
+    """
+    keys = ['texts', 'doc_ids'] + labels
+    attributes = ['token'] + [label.lower().replace('-', '_') for label in labels]
+    flag_attributes = ['misc'] if hipe_format_version == "v1" else ['seg', 'render']
+
+    # NOTE an example may span several documents, as in `tsv_to_segmented_lists`
+    pending = {k: [] for k in keys}
+    doc_id_field, doc_id = None, None
+    for _, chunk in read_tsv_chunks(**kwargs):
+        columns, comments = parse_columns(chunk, hipe_format_version=hipe_format_version)
+        line_numbers = columns['n']
+
+        # the document id of each line is the last one found before it
+        doc_ids = []
+        for comment in comments:
+            if doc_id_field is None and 'document_id' in comment.field:
+                doc_id_field = comment.field
+            if comment.field == doc_id_field:
+                doc_ids.extend([doc_id] * (bisect.bisect_left(line_numbers, comment.n) - len(doc_ids)))
+                doc_id = comment.value
+        doc_ids.extend([doc_id] * (len(line_numbers) - len(doc_ids)))
+
+        breaks = np.zeros(len(line_numbers), dtype=bool)
+        for attribute in flag_attributes:
+            breaks |= _contains_mask(columns[attribute], segmentation_flag)
+
+        chunk_columns = [columns['token'], doc_ids] + [columns[attribute] for attribute in attributes[1:]]
+        start = 0
+        for stop in (np.flatnonzero(breaks) + 1).tolist():
+            for k, column in zip(keys, chunk_columns):
+                pending[k].extend(column[start:stop])
+            yield pending
+            pending = {k: [] for k in keys}
+            start = stop
+        for k, column in zip(keys, chunk_columns):
+            pending[k].extend(column[start:])
+
+    if pending['texts']:
+        yield pending
+
+
+def _source_files(path: Union[str, List[str], None] = None, url: Union[str, List[str], None] = None,
+                  base_dir: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Lists the files given by paths, urls and/or a release folder, as `(kwarg, location)` tuples, `kwarg` being
+    the argument of `read_tsv_chunks` to read the file (`file_path` or `file_url`)."""
+
+    def as_list(locations):
+        return [locations] if isinstance(locations, str) else list(locations or [])
+
+    paths = as_list(path) + (sorted(find_datasets_files(base_dir)) if base_dir else [])
+    files = [('file_path', p) for p in paths] + [('file_url', u) for u in as_list(url)]
+    if not files:
+        raise ValueError("One of `path`, `url` or `base_dir` must be provided")
+    return files
+
+
+def _generate_segments(files: List[Tuple[str, str, Optional[Tuple]]], labels: Tuple[str, ...],
+                       segmentation_flag: str, hipe_format_version: str) -> Iterator[Dict[str, List[str]]]:
+    """The generator of `tsv_to_huggingface_dataset`, `files` being `(kwarg, location, stamp)` tuples.
+
+    `stamp` is only there to change the fingerprint of the dataset, and thus its cache, when a file changes.
+    """
+    for kwarg, location, _ in files:
+        yield from iter_segments(list(labels), segmentation_flag=segmentation_flag,
+                                 hipe_format_version=hipe_format_version, **{kwarg: location})
 
 
 def tsv_to_huggingface_dataset(
         labels: List[str],
-        path: Optional[str] = None,
-        url: Optional[str] = None,
-        segmentation_flag: str = 'EndOf'
+        path: Union[str, List[str], None] = None,
+        url: Union[str, List[str], None] = None,
+        segmentation_flag: str = 'EndOf',
+        hipe_format_version: str = "v1",
+        base_dir: Optional[str] = None,
+        num_proc: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        writer_batch_size: int = 1000,
 ):
-    """Converts a HIPE-compliant tsv to a custom `torch.utils.data.Dataset`, making it directly amenable to
+    """Converts HIPE-compliant tsv files to a HuggingFace `datasets.Dataset`, making them directly amenable to
        HuggingFace transformers.
 
+       Examples are streamed (see `iter_segments`) straight into Arrow files with `Dataset.from_generator`, so that
+       memory stays bounded whatever the number and the size of the files: only the current document and
+       `writer_batch_size` examples are held in memory. The dataset is then memory-mapped from these files.
+       With `num_proc`, files are split into as many shards, which are written in parallel.
+
        ..note.: Unlike `tsv_to_torch_dataset`, this function does NOT tokenize the texts, and simply converts it
-       to the datasets pyarrow datastructure."""
+       to the datasets pyarrow datastructure.
+
+    :param labels: The desired column labels (e.g. `['NE-COARSE-LIT','NEL-LIT']`).
+    :param path: The path of a tsv file, or a list of paths.
+    :param url: The url of a tsv file, or a list of urls.
+    :param segmentation_flag: See `tsv_to_segmented_lists`.
+    :param hipe_format_version: The HIPE format version of the files, `"v1"` (default) or `"v2"`.
+    :param base_dir: A release folder, whose files (see `find_datasets_files`) are all added to the dataset.
+    :param num_proc: The number of processes writing the shards, defaults to a single one.
+    :param cache_dir: The folder of the Arrow files, defaults to the `datasets` cache.
+    :param writer_batch_size: The number of examples held in memory before being written.
+    :returns: A `datasets.Dataset` with `texts`, `doc_ids` and `labels` columns.
+    """
 
-    from datasets import Dataset
-    data = tsv_to_segmented_lists(labels=labels, path=path, url=url, segmentation_flag=segmentation_flag)
-    return Dataset.from_dict(data)
+    from datasets import Dataset, Features, Sequence, Value
+
+    files = [
+        (kwarg, location, (os.path.getsize(location), os.path.getmtime(location)) if kwarg == 'file_path' else None)
+        for kwarg, location in _source_files(path, url, base_dir)
+    ]
+
+    features = Features({k: Sequence(Value('string')) for k in ['texts', 'doc_ids'] + labels})
+    return Dataset.from_generator(
+        _generate_segments,
+        features=features,
+        cache_dir=cache_dir,
+        # NOTE lists are sharded between processes, other arguments must not be lists
+        gen_kwargs={'files': files, 'labels': tuple(labels), 'segmentation_flag': segmentation_flag,
+                    'hipe_format_version': hipe_format_version},
+        num_proc=num_proc if num_proc and len(files) > 1 else None,
+        writer_batch_size=writer_batch_size,
+    )
 
 
 def tsv_to_torch_dataset(
@@ -814,6 +1598,8 @@ def tsv_to_torch_dataset(
         url: Optional[str] = None,
         segmentation_flag: Union[str, int] = 'EndOf',
         label_all_tokens: bool = False,
+        num_proc: Optional[int] = None,
+        cache: Union[bool, ParseCache, None] = None,
         **tokenizer_kwargs):
     """Converts a HIPE-compliant tsv to a custom `torch.utils.data.Dataset`, making it directly amenable to
     torch and HuggingFace transformers.
@@ -821,11 +1607,15 @@ def tsv_to_torch_dataset(
     What this does is:
         1) Segmenting the tsv into annotated lists of examples using `tsv_to_lists`
         2) Aokenizing the created lists, using `tokenizer()`
-        3) Aligning labels, using `align_and_pad_labels`.
-    Please customize these calls using additional `tokenizer_kwargs`, such as `padding` (see docs).
+        3) Aligning labels, using `helpers.alignment.align_labels`.
+    Please customize these calls using additional `tokenizer_kwargs` (see docs).
 
-    ..note.: If you use the tokenizer to truncate sentences, the overflowing will be lost. Do handle this, please use
-    `tsv_to_huggingface_dataset` instead.
+    Examples are stored unpadded (see `helpers.training.HipeTorchDataset`): rather than passing `padding` to the
+    tokenizer, pad them batch by batch with a `helpers.training.DynamicPaddingCollator`, ideally with batches of
+    similar lengths from a `helpers.training.LengthBucketSampler`.
+
+    ..note.: If you use the tokenizer to truncate sentences, the overflowing will be lost, unless you also pass
+    `return_overflowing_tokens=True`, which makes additional examples out of overflowing tokens.
 
     This will return a `torch.utils.data.Dataset` with tokens and their corresponding labels. Note that this will only
     work with a single label column.
@@ -836,97 +1626,124 @@ def tsv_to_torch_dataset(
     :param str path: The path to the tsv file
     :param str url: The url of the tsv file (must be provided if path is not
     :param segmentation_flag: See `tsv_to_lists`.
-    :param label_all_tokens: See `align_and_pad_tags`.
+    :param label_all_tokens: See `helpers.alignment.align_labels`.
+    :param num_proc: The number of processes tokenizing the examples, see `helpers.alignment.tokenize_and_align`.
+    :param cache: `True` (default cache, keyed by file content) or a `ParseCache` to load the tokenized and aligned
+        examples memory-mapped from an on-disk cache, and to store them there on a cache miss. Entries are keyed by
+        the file, the tokenizer (see `helpers.alignment.tokenizer_fingerprint`), `labels_to_ids` and all the other
+        arguments, `tokenizer_kwargs` included, which must thus be JSON-serializable. Only applies to `path`.
 
     :returns: A `torch.utils.data.Dataset` with tokens and their corresponding labels
     """
 
-    import torch
-
-    def align_and_pad_labels(texts: "BatchEncoding",
-                             labels: List[List[str]],
-                             labels_to_ids: Dict[str, int],
-                             label_all_tokens: bool = False,
-                             null_label: object = -100) -> List[List[int]]:
-        """Converts labels to labelids, aligns and pads labels to tokenized texts, using token indices.
-
-        If `label_all_tokens` is `True`, labels attributed to a word in data are broadcast to all its corresponding
-        subtokens ; else, only the first subtoken is marked with a label, the rest being
-        marked with the `null_label`. Padded labels (i.e. labels between initial sequence length and `max_sequence_length`)
-        are marked with `null_label`.
+    from .alignment import tokenize_and_align, tokenizer_fingerprint, OFFSETS_KEY
+    from .training import HipeTorchDataset
 
-        :param texts: a BatchEncoding-object. Attribute `input_ids` contains tokenized text, in the format :
-        List[List[str]], e.g. `[["example", "one"],...]`.
-        :param labels: should come in the format outputed by `read_line_json` or `tokenize_and_pad_tokens`:
-        List[List[str]], e.g. `[["O", "B-AAWORK"],...]`.
-        :param labels_to_ids: A Dict[str,int] mapping labels to their respective ids.
+    cache = ParseCache(key_by="content") if cache is True else get_cache(cache)
+    key = None
+    if cache is not None and path and not url:
+        key = cache.key(path, function="tsv_to_torch_dataset", label_type=label_type, labels_to_ids=labels_to_ids,
+                        tokenizer=tokenizer_fingerprint(tokenizer), segmentation_flag=segmentation_flag,
+                        label_all_tokens=label_all_tokens, tokenizer_kwargs=tokenizer_kwargs)
+        arrays = cache.get_arrays(key)
+        if arrays is not None:
+            offsets = arrays.pop(OFFSETS_KEY)
+            return HipeTorchDataset.from_arrays(arrays, offsets)
 
-        :returns: The List[List[int]] of labels.
-        """
-
-        # Changes labels to id, keeping the list[list] architecture
-        original_labelids = [[labels_to_ids[label] for label in instance_labels] for instance_labels in labels]
-
-        all_labels = []
-        for i in range(len(texts["input_ids"])):
-            token_indices = texts.word_ids(batch_index=i)
-            previous_token_index = None
-            instance_labels = []
-
-            for token_index in token_indices:
-                if token_index is None:
-                    instance_labels.append(null_label)
+    data = tsv_to_segmented_lists(labels=[label_type], path=path, url=url, segmentation_flag=segmentation_flag)
 
-                elif token_index != previous_token_index:
-                    instance_labels.append(original_labelids[i][token_index])
+    arrays, offsets = tokenize_and_align(data['texts'], data[label_type], tokenizer, labels_to_ids,
+                                         label_all_tokens=label_all_tokens, num_proc=num_proc, **tokenizer_kwargs)
+    if key is not None:
+        cache.put_arrays(key, {**arrays, OFFSETS_KEY: offsets})
 
-                else:
-                    b_to_i_label = labels_to_ids['I' + labels[i][token_index][1:]] if labels[i][
-                                                                                          token_index] != 'O' else 'O'
-                    instance_labels.append(b_to_i_label if label_all_tokens else null_label)
-                previous_token_index = token_index
+    return HipeTorchDataset.from_arrays(arrays, offsets)
 
-            all_labels.append(instance_labels)
 
-        return all_labels
+class LabelVocabulary(NamedTuple):
+    """The labels of a column, see `scan_labels`.
 
-    class HipeTorchDataset(torch.utils.data.Dataset):
-        """A custom class to make HIPE-data amenable to pytorch and transformers"""
+    `labels` are `'O'` followed by the `B-` and `I-` labels of each entity type, sorted by type (as returned by
+    `get_unique_labels`), and `counts` maps each value found in the column to its number of occurrences.
+    """
+    labels: List[str]
+    counts: Dict[str, int]
 
-        def __init__(self, encodings: "BatchEncoding", labels: List[List[int]]):
-            self.encodings = encodings
-            self.labels = labels
+    @property
+    def labels_to_ids(self) -> Dict[str, int]:
+        return {label: i for i, label in enumerate(self.labels)}
 
-        def __getitem__(self, idx):
-            item = {k: torch.tensor(v[idx]) for k, v in self.encodings.items()}
-            item['labels'] = torch.tensor(self.labels[idx])
-            return item
 
-        def __len__(self):
-            return len(self.labels)
+def _iob_labels(values: Iterable[str]) -> List[str]:
+    labels = ['O']
+    for label in sorted(set([value[2:] for value in values if value != 'O'])):
+        labels.append('B-' + label)
+        labels.append('I-' + label)
+    return labels
 
-    data = tsv_to_segmented_lists(labels=[label_type], path=path, url=url, segmentation_flag=segmentation_flag)
 
-    tokenized_texts = tokenizer(data['texts'], is_split_into_words=True, **tokenizer_kwargs)
+def scan_labels(label_types: List[str], path: Union[str, List[str], None] = None,
+                url: Union[str, List[str], None] = None, base_dir: Optional[str] = None,
+                hipe_format_version: str = "v1", chunk_size: int = 65536) -> Dict[str, LabelVocabulary]:
+    """Collects the labels of some columns over one or several HIPE-compliant tsv files, e.g. to build the
+    `labels_to_ids` of `tsv_to_torch_dataset`.
 
-    aligned_labels = align_and_pad_labels(tokenized_texts, labels=data[label_type],
-                                          labels_to_ids=labels_to_ids,
-                                          label_all_tokens=label_all_tokens)
+    Files are streamed by chunks of `chunk_size` lines and only the requested columns are counted, so that memory
+    stays constant whatever the size and the number of the files.
 
-    return HipeTorchDataset(tokenized_texts, aligned_labels)
+    :param label_types: The desired columns, e.g. `['NE-COARSE-LIT', 'NE-FINE-LIT']`.
+    :param path: The path of a tsv file, or a list of paths.
+    :param url: The url of a tsv file, or a list of urls.
+    :param base_dir: A release folder, whose files (see `find_datasets_files`) are all scanned.
+    :param hipe_format_version: The HIPE format version of the files, `"v1"` (default) or `"v2"`.
+    :param chunk_size: The number of lines read at once.
+    :return: A dict mapping each label type to its `LabelVocabulary`.
+    :raises ValueError: If a column is missing from the header of a file, or from one of its annotation lines.
+    """
+    counters = {label_type: Counter() for label_type in label_types}
+
+    for kwarg, location in _source_files(path, url, base_dir):
+        with open_tsv(**{'path' if kwarg == 'file_path' else 'url': location}) as f:
+            # NOTE: as in `tsv_to_dict`, column headers are read from the first line
+            first_line = f.readline().rstrip('\n')
+            header = first_line.split('\t') if hipe_format_version == "v1" else first_line.split('=')[-1].split()
+            missing = [label_type for label_type in label_types if label_type not in header]
+            if missing:
+                raise ValueError(f"Columns {missing} not found in {location}")
+            indices = [header.index(label_type) for label_type in label_types]
+            n_values = len(header)
+            line_number = 1  # of the last line read, the header being line 1
+
+            for chunk in iter(lambda: list(islice(f, chunk_size)), []):
+                lines = [line for line in chunk if line[0] not in '#\n']
+                if set(map(operator.methodcaller('count', '\t'), lines)) <= {n_values - 1}:
+                    # as in `parse_columns`, all the lines are split at once, columns being strided slices
+                    values = ''.join(lines).replace('\n', '\t').split('\t')
+                    columns = [values[index:len(lines) * n_values:n_values] for index in indices]
+                else:
+                    # rare branch: rows with missing or extra values, the requested columns being required
+                    for i, line in enumerate(chunk):
+                        n_separators = line.count('\t')
+                        if line[0] not in '#\n' and n_separators < max(indices):
+                            raise ValueError(f"Line {line_number + i + 1} of {location} has {n_separators + 1} values, "
+                                             f"too few for the columns {label_types}")
+                    rows = [line.rstrip('\n').split('\t') for line in lines]
+                    columns = [[row[index] for row in rows] for index in indices]
+                for label_type, column in zip(label_types, columns):
+                    counters[label_type].update(column)
+                line_number += len(chunk)
+
+    return {label_type: LabelVocabulary(_iob_labels(counter), dict(counter.most_common()))
+            for label_type, counter in counters.items()}
 
 
 def get_unique_labels(path: Optional[str] = None, url: Optional[str] = None, label_type: Optional[str] = None,
                       label_list: Optional[List[str]] = None) -> List[str]:
-    """Returns a list of unique labels contained in a HIPE-tsv file or directly in a label list"""
+    """Returns a list of unique labels contained in a HIPE-tsv file or directly in a label list.
 
-    if not label_list:
-        label_list = tsv_to_dataframe(path, url)[label_type].tolist()
-
-    labels = ['O']
+    See `scan_labels` to collect labels from several files, with their counts."""
 
-    for label in sorted(set([label_[2:] for label_ in label_list if label_ != 'O'])):
-        labels.append('B-' + label)
-        labels.append('I-' + label)
+    if not label_list:
+        return scan_labels([label_type], path=path, url=url)[label_type].labels
 
-    return labels
+    return _iob_labels(label_list)
@@ -0,0 +1,216 @@
+"""Random access to the documents of HIPE tsv files, through a sidecar offset index."""
+
+import json
+import mmap
+import os
+from typing import Dict, List, NamedTuple, Optional, Iterable, Iterator, Union
+
+from .compression import detect_codec
+from .tsv import (COL_LABELS, COL_LABELS_V2, HipeDocument, is_comment, parse_comment, lines2document)
+
+INDEX_FORMAT_VERSION = 1
+INDEX_SUFFIX = ".idx.json"
+
+_HEADERS = [COL_LABELS, COL_LABELS_V2]
+
+
+class DocumentIndexEntry(NamedTuple):
+    """The location of a document in a tsv file.
+
+    `offset` and `length` are in bytes, `line_number` is the (1-based) line number of the first line of the document.
+    `metadata` contains the commented fields found before the first annotation line of the document."""
+    position: int
+    offset: int
+    length: int
+    line_number: int
+    metadata: Dict[str, str]
+
+    @property
+    def document_id(self) -> Optional[str]:
+        """The value of the `document_id` field, whatever its prefix (e.g. `hipe2022:document_id`)."""
+        for field, value in self.metadata.items():
+            if field.split(':')[-1] == "document_id":
+                return value
+        return None
+
+
+def _source_stat(path: str) -> Dict[str, int]:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def default_index_path(path: str) -> str:
+    return path + INDEX_SUFFIX
+
+
+def scan_tsv_index(path: str) -> List[DocumentIndexEntry]:
+    """Scans a tsv file and locates its documents.
+
+    Documents are delimited exactly as in `iter_tsv` (see `iter_tsv_chunks`), so that reading the bytes of an entry
+    gives back the lines of the corresponding document, with the same line numbering.
+    """
+    entries = []
+    offset = 0
+    line_number = 0
+    start, start_line_number, end = 0, 1, 0
+    n_lines = 0  # number of lines in the current document
+    metadata, in_header = {}, True
+
+    def close_document():
+        entries.append(DocumentIndexEntry(len(entries), start, end - start, start_line_number, metadata))
+
+    with open(path, "rb") as f:
+        for raw_line in f:
+            line_number += 1
+            line_end = offset + len(raw_line)
+            line = raw_line
+            if line.endswith(b"\n"):
+                line = line[:-2] if line.endswith(b"\r\n") else line[:-1]
+
+            if raw_line.endswith(b"\n") and line == b"" and n_lines:
+                close_document()
+                start, start_line_number, end = line_end, line_number + 1, line_end
+                n_lines, metadata, in_header = 0, {}, True
+            else:
+                n_lines += 1
+                end = line_end
+                if in_header and line:
+                    decoded = line.decode("utf-8")
+                    if is_comment(decoded):
+                        comment = parse_comment(decoded, 0)
+                        metadata[comment.field] = comment.value
+                    elif decoded.split("\t") not in _HEADERS:
+                        in_header = False
+
+            offset = line_end
+
+    close_document()
+    return entries
+
+
+def build_tsv_index(path: str, index_path: Optional[str] = None, write: bool = True) -> List[DocumentIndexEntry]:
+    """Scans a tsv file (see `scan_tsv_index`) and writes its index to a sidecar JSON file.
+
+    :param path: The path to the tsv file.
+    :param index_path: The path of the index, defaults to the path of the tsv file suffixed with `INDEX_SUFFIX`.
+    :param write: Set to `False` to only return the index.
+    :return: The list of `DocumentIndexEntry`, in file order.
+    """
+    source = _source_stat(path)
+    entries = scan_tsv_index(path)
+
+    if write:
+        with open(index_path or default_index_path(path), "w", encoding="utf-8") as f:
+            json.dump({
+                "format": INDEX_FORMAT_VERSION,
+                "source": source,
+                "documents": [[e.offset, e.length, e.line_number, e.metadata] for e in entries],
+            }, f)
+
+    return entries
+
+
+def load_tsv_index(path: str, index_path: Optional[str] = None) -> Optional[List[DocumentIndexEntry]]:
+    """Loads the sidecar index of a tsv file, or returns `None` if it is missing or outdated."""
+    try:
+        with open(index_path or default_index_path(path), encoding="utf-8") as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if index.get("format") != INDEX_FORMAT_VERSION or index.get("source") != _source_stat(path):
+        return None
+
+    return [
+        DocumentIndexEntry(position, offset, length, line_number, metadata)
+        for position, (offset, length, line_number, metadata) in enumerate(index["documents"])
+    ]
+
+
+class IndexedTSV(object):
+    """Random access to the documents of a HIPE tsv file, by position or by `document_id`.
+
+    The file is memory-mapped and only the requested documents are parsed. The sidecar index is loaded if it is up to
+    date, and (re)built otherwise.
+
+    Example:
+        ```
+        with IndexedTSV("HIPE-2022-v2.0-ajmc-dev-de.tsv") as tsv:
+            doc = tsv.get("sophokle1v3soph_0066")
+            sample = [tsv[i] for i in range(0, len(tsv), 10)]
+        ```
+
+    :param path: The path to the tsv file. Compressed files can't be memory-mapped and are not supported.
+    :param hipe_format_version: The HIPE format version of the file, `"v1"` (default) or `"v2"`.
+    :param index_path: The path of the sidecar index, see `build_tsv_index`.
+    :param write_index: Whether to write the index next to the tsv file when it has to be built.
+    :param kwargs: Passed to `lines2document`, e.g. `mask_nerc`, `mask_nel` or `decode_entities`.
+    """
+
+    def __init__(self, path: str, hipe_format_version: str = "v1", index_path: Optional[str] = None,
+                 write_index: bool = True, **kwargs):
+        codec = detect_codec(path)
+        if codec:
+            raise ValueError(f"{path} is compressed ({codec}), and can't be accessed randomly")
+
+        self.path = path
+        self.hipe_format_version = hipe_format_version
+        self._parse_kwargs = kwargs
+
+        self.entries = load_tsv_index(path, index_path)
+        if self.entries is None:
+            self.entries = build_tsv_index(path, index_path, write=write_index)
+        self._positions = {}
+        for entry in self.entries:
+            self._positions.setdefault(entry.document_id, entry.position)
+
+        self._file = open(path, "rb")
+        # empty files can't be memory-mapped
+        if os.fstat(self._file.fileno()).st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+
+    @property
+    def document_ids(self) -> List[Optional[str]]:
+        return [entry.document_id for entry in self.entries]
+
+    def read(self, position: int) -> str:
+        """Returns the raw text of the document at `position`."""
+        entry = self.entries[position]
+        text = self._data[entry.offset:entry.offset + entry.length].decode("utf-8")
+        # same newline translation as when reading the file in text mode
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+    def __getitem__(self, position: int) -> HipeDocument:
+        return lines2document(self.read(position).split("\n"), self.path,
+                              hipe_format_version=self.hipe_format_version, **self._parse_kwargs)
+
+    def get(self, document_id: str) -> HipeDocument:
+        """Parses the document with the given `document_id`.
+
+        :raises KeyError: If there is no such document in the file.
+        """
+        return self[self._positions[document_id]]
+
+    def documents(self, keys: Iterable[Union[int, str]]) -> Iterator[HipeDocument]:
+        """Parses the documents with the given positions (`int`) or `document_id`s (`str`)."""
+        for key in keys:
+            yield self.get(key) if isinstance(key, str) else self[key]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[HipeDocument]:
+        return self.documents(range(len(self)))
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self) -> "IndexedTSV":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,93 @@
+"""Shared vocabularies of tsv values, mapping each distinct value to a single instance and to an integer id."""
+
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional
+
+
+class Vocabulary(object):
+    """An append-only mapping between values (e.g. tags, NEL ids, flags or tokens) and integer ids.
+
+    HIPE columns contain few distinct values, repeated over millions of lines. Parsing with a `Vocabulary` (see the
+    `vocabulary` argument of `parse_tsv`) makes all the lines share one instance per distinct value, and
+    `HipeCorpus` stores its columns as ids into a `Vocabulary`. The same vocabulary can be shared by several files
+    or corpora, so that ids can be compared across them instead of strings.
+
+    Missing values (`None`, for rows with missing columns) are treated as any other value.
+
+    Example:
+        ```
+        vocabulary = Vocabulary()
+        docs = parse_tsv(file_path="HIPE-2022-v2.0-ajmc-dev-de.tsv", vocabulary=vocabulary)
+        b_pers = vocabulary.id("B-pers")
+        ```
+
+    :param values: Initial values, given ids in order of first occurrence.
+    """
+
+    def __init__(self, values: Iterable[Optional[Hashable]] = ()):
+        self.values: List[Optional[Hashable]] = []
+        self._ids: Dict[Optional[Hashable], int] = {}
+        self.encode(values)
+
+    def add(self, value: Optional[Hashable]) -> int:
+        """Adds `value` if it is not in the vocabulary yet, and returns its id."""
+        id_ = self._ids.get(value)
+        if id_ is None:
+            id_ = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return id_
+
+    def id(self, value: Optional[Hashable]) -> int:
+        """Returns the id of `value`.
+
+        :raises KeyError: If `value` is not in the vocabulary.
+        """
+        return self._ids[value]
+
+    def get(self, value: Optional[Hashable], default: Optional[int] = None) -> Optional[int]:
+        """Returns the id of `value`, or `default` if it is not in the vocabulary."""
+        return self._ids.get(value, default)
+
+    def intern(self, value: Optional[Hashable]) -> Optional[Hashable]:
+        """Returns the instance of the vocabulary equal to `value`, adding `value` if needed."""
+        return self.values[self.add(value)]
+
+    def encode(self, values: Iterable[Optional[Hashable]]) -> List[int]:
+        """Returns the ids of `values`, adding the unknown ones to the vocabulary."""
+        values = values if isinstance(values, list) else list(values)
+        ids = self._ids
+        for value in dict.fromkeys(values):
+            if value not in ids:
+                ids[value] = len(self.values)
+                self.values.append(value)
+        return list(map(ids.__getitem__, values))
+
+    def decode(self, ids: Iterable[int]) -> List[Optional[Hashable]]:
+        """Returns the values of `ids`."""
+        return list(map(self.values.__getitem__, ids))
+
+    def intern_all(self, values: Iterable[Optional[Hashable]]) -> List[Optional[Hashable]]:
+        """Same as `intern`, for several values."""
+        return self.decode(self.encode(values))
+
+    def __getitem__(self, id_: int) -> Optional[Hashable]:
+        return self.values[id_]
+
+    def __contains__(self, value: Optional[Hashable]) -> bool:
+        return value in self._ids
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[Optional[Hashable]]:
+        return iter(self.values)
+
+    def __repr__(self) -> str:
+        return f"Vocabulary({len(self)} values)"
+
+    def __getstate__(self):
+        # ids are rebuilt on loading, halving the size of pickles
+        return {"values": self.values}
+
+    def __setstate__(self, state):
+        self.values = state["values"]
+        self._ids = {value: id_ for id_, value in enumerate(self.values)}
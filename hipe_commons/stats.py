@@ -7,37 +7,42 @@ from .helpers.tsv import HipeDocument, parse_tsv, NE_ANNOTATION_TYPES
 def count_entities(docs: List[HipeDocument]) -> Dict:
 
     counts = {}
-    
-    for e_type in NE_ANNOTATION_TYPES:
-        for doc in docs:
-            if e_type in doc.entities:
+
+    for doc in docs:
+        # all the entity types of a document are decoded in a single pass
+        entities = dict(doc.entities)
+        for e_type in NE_ANNOTATION_TYPES:
+            if e_type in entities:
                 if e_type not in counts:
                     counts[e_type] = 0
-                counts[e_type] += len(doc.entities[e_type])
+                counts[e_type] += len(entities[e_type])
 
-    return counts
+    return {e_type: counts[e_type] for e_type in NE_ANNOTATION_TYPES if e_type in counts}
 
 
 def compute_entities_stats(docs: List[HipeDocument]) -> Dict[str, pd.DataFrame]:
     counts = {}
-    
-    for e_type in NE_ANNOTATION_TYPES:
-        for doc in docs:
-            if e_type in doc.entities:
+
+    for doc in docs:
+        # all the entity types of a document are decoded in a single pass
+        entities = dict(doc.entities)
+        for e_type in NE_ANNOTATION_TYPES:
+            if e_type in entities:
                 if e_type not in counts:
                     counts[e_type] = Counter()
-                
-                # counts per entity tag 
+
+                # counts per entity tag
                 doc_entity_counts = Counter(
                     [
                         entity.tag
-                        for entity in doc.entities[e_type]
+                        for entity in entities[e_type]
                     ]
                 )
 
                 # update total counts
                 counts[e_type] += doc_entity_counts
 
+    counts = {e_type: counts[e_type] for e_type in NE_ANNOTATION_TYPES if e_type in counts}
     for e_type in counts:
         df = pd.DataFrame.from_dict(
             dict(counts[e_type]), orient='index'
@@ -20,12 +20,14 @@ setup(
     ,
     install_requires=[
         "pandas",
+        "numpy",
         "tabulate",
         "stringdist"
     ],
     extras_require = {
         'huggingface': 'datasets',
-        'torch': 'torch'
+        'torch': 'torch',
+        'pyarrow': 'pyarrow'
     },
     long_description=read("README.md"),
     long_description_content_type='text/markdown'
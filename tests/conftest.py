@@ -42,3 +42,36 @@ def sample_label():
     return 'NE-COARSE-LIT'
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Keeps the default caches (e.g. of the files downloaded by `open_tsv`) out of the user's cache directory."""
+    from hipe_commons.helpers import download
+
+    cache_dir = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("HIPE_COMMONS_CACHE_DIR", str(cache_dir))
+    # the default download cache is created again, from the environment, and restored after the test
+    monkeypatch.setattr(download, "_download_cache", None)
+    monkeypatch.setattr(download, "_download_cache_set", False)
+    return cache_dir
+
+
+@pytest.fixture(scope="session")
+def local_tokenizer(sample_tsv_path_v1):
+    """A small WordPiece tokenizer built from the sample file, to run tests without downloading a model."""
+    from collections import Counter
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast
+
+    with open(sample_tsv_path_v1) as f:
+        tokens = [line.split('\t')[0] for line in f.read().split('\n')[1:] if line and not line.startswith('#')]
+    characters = sorted(set(''.join(tokens)))
+    words = [word for word, _ in Counter(tokens).most_common(300)]
+    specials = ['[PAD]', '[UNK]', '[CLS]', '[SEP]']
+    vocab = {t: i for i, t in enumerate(dict.fromkeys(specials + characters + ['##' + c for c in characters] + words))}
+
+    tokenizer = Tokenizer(models.WordPiece(vocab, unk_token='[UNK]'))
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single='[CLS] $A [SEP]', special_tokens=[('[CLS]', vocab['[CLS]']), ('[SEP]', vocab['[SEP]'])])
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token='[UNK]', pad_token='[PAD]',
+                                   cls_token='[CLS]', sep_token='[SEP]')
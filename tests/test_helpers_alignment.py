@@ -0,0 +1,48 @@
+import numpy as np
+import pip
+import pytest
+
+from hipe_commons.helpers.alignment import align_labels, continuation_label_ids, tokenize_and_align
+from hipe_commons.helpers.tsv import tsv_to_segmented_lists
+
+
+def test_align_labels():
+    labels_to_ids = {'O': 0, 'B-pers': 1, 'I-pers': 2, 'B-loc': 3}
+    assert continuation_label_ids(labels_to_ids).tolist() == [0, 2, 2, 3]
+
+    # two examples, "[CLS] Ai ##as Teu ##k ##ros [SEP]" and "[CLS] Sal ##amis , [SEP] [PAD]"
+    word_ids = np.array([-1, 0, 0, 1, 1, 1, -1] + [-1, 0, 0, 1, -1, -1])
+    offsets = np.array([0, 7, 13])
+    word_label_ids = np.array([1, 2] + [3, 0])
+    word_offsets = np.array([0, 2, 4])
+
+    assert align_labels(word_ids, offsets, word_label_ids, word_offsets).tolist() == \
+           [-100, 1, -100, 2, -100, -100, -100] + [-100, 3, -100, 0, -100, -100]
+    assert align_labels(word_ids, offsets, word_label_ids, word_offsets, continuation_label_ids(labels_to_ids),
+                        label_all_tokens=True).tolist() == \
+           [-100, 1, 2, 2, 2, 2, -100] + [-100, 3, 3, 0, -100, -100]
+
+
+@pytest.mark.skipif(pip.main(['show', 'transformers']) != 0,
+                    reason="""`transformers` not installed, skipping test.""")
+def test_tokenize_and_align(sample_tsv_path_v1, local_tokenizer):
+    data = tsv_to_segmented_lists(['NE-COARSE-LIT'], path=sample_tsv_path_v1)
+    labels_to_ids = {l: i for i, l in enumerate(sorted({l for labels in data['NE-COARSE-LIT'] for l in labels}))}
+    encodings = local_tokenizer(data['texts'], is_split_into_words=True)
+
+    arrays, offsets = tokenize_and_align(data['texts'], data['NE-COARSE-LIT'], local_tokenizer, labels_to_ids,
+                                         chunk_size=50)
+    assert len(offsets) == len(data['texts']) + 1
+    for i, word_ids in enumerate(encodings.word_ids(i) for i in range(len(data['texts']))):
+        assert arrays['input_ids'][offsets[i]:offsets[i + 1]].tolist() == encodings['input_ids'][i]
+        # the first subword of each word holds its label
+        expected = [labels_to_ids[data['NE-COARSE-LIT'][i][w]] if w is not None and (j == 0 or w != word_ids[j - 1])
+                    else -100 for j, w in enumerate(word_ids)]
+        assert arrays['labels'][offsets[i]:offsets[i + 1]].tolist() == expected
+
+    # overflowing tokens make new examples, aligned with the words they come from
+    arrays, offsets = tokenize_and_align(data['texts'], data['NE-COARSE-LIT'], local_tokenizer, labels_to_ids,
+                                         truncation=True, max_length=16, return_overflowing_tokens=True)
+    assert len(offsets) > len(data['texts']) + 1 and (np.diff(offsets) <= 16).all()
+    # words cut by an overflow are labeled on both sides
+    assert (arrays['labels'] != -100).sum() >= sum(map(len, data['texts']))
@@ -0,0 +1,80 @@
+import os
+
+from hipe_commons.helpers.cache import ParseCache
+from hipe_commons.helpers.tsv import parse_tsv, tsv_to_dict, tsv_to_dataframe
+
+
+def test_parse_tsv_cache(tmp_path, sample_tsv_path_v2):
+    cache = ParseCache(cache_dir=str(tmp_path))
+    docs = parse_tsv(hipe_format_version="v2", file_path=sample_tsv_path_v2)
+
+    for _ in range(2):  # cache miss, then cache hit
+        cached_docs = parse_tsv(hipe_format_version="v2", file_path=sample_tsv_path_v2, cache=cache)
+        assert len(os.listdir(tmp_path)) == 1
+        # lines and entities are only created when read
+        assert "_tsv_lines" not in vars(cached_docs[0])
+        assert repr(cached_docs[0].entities) == repr(docs[0].entities)
+        assert [[str(l) for l in doc._tsv_lines] for doc in cached_docs] == \
+               [[str(l) for l in doc._tsv_lines] for doc in docs]
+        assert [doc.path for doc in cached_docs] == [doc.path for doc in docs]
+
+    assert cache.invalidate(sample_tsv_path_v2) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_parse_tsv_cache_params(tmp_path, sample_tsv_path_v1):
+    cache = ParseCache(cache_dir=str(tmp_path))
+    docs = parse_tsv(file_path=sample_tsv_path_v1, cache=cache)
+    masked_docs = parse_tsv(file_path=sample_tsv_path_v1, mask_nel=True, cache=cache)
+    assert len(os.listdir(tmp_path)) == 2
+
+    assert [str(doc._tsv_lines) for doc in parse_tsv(file_path=sample_tsv_path_v1, mask_nel=True, cache=cache)] == \
+           [str(doc._tsv_lines) for doc in masked_docs] != [str(doc._tsv_lines) for doc in docs]
+
+
+def test_tsv_to_dict_cache(tmp_path, sample_tsv_path_v1):
+    cache = ParseCache(cache_dir=str(tmp_path), key_by="content")
+    for keep_comments in [False, True]:
+        dict_ = tsv_to_dict(path=sample_tsv_path_v1, keep_comments=keep_comments)
+        assert tsv_to_dict(path=sample_tsv_path_v1, keep_comments=keep_comments, cache=cache) == dict_
+        assert tsv_to_dict(path=sample_tsv_path_v1, keep_comments=keep_comments, cache=cache) == dict_
+
+    df = tsv_to_dataframe(path=sample_tsv_path_v1, keep_comments=True, cache=cache)
+    assert df.equals(tsv_to_dataframe(path=sample_tsv_path_v1, keep_comments=True))
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_cache_eviction(tmp_path, sample_tsv_path_v1):
+    source = tmp_path / "source.tsv"
+    source.write_text(open(sample_tsv_path_v1).read())
+    cache = ParseCache(cache_dir=str(tmp_path / "cache"), max_size=None)
+
+    keys = [cache.key(str(source), i=i) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, "x" * 1000)
+        os.utime(cache._entry_path(key), ns=(i, i))
+    assert cache.get(keys[0]) == "x" * 1000  # marks the first entry as recently used
+
+    cache.max_size = 2500
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+
+    # modifying the source file changes its keys
+    source.write_text("")
+    assert cache.key(str(source), i=0) != keys[0]
+
+
+def test_cache_arrays(tmp_path):
+    import numpy as np
+
+    cache = ParseCache(cache_dir=str(tmp_path))
+    arrays = {"input_ids": np.arange(10), "mask": np.ones((2, 3), dtype=np.int8), "empty": np.zeros(0)}
+    cache.put_arrays("key", arrays)
+
+    for mmap in [True, False]:
+        loaded = cache.get_arrays("key", mmap=mmap)
+        assert list(loaded) == list(arrays)
+        assert all(np.array_equal(loaded[k], arrays[k]) and loaded[k].dtype == arrays[k].dtype for k in arrays)
+    assert isinstance(loaded["input_ids"], np.ndarray) and isinstance(cache.get_arrays("key")["input_ids"], np.memmap)
+    assert cache.get_arrays("missing") is None and cache.invalidate() == 1
@@ -0,0 +1,57 @@
+import gzip
+import io
+import os
+import pathlib
+
+import pytest
+
+from hipe_commons.helpers.compression import codec_from_magic, decompress_stream, detect_codec
+from hipe_commons.helpers.tsv import parse_tsv, iter_tsv, write_tsv, tsv_to_dict, scan_labels, is_tsv_complete
+from hipe_commons.helpers.tsv_index import IndexedTSV
+
+
+@pytest.mark.parametrize("extension,codec", [(".gz", "gzip"), (".bz2", "bz2"), (".xz", "xz")])
+def test_compressed_tsv(tmp_path, sample_tsv_path_v2, extension, codec):
+    docs = parse_tsv(hipe_format_version="v2", file_path=sample_tsv_path_v2)
+    write_tsv([doc._tsv_lines for doc in docs], str(tmp_path / "plain.tsv"), hipe_format_version="v2")
+    path = str(tmp_path / f"compressed.tsv{extension}")
+    write_tsv([doc._tsv_lines for doc in docs], path, hipe_format_version="v2")
+    assert detect_codec(path) == codec and detect_codec(str(tmp_path / "plain.tsv")) is None
+
+    plain_docs = parse_tsv(hipe_format_version="v2", file_path=str(tmp_path / "plain.tsv"))
+    url = pathlib.Path(os.path.abspath(path)).as_uri()
+    for compressed_docs in [parse_tsv(hipe_format_version="v2", file_path=path),
+                            iter_tsv(hipe_format_version="v2", file_url=url)]:
+        assert [[str(l) for l in doc._tsv_lines] for doc in compressed_docs] == \
+               [[str(l) for l in doc._tsv_lines] for doc in plain_docs]
+
+    assert tsv_to_dict(path=path, hipe_format_version="v2", keep_comments=True) == \
+           tsv_to_dict(path=str(tmp_path / "plain.tsv"), hipe_format_version="v2", keep_comments=True)
+    assert scan_labels(['NE-COARSE-LIT'], url=url, hipe_format_version="v2") == \
+           scan_labels(['NE-COARSE-LIT'], path=sample_tsv_path_v2, hipe_format_version="v2")
+    assert is_tsv_complete(path, [doc.metadata['hipe-newsbench:document_id'] for doc in docs])
+
+    with pytest.raises(ValueError):
+        IndexedTSV(path, hipe_format_version="v2", write_index=False)
+
+
+def test_decompress_stream(tmp_path, sample_tsv_path_v1):
+    with open(sample_tsv_path_v1, "rb") as f:
+        data = f.read()
+
+    # detection by magic bytes, whatever the extension
+    misnamed_path = str(tmp_path / "misnamed.tsv")
+    write_tsv([doc._tsv_lines for doc in parse_tsv(file_path=sample_tsv_path_v1)], misnamed_path, compression="gzip")
+    assert detect_codec(misnamed_path) == "gzip"
+    assert tsv_to_dict(path=misnamed_path) == tsv_to_dict(path=sample_tsv_path_v1)
+
+    # concatenated gzip members, as written by `pigz`
+    half = len(data) // 2
+    stream = decompress_stream(io.BytesIO(gzip.compress(data[:half]) + gzip.compress(data[half:])))
+    assert stream.read() == data
+
+    assert decompress_stream(io.BytesIO(data)).read() == data
+    assert codec_from_magic(data[:10]) is None and codec_from_magic(b"BZh") is None
+
+    with pytest.raises(EOFError):
+        decompress_stream(io.BytesIO(gzip.compress(data)[:1000])).read()
@@ -0,0 +1,72 @@
+from hipe_commons.helpers.corpus import HipeCorpus, parse_datasets
+from hipe_commons.helpers.tsv import parse_tsv, HipeDocument, TSVAnnotation_v2, TSVAnnotation
+
+
+def test_corpus_from_tsv(sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        docs = parse_tsv(hipe_format_version=hipe_format_version, file_path=path)
+        corpus = HipeCorpus.from_tsv(hipe_format_version=hipe_format_version, file_path=path)
+
+        assert len(corpus) == len(docs)
+        assert corpus.n_tokens == sum(doc.n_tokens for doc in docs)
+        for doc, corpus_doc in zip(docs, corpus):
+            assert isinstance(corpus_doc, HipeDocument)
+            assert corpus_doc.path == doc.path
+            assert corpus_doc.metadata == doc.metadata
+            assert [(l.n, str(l)) for l in corpus_doc._tsv_lines] == [(l.n, str(l)) for l in doc._tsv_lines]
+            assert {k: [str(e) for e in v] for k, v in corpus_doc.entities.items()} == \
+                   {k: [str(e) for e in v] for k, v in doc.entities.items()}
+
+
+def test_corpus_columns(sample_tsv_path_v2):
+    corpus = HipeCorpus.from_tsv(hipe_format_version="v2", file_path=sample_tsv_path_v2)
+    lines = [line for doc in parse_tsv(hipe_format_version="v2", file_path=sample_tsv_path_v2)
+             for line in doc._tsv_lines if isinstance(line, TSVAnnotation_v2)]
+
+    assert corpus.tokens() == [line.token for line in lines]
+    assert corpus.column('NE-COARSE-LIT').tolist() == [line.ne_coarse_lit for line in lines]
+    assert corpus.line(-1) == lines[-1]
+
+    # codes can be compared without decoding strings
+    b_pers = corpus.vocabulary.id('B-pers')
+    assert (corpus.codes['ne_coarse_lit'] == b_pers).sum() == sum(line.ne_coarse_lit == 'B-pers' for line in lines)
+
+
+def test_parse_datasets(tmp_path, sample_tsv_path_v1):
+    for language in ["de", "fr"]:
+        (tmp_path / language).mkdir()
+        (tmp_path / language / f"HIPE-2022-v2.0-ajmc-dev-{language}.tsv").write_text(open(sample_tsv_path_v1).read())
+    (tmp_path / "fr" / "HIPE-2022-v2.0-ajmc-test-fr.tsv").write_bytes(b"TOKEN\nAias\xff\n")
+
+    datasets = parse_datasets(str(tmp_path), workers=2)
+    expected = HipeCorpus.from_tsv(file_path=sample_tsv_path_v1)
+
+    assert sorted(datasets) == ["de", "fr"]
+    for language, results in datasets.items():
+        for path, result in results.items():
+            assert result.path == path and result.language == language
+            if path.endswith("test-fr.tsv"):
+                assert result.corpus is None and "UnicodeDecodeError" in result.error
+            else:
+                assert result.error is None
+                assert result.corpus.tokens() == expected.tokens()
+                assert len(result.corpus) == len(expected)
+
+
+def test_corpus_dump(tmp_path, sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        corpus = HipeCorpus.from_tsv(hipe_format_version=hipe_format_version, file_path=path)
+        assert corpus.documents_tsv() == [doc.to_tsv() for doc in parse_tsv(hipe_format_version=hipe_format_version,
+                                                                            file_path=path)]
+
+        corpus.dump(str(tmp_path / "dump.tsv"), batch_size=3)
+        with open(path) as f:
+            assert (tmp_path / "dump.tsv").read_text() == f.read()
+
+        corpus.dump(str(tmp_path / "dump.tsv.gz"))
+        assert HipeCorpus.from_tsv(hipe_format_version=hipe_format_version, file_path=str(tmp_path / "dump.tsv.gz"))\
+                   .documents_tsv() == corpus.documents_tsv()
+
+    # missing values
+    corpus = HipeCorpus.from_documents([HipeDocument(None, [TSVAnnotation(1, "a", "O", *[None] * 8)])])
+    assert corpus.documents_tsv() == ["a\tO" + "\t_" * 8]
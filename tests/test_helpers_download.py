@@ -0,0 +1,118 @@
+import errno
+import hashlib
+import http.server
+import shutil
+import threading
+from functools import partial
+
+import pytest
+
+from hipe_commons.helpers import download
+from hipe_commons.helpers.download import DownloadCache, get_download_cache, set_download_cache
+from hipe_commons.helpers.tsv import parse_tsv, tsv_to_dict
+
+
+class _ETagHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files with an `ETag` (and a `Last-Modified`) header, answering conditional requests with a 304."""
+    statuses = []
+    unavailable = False
+
+    def send_head(self):
+        if self.unavailable:
+            self.send_error(503)
+            return None
+        path = self.translate_path(self.path)
+        try:
+            with open(path, "rb") as f:
+                etag = '"' + hashlib.sha256(f.read()).hexdigest() + '"'
+        except OSError:
+            etag = None
+
+        if etag is not None and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return None
+        return super().send_head()
+
+    def send_response(self, code, message=None):
+        self.statuses.append(code)
+        super().send_response(code, message)
+        if code == 200:
+            with open(self.translate_path(self.path), "rb") as f:
+                self.send_header("ETag", '"' + hashlib.sha256(f.read()).hexdigest() + '"')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """A local http server serving `tmp_path / 'www'`, yielding its base url."""
+    (tmp_path / "www").mkdir()
+    _ETagHandler.statuses, _ETagHandler.unavailable = [], False
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), partial(_ETagHandler, directory=str(tmp_path / "www")))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_cache(tmp_path, http_server, sample_tsv_path_v1, sample_tsv_path_v2, monkeypatch):
+    shutil.copy(sample_tsv_path_v1, tmp_path / "www" / "data.tsv")
+    url = f"{http_server}/data.tsv"
+    cache = DownloadCache(cache_dir=str(tmp_path / "cache"), backoff=0)
+
+    path = cache.fetch(url)
+    assert cache.fetch(url) == path and _ETagHandler.statuses == [200, 304]
+    with open(path, "rb") as f, open(sample_tsv_path_v1, "rb") as g:
+        assert f.read() == g.read()
+
+    # changed on the server
+    shutil.copy(sample_tsv_path_v2, tmp_path / "www" / "data.tsv")
+    with open(cache.fetch(url), "rb") as f, open(sample_tsv_path_v2, "rb") as g:
+        assert f.read() == g.read()
+    assert _ETagHandler.statuses == [200, 304, 200]
+
+    # transient server errors, after retries
+    _ETagHandler.unavailable = True
+    with pytest.warns(UserWarning):
+        assert cache.fetch(url) == path
+    assert _ETagHandler.statuses[3:] == [503] * 4
+    _ETagHandler.unavailable = False
+
+    # offline mode, and other server errors
+    offline_cache = DownloadCache(cache_dir=str(tmp_path / "cache"), offline=True)
+    assert offline_cache.fetch(url) == path and len(_ETagHandler.statuses) == 7
+    with pytest.raises(FileNotFoundError):
+        offline_cache.fetch(f"{http_server}/other.tsv")
+    with pytest.raises(OSError):
+        cache.fetch(f"{http_server}/other.tsv")
+
+    # errors while storing a response are not hidden by the cached file
+    def _store(url, response):
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(cache, "_store", _store)
+    shutil.copy(sample_tsv_path_v1, tmp_path / "www" / "data.tsv")
+    with pytest.raises(OSError, match="No space left"):
+        cache.fetch(url)
+
+    assert cache.invalidate(url) == 1 and cache.metadata(url) is None
+
+
+def test_download_cache_parsing(tmp_path, http_server, sample_tsv_path_v1, cache_dir, monkeypatch):
+    shutil.copy(sample_tsv_path_v1, tmp_path / "www" / "data.tsv")
+    url = f"{http_server}/data.tsv"
+    # the cache is opt-in
+    assert get_download_cache() is None
+    monkeypatch.setattr(download, "_download_cache_set", False)
+    monkeypatch.setenv("HIPE_COMMONS_DOWNLOAD_CACHE", "1")
+    # the default cache, in `HIPE_COMMONS_CACHE_DIR` (see the `cache_dir` fixture), then no cache
+    assert get_download_cache().cache_dir == str(cache_dir / "downloads")
+    for cache in [get_download_cache(), None]:
+        set_download_cache(cache)
+        docs = parse_tsv(file_url=url)
+        assert [[str(l) for l in doc._tsv_lines] for doc in docs] == \
+               [[str(l) for l in doc._tsv_lines] for doc in parse_tsv(file_path=sample_tsv_path_v1)]
+        assert tsv_to_dict(url=url) == tsv_to_dict(path=sample_tsv_path_v1)
+    assert _ETagHandler.statuses == [200, 304, 200, 200]
@@ -0,0 +1,53 @@
+import pip
+import pytest
+
+from hipe_commons.helpers.tsv import parse_tsv, write_tsv, tsv_to_dataframe, TSVComment, COL_LABELS_V2
+
+
+@pytest.mark.skipif(pip.main(['show', 'pyarrow']) != 0,
+                    reason="""`pyarrow` not installed, skipping test.""")
+def test_parquet_round_trip(tmp_path, sample_tsv_path_v1, sample_tsv_path_v2):
+    from hipe_commons.helpers.parquet import write_parquet, read_parquet_documents
+    import pyarrow.parquet as pq
+
+    for hipe_format_version, path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        docs = parse_tsv(hipe_format_version=hipe_format_version, file_path=path)
+        # an empty document, whose comments must be kept
+        documents = [doc._tsv_lines for doc in docs] + [[TSVComment(0, "hipe2022:document_id", "empty")]]
+
+        write_parquet(documents, str(tmp_path / "docs.parquet"), hipe_format_version=hipe_format_version,
+                      row_group_size=1000)
+        read_docs = read_parquet_documents(str(tmp_path / "docs.parquet"))
+
+        write_tsv(documents, str(tmp_path / "expected.tsv"), hipe_format_version=hipe_format_version)
+        write_tsv([doc._tsv_lines for doc in read_docs], str(tmp_path / "actual.tsv"),
+                  hipe_format_version=hipe_format_version)
+        assert (tmp_path / "actual.tsv").read_text() == (tmp_path / "expected.tsv").read_text()
+
+        # row groups contain whole documents
+        metadata = pq.ParquetFile(str(tmp_path / "docs.parquet")).metadata
+        assert metadata.num_row_groups > 1
+        document_ids = pq.read_table(str(tmp_path / "docs.parquet"), columns=["document"]).column("document")
+        row_group_ends = [sum(metadata.row_group(j).num_rows for j in range(i + 1)) for i in range(metadata.num_row_groups)]
+        assert all(document_ids[end - 1] != document_ids[end] for end in row_group_ends[:-1])
+
+
+@pytest.mark.skipif(pip.main(['show', 'pyarrow']) != 0,
+                    reason="""`pyarrow` not installed, skipping test.""")
+def test_read_parquet(tmp_path, sample_tsv_path_v2):
+    from hipe_commons.helpers.parquet import write_parquet, read_parquet
+
+    write_parquet(parse_tsv(hipe_format_version="v2", file_path=sample_tsv_path_v2), str(tmp_path / "docs.parquet"),
+                  hipe_format_version="v2")
+    df = read_parquet(str(tmp_path / "docs.parquet"), columns=["TOKEN", "NE-COARSE-LIT", "hipe-newsbench:document_id"])
+    expected = tsv_to_dataframe(path=sample_tsv_path_v2, keep_comments=True, hipe_format_version="v2")
+
+    assert list(df.columns) == ["TOKEN", "NE-COARSE-LIT", "hipe-newsbench:document_id"]
+    assert df["NE-COARSE-LIT"].dtype == "category"
+    assert all(df[column].tolist() == expected[column].tolist() for column in df.columns)
+
+    # commented fields changing inside documents (e.g. `segment_iiif_link`) take their last value before each line
+    df = read_parquet(str(tmp_path / "docs.parquet"))
+    metadata_fields = [column for column in expected.columns if column not in ["n"] + COL_LABELS_V2]
+    assert "segment_iiif_link" in metadata_fields
+    assert all(df[column].tolist() == expected[column].tolist() for column in metadata_fields)
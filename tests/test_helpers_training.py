@@ -0,0 +1,71 @@
+import os
+
+import pip
+import pytest
+
+from hipe_commons.helpers.tsv import tsv_to_segmented_lists, tsv_to_torch_dataset, get_unique_labels
+
+pytestmark = pytest.mark.skipif(pip.main(['show', 'torch']) != 0 or pip.main(['show', 'transformers']) != 0,
+                                reason="""`torch` or `transformers` not installed, skipping test.""")
+
+
+@pytest.fixture(scope="module")
+def torch_dataset(sample_tsv_path_v1, local_tokenizer):
+    data = tsv_to_segmented_lists(['NE-COARSE-LIT'], path=sample_tsv_path_v1)
+    unique_labels = get_unique_labels(label_list=[l for l_list in data['NE-COARSE-LIT'] for l in l_list])
+    labels_to_ids = {l: i for i, l in enumerate(unique_labels)}
+    return tsv_to_torch_dataset('NE-COARSE-LIT', labels_to_ids, local_tokenizer, path=sample_tsv_path_v1), data
+
+
+def test_hipe_torch_dataset(torch_dataset, local_tokenizer):
+    dataset, data = torch_dataset
+    encodings = local_tokenizer(data['texts'], is_split_into_words=True)
+
+    assert len(dataset) == len(dataset.labels) == len(data['texts'])
+    assert all(dataset[i]['input_ids'].tolist() == encodings['input_ids'][i] for i in range(len(dataset)))
+    assert all(len(dataset[i]['labels']) == length for i, length in enumerate(dataset.lengths.tolist()))
+    # examples are views of the flat tensors
+    assert dataset[1]['input_ids'].data_ptr() == dataset.tensors['input_ids'][dataset.offsets[1]:].data_ptr()
+
+
+def test_dataloader(torch_dataset, local_tokenizer):
+    import torch
+    from hipe_commons.helpers.training import LengthBucketSampler, DynamicPaddingCollator
+
+    dataset, _ = torch_dataset
+    sampler = LengthBucketSampler(dataset.lengths, batch_size=8, bucket_size=4)
+    loader = torch.utils.data.DataLoader(dataset, batch_sampler=sampler, collate_fn=DynamicPaddingCollator(
+        pad_token_id=local_tokenizer.pad_token_id, pad_to_multiple_of=4))
+
+    batches = list(loader)
+    batches_indices = list(sampler)
+    assert len(batches) == len(sampler)
+    assert sorted(i for indices in batches_indices for i in indices) == list(range(len(dataset)))
+    sampler.set_epoch(1)
+    assert list(sampler) != batches_indices
+
+    for batch_indices, batch in zip(batches_indices, batches):
+        lengths = dataset.lengths[batch_indices]
+        assert batch['input_ids'].shape[1] == -(-lengths.max().item() // 4) * 4
+        assert (batch['attention_mask'].sum(dim=1) == lengths).all()
+        assert ((batch['labels'] == -100) | (batch['attention_mask'] == 1)).all()
+
+
+def test_torch_dataset_cache(tmp_path, torch_dataset, sample_tsv_path_v1, local_tokenizer):
+    from hipe_commons.helpers.cache import ParseCache
+
+    dataset, data = torch_dataset
+    labels_to_ids = {l: i for i, l in enumerate(get_unique_labels(label_list=sum(data['NE-COARSE-LIT'], [])))}
+    cache = ParseCache(cache_dir=str(tmp_path), key_by="content")
+
+    for _ in range(2):  # cache miss, then cache hit
+        cached = tsv_to_torch_dataset('NE-COARSE-LIT', labels_to_ids, local_tokenizer, path=sample_tsv_path_v1,
+                                      cache=cache)
+        assert len(os.listdir(tmp_path)) == 1
+        assert all(cached.tensors[k].equal(dataset.tensors[k]) for k in dataset.tensors)
+        assert cached.offsets.equal(dataset.offsets)
+
+    # other tokenizer arguments make another entry
+    truncated = tsv_to_torch_dataset('NE-COARSE-LIT', labels_to_ids, local_tokenizer, path=sample_tsv_path_v1,
+                                     cache=cache, truncation=True, max_length=8)
+    assert len(os.listdir(tmp_path)) == 2 and truncated.lengths.max() <= 8
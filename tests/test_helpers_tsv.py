@@ -1,3 +1,6 @@
+import dataclasses
+import io
+import itertools
 import os
 import sys
 
@@ -5,7 +8,10 @@ import pip
 import pytest
 
 from hipe_commons.helpers.tsv import parse_tsv, HipeDocument, tsv_to_dataframe, tsv_to_segmented_lists, tsv_to_torch_dataset, \
-    get_unique_labels, tsv_to_huggingface_dataset, tsv_to_dict
+    get_unique_labels, tsv_to_huggingface_dataset, tsv_to_dict, iter_tsv, iter_segments, scan_labels, \
+    lines2entities, parse_tsv_line, parse_columns, merge_comments, TSVAnnotation, TSVAnnotation_v2, \
+    write_tsv, TSVWriter, mask_lines, mask_tsv_files, mask_all_groundtruth, mask_nel_groundtruth, \
+    parse_annotation_v2, parse_comment, TSVComment, COL_LABELS, COL_LABELS_V2, IOB_FIRST_LINE
 
 
 def test_parse_tsv_from_file(sample_tsv_path_v1):
@@ -22,6 +28,96 @@ def test_parse_tsv_from_file_v2(sample_tsv_path_v2):
     assert all([isinstance(doc, HipeDocument) for doc in docs])
 
 
+def test_iter_tsv(sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        docs = parse_tsv(hipe_format_version=hipe_format_version, file_path=path)
+        with open(path) as f:
+            streamed_docs = iter_tsv(hipe_format_version=hipe_format_version, file=f)
+            assert not isinstance(streamed_docs, list)
+
+            for doc, streamed_doc in zip(docs, streamed_docs, strict=True):
+                assert streamed_doc.metadata == doc.metadata
+                assert [str(l) for l in streamed_doc._tsv_lines] == [str(l) for l in doc._tsv_lines]
+                assert [l.n for l in streamed_doc._tsv_lines] == [l.n for l in doc._tsv_lines]
+
+
+def test_lines2entities():
+    lines = [
+        parse_tsv_line(line, i)
+        for i, line in enumerate([
+            "# hipe2022:document_id = doc",
+            "Aias\tB-pers\t_\tB-pers.myth\t_\t_\tO\tQ172725\t_\t_",
+            "Teukros\tB-pers\t_\tI-pers.myth\t_\t_\tO\t_\t_\tNoSpaceAfter",
+            ",\tO\t_\tO\t_\t_\tO\t_\t_\t_",
+            "Salamis\tI-loc\t_\tO\t_\t_\tB-loc\tNIL\t_\tEndOfLine",
+        ])
+    ]
+    entities = lines2entities(lines)
+
+    assert [(e.text, e.tag, e.wikidata_id, e.line_numbers) for e in entities["coarse_lit"]] == [
+        ("Aias ", "pers", "Q172725", [2]),
+        ("Teukros", "pers", None, [3]),
+        ("Salamis ", "loc", "NIL", [5]),
+    ]
+    assert [(e.text, e.tag) for e in entities["fine_lit"]] == [("Aias Teukros", "pers.myth")]
+    assert [(e.text, e.tag, e.wikidata_id) for e in entities["nested"]] == [("Salamis ", "loc", None)]
+    assert entities["coarse_meto"] == []
+    assert list(lines2entities(lines, ["fine_lit"])) == ["fine_lit"]
+
+
+def test_lazy_entities(sample_tsv_path_v1):
+    docs = parse_tsv(hipe_format_version="v1", file_path=sample_tsv_path_v1)
+    doc = next(doc for doc in docs if "coarse_lit" in doc.entities)
+
+    assert doc.entities._pending == {"coarse_meto", "fine_lit", "fine_meto", "fine_comp", "nested"}
+    assert list(doc.entities) == [e_type for e_type, entities in lines2entities(doc._tsv_lines).items() if entities]
+    assert not doc.entities._pending
+
+    docs = parse_tsv(hipe_format_version="v1", file_path=sample_tsv_path_v1, decode_entities=False)
+    assert all(doc.entities == {} and doc.metadata and doc.n_tokens for doc in docs)
+
+
+@pytest.mark.parametrize("hipe_format_version,n_values", [("v1", 10), ("v2", 13)])
+def test_parse_columns(hipe_format_version, n_values):
+    row = "\t".join(f"v{i}" for i in range(n_values))
+    lines = ["# hipe2022:document_id = doc-1", "", row, "#hashtag" + row[2:], row + "\textra", "short\trow", row, ""]
+    expected = [parse_tsv_line(line, n, hipe_format_version=hipe_format_version) for n, line in enumerate(lines) if line]
+
+    columns, comments = parse_columns(lines, hipe_format_version=hipe_format_version)
+    annotation_type = TSVAnnotation if hipe_format_version == "v1" else TSVAnnotation_v2
+    annotations = [annotation_type(*values) for values in zip(*columns.values())]
+
+    assert merge_comments(annotations, comments) == expected
+    assert columns["n"] == [2, 3, 4, 5, 6]
+
+
+@pytest.mark.parametrize("hipe_format_version,n_values", [("v1", 10), ("v2", 13)])
+def test_parse_columns_regular_rows(hipe_format_version, n_values):
+    # only rows with all their values, which are split all together
+    rows = ["\t".join(f"v{i}-{j}" for i in range(n_values)) for j in range(3)]
+    # the v1 header is skipped, the v2 one is a commented line
+    header = "\t".join(COL_LABELS) if hipe_format_version == "v1" else IOB_FIRST_LINE
+    annotation_type = TSVAnnotation if hipe_format_version == "v1" else TSVAnnotation_v2
+
+    for lines in [rows, [header, "# hipe2022:document_id = doc-1"] + rows + [""]]:
+        expected = [parse_tsv_line(line, n, hipe_format_version=hipe_format_version)
+                    for n, line in enumerate(lines) if line and line != "\t".join(COL_LABELS)]
+        columns, comments = parse_columns(lines, hipe_format_version=hipe_format_version)
+        assert merge_comments([annotation_type(*values) for values in zip(*columns.values())], comments) == expected
+
+        columns, _ = parse_columns(lines, hipe_format_version=hipe_format_version, fields=["token", "misc"])
+        assert list(columns) == ["n", "token", "misc"]
+        assert columns["misc"] == [line.misc for line in expected if isinstance(line, annotation_type)]
+
+
+def test_parse_comment():
+    assert parse_comment("# hipe2022:document_id = doc-1", 3) == TSVComment(3, "hipe2022:document_id", "doc-1")
+    with pytest.raises(ValueError, match=r"\(n=7\).*a = b = c"):
+        parse_comment("# a = b = c", 7)
+    with pytest.raises(ValueError, match=r"\(n=1\)"):
+        parse_tsv(file=io.StringIO("TOKEN\n# a = b = c\n"))
+
+
 def test_parse_tsv_from_url(sample_tsv_url):
     docs = parse_tsv(file_url=sample_tsv_url)
 
@@ -93,3 +189,236 @@ def test_tsv_to_dict(sample_tsv_url, sample_tsv_string):
     # Make sure there are as many annotation row in the file as there are rows in the df
     file_lines = len([1 for line in sample_tsv_string.split('\n') if (not line.startswith('#')) and line.strip('\n')])
     assert all([len(dict_[k])+1 == file_lines for k in dict_.keys()])
+
+
+def test_tsv_to_dict_keep_comments(sample_tsv_path_v2):
+    dict_ = tsv_to_dict(path=sample_tsv_path_v2, keep_comments=True, hipe_format_version="v2")
+    docs = parse_tsv(file_path=sample_tsv_path_v2, hipe_format_version="v2")
+
+    assert len(set(map(len, dict_.values()))) == 1
+    assert dict_['hipe-newsbench:document_id'] == [doc.metadata['hipe-newsbench:document_id'] for doc in docs
+                                                   for _ in range(doc.n_tokens)]
+    assert dict_['TOKEN'] == [line.token for doc in docs for line in doc._tsv_lines if hasattr(line, 'token')]
+
+
+def test_tsv_to_dataframe_categorical(sample_tsv_path_v2):
+    df = tsv_to_dataframe(path=sample_tsv_path_v2, keep_comments=True, hipe_format_version="v2")
+    categorical_df = tsv_to_dataframe(path=sample_tsv_path_v2, keep_comments=True, hipe_format_version="v2",
+                                      categorical=True)
+
+    assert categorical_df['n'].dtype == 'int64'
+    assert categorical_df['NE-COARSE-LIT'].dtype == 'category'
+    assert categorical_df['hipe-newsbench:document_id'].dtype == 'category'
+    assert categorical_df['TOKEN'].dtype != 'category'
+    assert categorical_df.astype(object).equals(df.astype(object))
+    assert categorical_df.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum() / 3
+
+
+@pytest.mark.skipif(pip.main(['show', 'pyarrow']) != 0,
+                    reason="""`pyarrow` not installed, skipping test.""")
+def test_tsv_to_dataframe_pyarrow(sample_tsv_path_v1):
+    df = tsv_to_dataframe(path=sample_tsv_path_v1, keep_comments=True)
+    arrow_df = tsv_to_dataframe(path=sample_tsv_path_v1, keep_comments=True, categorical=['MISC'],
+                                dtype_backend="pyarrow")
+
+    assert str(arrow_df['n'].dtype) == 'int64[pyarrow]'
+    assert str(arrow_df['MISC'].dtype).startswith('dictionary<values=string')
+    assert all(arrow_df[column].tolist() == df[column].tolist() for column in df.columns)
+
+
+def test_tsv_to_lists_boundaries(sample_tsv_path_v1):
+    data = tsv_to_segmented_lists(['NE-COARSE-LIT'], path=sample_tsv_path_v1, segmentation_flag='EndOfSentence')
+    dict_ = tsv_to_dict(path=sample_tsv_path_v1, keep_comments=True)
+
+    assert [token for text in data['texts'] for token in text] == dict_['TOKEN']
+    assert [label for labels in data['NE-COARSE-LIT'] for label in labels] == dict_['NE-COARSE-LIT']
+    assert list(map(len, data['texts'])) == list(map(len, data['doc_ids']))
+    ends = [dict_['MISC'][i - 1] for i in itertools.accumulate(map(len, data['texts']))]
+    assert all('EndOfSentence' in misc for misc in ends[:-1])
+
+
+def test_iter_segments(sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        data = tsv_to_segmented_lists(['NE-COARSE-LIT', 'NEL-LIT'], path=path, hipe_format_version=hipe_format_version)
+        with open(path) as f:
+            examples = iter_segments(['NE-COARSE-LIT', 'NEL-LIT'], hipe_format_version=hipe_format_version, file=f)
+            assert not isinstance(examples, list)
+            examples = list(examples)
+
+        assert all(data[k] == [example[k] for example in examples] for k in data)
+
+
+@pytest.mark.skipif(pip.main(['show', 'datasets']) != 0,
+                    reason="""`datasets` not installed, skipping test.""")
+def test_tsv_to_huggingface_dataset_release(tmp_path, sample_tsv_path_v2):
+    for language in ['de', 'fr']:
+        os.makedirs(tmp_path / 'release' / language)
+        with open(sample_tsv_path_v2) as f, open(tmp_path / 'release' / language / 'test.tsv', 'w') as g:
+            g.write(f.read())
+
+    data = tsv_to_segmented_lists(['NE-COARSE-LIT'], path=sample_tsv_path_v2, hipe_format_version="v2")
+    dataset = tsv_to_huggingface_dataset(['NE-COARSE-LIT'], base_dir=str(tmp_path / 'release'),
+                                         hipe_format_version="v2", num_proc=2, cache_dir=str(tmp_path / 'cache'))
+
+    assert len(dataset.cache_files) == 2
+    assert dataset['texts'] == data['texts'] * 2
+    assert dataset['NE-COARSE-LIT'] == data['NE-COARSE-LIT'] * 2
+
+
+def test_scan_labels(tmp_path, sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        df = tsv_to_dataframe(path=path, hipe_format_version=hipe_format_version)
+        vocabularies = scan_labels(['NE-COARSE-LIT', 'NEL-LIT'], path=path, hipe_format_version=hipe_format_version,
+                                   chunk_size=100)
+
+        for label_type, vocabulary in vocabularies.items():
+            assert vocabulary.labels == get_unique_labels(label_list=df[label_type].tolist())
+            assert vocabulary.counts == df[label_type].value_counts().to_dict()
+        assert vocabularies['NE-COARSE-LIT'].labels_to_ids['O'] == 0
+
+    for language in ['de', 'fr']:
+        os.makedirs(tmp_path / language)
+        with open(sample_tsv_path_v1) as f, open(tmp_path / language / 'test.tsv', 'w') as g:
+            g.write(f.read())
+    counts = scan_labels(['NE-COARSE-LIT'], path=sample_tsv_path_v1)['NE-COARSE-LIT'].counts
+    assert scan_labels(['NE-COARSE-LIT'], base_dir=str(tmp_path))['NE-COARSE-LIT'].counts == \
+           {label: 2 * count for label, count in counts.items()}
+
+    # rows with extra values are counted, rows missing a requested column are reported
+    with open(sample_tsv_path_v1) as f:
+        lines = f.read().split('\n')
+    first, second = [i for i, line in enumerate(lines) if line and not line.startswith('#')][1:3]
+    lines[first] += '\textra'
+    (tmp_path / 'malformed.tsv').write_text('\n'.join(lines))
+    assert scan_labels(['NE-COARSE-LIT'], path=str(tmp_path / 'malformed.tsv'))['NE-COARSE-LIT'].counts == counts
+    lines[second] = lines[second].split('\t')[0]
+    (tmp_path / 'malformed.tsv').write_text('\n'.join(lines))
+    with pytest.raises(ValueError, match=f'Line {second + 1} of .*malformed.tsv has 1 values'):
+        scan_labels(['NE-COARSE-LIT'], path=str(tmp_path / 'malformed.tsv'), chunk_size=3)
+
+
+def test_tsv_to_dict_columns(sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, path, prefix in [("v1", sample_tsv_path_v1, "hipe2022"),
+                                              ("v2", sample_tsv_path_v2, "hipe-newsbench")]:
+        for keep_comments in [False, True]:
+            dict_ = tsv_to_dict(path=path, keep_comments=keep_comments, hipe_format_version=hipe_format_version)
+            metadata_fields = [f'{prefix}:document_id'] if keep_comments else None
+            projected = tsv_to_dict(path=path, keep_comments=keep_comments, hipe_format_version=hipe_format_version,
+                                    columns=['NE-COARSE-LIT', 'TOKEN'], metadata_fields=metadata_fields)
+
+            assert list(projected) == ['n', 'TOKEN', 'NE-COARSE-LIT'] + (metadata_fields or [])
+            assert all(projected[k] == dict_[k] for k in projected)
+
+        df = tsv_to_dataframe(path=path, keep_comments=True, hipe_format_version=hipe_format_version,
+                              columns=['NE-COARSE-LIT'], metadata_fields=[], categorical=True)
+        assert list(df.columns) == ['n', 'NE-COARSE-LIT'] and df['NE-COARSE-LIT'].dtype == 'category'
+
+    with pytest.raises(KeyError):
+        tsv_to_dict(path=sample_tsv_path_v1, columns=['NE-COARSE'])
+
+
+def test_tsv_writer(tmp_path, sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        docs = [doc._tsv_lines for doc in parse_tsv(hipe_format_version=hipe_format_version, file_path=path)]
+        write_tsv(docs, str(tmp_path / "expected.tsv"), hipe_format_version=hipe_format_version)
+        expected = (tmp_path / "expected.tsv").read_text(encoding="utf-8")
+        # the header is not repeated when the first document starts with it, as the v2 `# global.columns` line
+        with open(path, encoding="utf-8") as f:
+            assert expected == f.read()
+        assert expected.count(IOB_FIRST_LINE) == (hipe_format_version == "v2")
+
+        # streamed from a generator, to a file and to a stream
+        write_tsv((doc._tsv_lines for doc in iter_tsv(hipe_format_version=hipe_format_version, file_path=path)),
+                  str(tmp_path / "streamed.tsv"), hipe_format_version=hipe_format_version)
+        assert (tmp_path / "streamed.tsv").read_text(encoding="utf-8") == expected
+
+        stream = io.StringIO()
+        with TSVWriter(stream, hipe_format_version=hipe_format_version) as writer:
+            for doc in docs:
+                writer.write_document(doc)
+        assert writer.n_documents == len(docs)
+        assert not stream.closed and stream.getvalue() == expected
+
+
+def test_mask_lines(sample_tsv_path_v2):
+    with open(sample_tsv_path_v2) as f:
+        lines = f.read().split("\n")
+
+    for mask_nerc, mask_function in [(True, mask_all_groundtruth), (False, mask_nel_groundtruth)]:
+        masked_lines = mask_lines(lines, mask_nerc=mask_nerc, mask_nel=True, hipe_format_version="v2")
+        assert len(masked_lines) == len(lines)
+        for line, masked_line in zip(lines, masked_lines):
+            if not line or line.startswith("#"):
+                assert masked_line == line
+            else:
+                masked_annotation = mask_function(parse_annotation_v2(line, 0))
+                assert isinstance(masked_annotation, TSVAnnotation_v2) and str(masked_annotation) == masked_line
+                assert "LED" not in masked_line
+                # flag columns left without any flag are `_`, as all empty v2 columns
+                assert "" not in masked_line.split("\t")
+
+    # rows with missing or extra values
+    assert mask_lines(["a\tB-pers", "a\tB-pers\t_\t_\t_\t_\t_\tQ1\t_\tLED0.0|NoSpaceAfter\textra"]) == \
+           ["a\t_", "a\t_\t_\t_\t_\t_\t_\t_\t_\tNoSpaceAfter\textra"]
+    assert mask_lines(["a\t_\t_\t_\t_\t_\t_\t_\t_\tLED0.0\t_\t_\tLED0.0"], hipe_format_version="v2") == \
+           ["a" + "\t_" * 12]
+
+    # column headers are kept as is
+    headers = ["\t".join(COL_LABELS)], [IOB_FIRST_LINE, "\t".join(COL_LABELS_V2)]
+    assert mask_lines(headers[0]) == headers[0]
+    assert mask_lines(headers[1], hipe_format_version="v2") == headers[1]
+
+
+def test_mask_tsv_files(tmp_path, sample_tsv_path_v1):
+    files = {sample_tsv_path_v1: str(tmp_path / "masked.tsv"),
+             str(tmp_path / "copy.tsv"): str(tmp_path / "masked.tsv.gz")}
+    with open(sample_tsv_path_v1) as f, open(tmp_path / "copy.tsv", "w") as g:
+        lines = f.read()
+        g.write(lines)
+
+    docs = parse_tsv(file_path=sample_tsv_path_v1, mask_nel=True)
+    for num_proc in [1, 2]:
+        assert mask_tsv_files(files, num_proc=num_proc, mask_nerc=False, mask_nel=True, chunk_size=100) == \
+               list(files.values())
+
+        for output_path in files.values():
+            masked_docs = parse_tsv(file_path=output_path)
+            assert [[str(l) for l in doc._tsv_lines] for doc in masked_docs] == \
+                   [[str(l) for l in doc._tsv_lines] for doc in docs]
+
+    with open(files[sample_tsv_path_v1]) as f:
+        assert f.read() == "\n".join(mask_lines(lines.split("\n"), mask_nerc=False))
+
+
+def test_hipe_document_to_tsv(tmp_path, sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        formatted_docs = parse_tsv(hipe_format_version=hipe_format_version, file_path=path)
+        docs = parse_tsv(hipe_format_version=hipe_format_version, file_path=path, keep_raw_text=True)
+        assert formatted_docs[0]._raw_lines is None and docs[0]._raw_lines is not None
+        assert [doc.to_tsv() for doc in docs] == [doc.to_tsv() for doc in formatted_docs] == \
+               ["\n".join(map(str, doc._tsv_lines)) for doc in docs]
+
+        # untouched documents are written back as they were read
+        write_tsv(docs, str(tmp_path / "output.tsv"), hipe_format_version=hipe_format_version)
+        with open(path) as f:
+            assert (tmp_path / "output.tsv").read_text() == f.read()
+
+    # replaced lines are formatted, missing values being written as `_`
+    doc = docs[0]
+    position, annotation = next((i, l) for i, l in enumerate(doc._tsv_lines) if isinstance(l, TSVAnnotation_v2))
+    doc._tsv_lines[position] = dataclasses.replace(annotation, ne_coarse_lit="B-test", render=None)
+    lines = doc.to_tsv().split("\n")
+    assert lines[position].split("\t")[1] == "B-test" and lines[position].split("\t")[9] == "_"
+    assert lines[:position] + lines[position + 1:] == [str(l) for i, l in enumerate(doc._tsv_lines) if i != position]
+
+    v1_annotation = TSVAnnotation(1, "a", "O", "O", "O", "O", "O", "O", "_", "_", "_")
+    assert HipeDocument(None, [v1_annotation.convert2_tsv_annotation_v2()]).to_tsv() == \
+           "a" + "\tO" * 6 + "\t_" * 6
+
+    # documents and lists of lines are written the same way, missing values included
+    for hipe_format_version, lines in [("v1", [TSVAnnotation(1, "a", "O", *[None] * 8)]),
+                                       ("v2", [v1_annotation.convert2_tsv_annotation_v2()])]:
+        write_tsv([HipeDocument(None, lines)], str(tmp_path / "document.tsv"), hipe_format_version=hipe_format_version)
+        write_tsv([lines], str(tmp_path / "lines.tsv"), hipe_format_version=hipe_format_version)
+        assert (tmp_path / "document.tsv").read_text() == (tmp_path / "lines.tsv").read_text()
+        assert "None" not in (tmp_path / "lines.tsv").read_text()
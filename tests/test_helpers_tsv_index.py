@@ -0,0 +1,44 @@
+import os
+import shutil
+
+from hipe_commons.helpers.tsv import parse_tsv
+from hipe_commons.helpers.tsv_index import IndexedTSV, build_tsv_index, load_tsv_index, default_index_path
+
+
+def _lines(doc):
+    return [(line.n, str(line)) for line in doc._tsv_lines]
+
+
+def test_indexed_tsv(tmp_path, sample_tsv_path_v1, sample_tsv_path_v2):
+    for hipe_format_version, sample_path in [("v1", sample_tsv_path_v1), ("v2", sample_tsv_path_v2)]:
+        path = str(tmp_path / os.path.basename(sample_path))
+        shutil.copy(sample_path, path)
+        docs = parse_tsv(hipe_format_version=hipe_format_version, file_path=path)
+
+        with IndexedTSV(path, hipe_format_version=hipe_format_version) as tsv:
+            assert os.path.exists(default_index_path(path))
+            assert len(tsv) == len(docs)
+            assert [_lines(doc) for doc in tsv] == [_lines(doc) for doc in docs]
+
+            for i in [len(docs) - 1, 0, 3]:
+                doc_id = tsv.entries[i].document_id
+                assert doc_id is not None and doc_id in docs[i].metadata.values()
+                assert _lines(tsv.get(doc_id)) == _lines(docs[i])
+                assert tsv.get(doc_id).entities.keys() == docs[i].entities.keys()
+
+
+def test_tsv_index_staleness(tmp_path, sample_tsv_path_v1):
+    path = str(tmp_path / "sample.tsv")
+    shutil.copy(sample_tsv_path_v1, path)
+    entries = build_tsv_index(path)
+
+    assert load_tsv_index(path) == entries
+    assert entries[1].line_number == 435 and entries[1].offset == len(b"".join(open(path, "rb").readlines()[:434]))
+
+    with open(path, "a") as f:
+        f.write("\n# hipe2022:document_id = new\nAias\tB-pers\t_\tB-pers.myth\t_\t_\tO\tQ172725\t_\t_\n")
+    assert load_tsv_index(path) is None
+
+    with IndexedTSV(path) as tsv:
+        assert tsv.document_ids[-1] == "new"
+        assert [line.token for line in tsv.get("new")._tsv_lines[1:]] == ["Aias"]
@@ -0,0 +1,40 @@
+import pickle
+
+from hipe_commons.helpers.corpus import HipeCorpus
+from hipe_commons.helpers.tsv import parse_tsv, TSVAnnotation
+from hipe_commons.helpers.vocabulary import Vocabulary
+
+
+def test_vocabulary():
+    vocabulary = Vocabulary(["O", "B-pers"])
+
+    assert vocabulary.encode(["B-pers", "O", "I-pers", "B-pers"]) == [1, 0, 2, 1]
+    assert vocabulary.id("I-pers") == 2 and vocabulary.get("B-loc") is None and "B-loc" not in vocabulary
+    assert vocabulary.decode([2, 0]) == ["I-pers", "O"]
+
+    value = "".join(["B-", "pers"])
+    assert vocabulary.intern(value) is vocabulary[1]
+    assert list(pickle.loads(pickle.dumps(vocabulary))) == list(vocabulary)
+
+
+def test_parse_tsv_vocabulary(sample_tsv_path_v1):
+    vocabulary = Vocabulary()
+    docs = parse_tsv(hipe_format_version="v1", file_path=sample_tsv_path_v1, vocabulary=vocabulary)
+    lines = [line for doc in docs for line in doc._tsv_lines if isinstance(line, TSVAnnotation)]
+
+    assert [tuple(line) for line in lines] == [tuple(line) for doc in parse_tsv(file_path=sample_tsv_path_v1)
+                                               for line in doc._tsv_lines if isinstance(line, TSVAnnotation)]
+    # one instance per distinct value, whatever the column
+    assert len({id(value) for line in lines for value in line[1:]}) == len(vocabulary)
+
+
+def test_share_vocabulary(sample_tsv_path_v1, sample_tsv_path_v2):
+    vocabulary = Vocabulary(["B-pers"])
+    corpus_v1 = HipeCorpus.from_tsv(hipe_format_version="v1", file_path=sample_tsv_path_v1)
+    corpus_v2 = HipeCorpus.from_tsv(hipe_format_version="v2", file_path=sample_tsv_path_v2, vocabulary=vocabulary)
+    lines = corpus_v1.lines()
+
+    corpus_v1.share_vocabulary(vocabulary)
+    assert corpus_v1.vocabulary is corpus_v2.vocabulary is vocabulary
+    assert corpus_v1.lines() == lines
+    assert (corpus_v1.codes['ne_coarse_lit'] == 0).sum() == sum(line.ne_coarse_lit == "B-pers" for line in lines)
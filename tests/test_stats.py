@@ -1,9 +1,30 @@
 import pytest
 
-from hipe_commons.stats import describe_dataset
+from hipe_commons.helpers import tsv
+from hipe_commons.helpers.tsv import parse_tsv, NE_ANNOTATION_TYPES
+from hipe_commons.stats import describe_dataset, count_entities, compute_entities_stats
 
 # Todo @matteo
 @pytest.mark.skip(reason='No test, todo ')
 def test_describe_dataset(ajmc_en_sample_path, ajmc_de_sample_path):
     print(describe_dataset(file_path=ajmc_en_sample_path))
-    print(describe_dataset(file_path=ajmc_de_sample_path))
\ No newline at end of file
+    print(describe_dataset(file_path=ajmc_de_sample_path))
+
+def test_entities_stats(sample_tsv_path_v1, monkeypatch):
+    docs = parse_tsv(file_path=sample_tsv_path_v1)
+    expected = {}
+    for e_type in NE_ANNOTATION_TYPES:
+        for doc in parse_tsv(file_path=sample_tsv_path_v1):
+            if e_type in doc.entities:
+                expected[e_type] = expected.get(e_type, 0) + len(doc.entities[e_type])
+
+    # each document is decoded once, all its entity types at once
+    calls = []
+    lines2entities = tsv.lines2entities
+    monkeypatch.setattr(tsv, "lines2entities", lambda *args: calls.append(args) or lines2entities(*args))
+    assert count_entities(docs) == expected
+    assert len(calls) == len(docs)
+
+    stats = compute_entities_stats(docs)
+    assert list(stats) == list(expected) and len(calls) == len(docs)
+    assert {e_type: int(df["count"].sum()) for e_type, df in stats.items()} == expected